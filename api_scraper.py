@@ -1,15 +1,62 @@
+import sys
 import requests
 import pandas as pd
-import time
-
-
-def get_all_universities():
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+import columnar
+import delta
+from http_cache import HttpCache
+from metrics import METRICS
+from rate_limit import AdaptiveRateLimiter, retry_after_seconds
+from retry_policy import CircuitBreaker, DeadLetterQueue, HTTPStatusError, RetryPolicy
+from sinks import open_sink, read_sink
+
+# ---------- CONFIG ----------
+MAX_IN_FLIGHT = 8          # detail requests allowed in flight at the same time
+REQUESTS_PER_SECOND = 10   # starting rate shared by all workers; adapts to the server's responses
+MAX_REQUESTS_PER_SECOND = 40  # the adaptive rate never goes above this (politeness)
+CACHE_DIR = ".http_cache"  # on-disk response cache (delete it to force full downloads)
+LISTING_TTL = 6 * 3600     # seconds the ranking payload is served without revalidation
+DETAIL_TTL = 7 * 24 * 3600 # seconds institution stats are served without revalidation
+DELTA_MODE = True          # only refetch institutions that are new, moved, renamed or stale
+DELTA_SNAPSHOT = "university_api_snapshot.json"
+STATS_MAX_AGE_DAYS = 30    # refetch stats older than this even if the listing row is unchanged
+RESULTS_FILE = "university_api_data.csv"  # records are streamed here as they arrive (.csv or .jsonl)
+SINK_BATCH = 50            # records per write
+SINK_FSYNC = "batch"       # "never", "batch" or "close"
+METRICS_SNAPSHOT = "api_scraper_metrics.prom"  # stage timings and counters, rewritten during the run (.json for JSON)
+METRICS_EVENTS = "api_scraper_events.jsonl"    # one line per timed stage and URL
+MAX_ATTEMPTS = 3           # tries per institution for retryable errors (5xx, 429, timeouts, connection errors)
+DEAD_LETTERS = "api_scraper_dead_letters.sqlite3"  # institutions that failed every try; `--redrive` refetches them
+LISTING_ATTEMPTS = 6       # tries for the ranking listing itself; nothing can be fetched without it
+# ----------------------------
+
+# main rankings table API (up to 2500 ranked institutions) and per-institution stats API
+LISTING_URL = "https://www.topuniversities.com/api/qs-rankings/en/2025/916481?qs_ranking_instance_id=916481&items_per_page=2500&page=0"
+DETAIL_URL = "https://www.topuniversities.com/api/institution/en/{}"
+
+# jittered exponential backoff per error class; the breaker pauses every worker while the API is failing broadly
+RETRY_POLICY = RetryPolicy(max_attempts=MAX_ATTEMPTS, breaker=CircuitBreaker(name="api"), name="api")
+LISTING_RETRY = RetryPolicy(max_attempts=LISTING_ATTEMPTS, base_delay=2.0, name="listing")
+
+# output column order
+COLUMNS = [
+    'University Name', 'Total Students (Total)', 'Total Students (UG students)', 'Total Students (PG students)',
+    'International Students (Total)', 'International Students (UG students)',
+    'International Students (PG students)',
+    'Total Faculty Staff (Total)', 'Total Faculty Staff (Domestic staff)', 'Total Faculty Staff (Int\'l staff)'
+]
+
+
+def get_all_universities(cache=None, retry=LISTING_RETRY):
     """
     Hits the main QS Rankings API to get the core data for all ranked universities.
+    Failed attempts are retried per `retry` (a RetryPolicy); returns [] if all fail.
     """
     # This URL is the source of data for the main rankings table.
     # It fetches up to 2500 ranked institutions.
-    api_url = "https://www.topuniversities.com/api/qs-rankings/en/2025/916481?qs_ranking_instance_id=916481&items_per_page=2500&page=0"
+    api_url = LISTING_URL
 
     print("➡️ Accessing the main university database API...")
 
@@ -17,36 +64,125 @@ def get_all_universities():
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
     }
 
-    response = requests.get(api_url, headers=headers)
+    def fetch_once():
+        with METRICS.stage("listing", url=api_url):
+            if cache:
+                response = cache.get(requests, api_url, headers=headers, timeout=60, ttl=LISTING_TTL)
+            else:
+                response = requests.get(api_url, headers=headers, timeout=60)
+        METRICS.count("requests", source="api", status=response.status_code)
+        if response.status_code != 200:
+            raise HTTPStatusError(response.status_code, api_url, retry_after_seconds(response.headers))
+        return response.json()
 
-    if response.status_code != 200:
-        print(f"❌ Failed to fetch the main university list. Status code: {response.status_code}")
+    try:
+        data = retry.call(fetch_once, label=api_url) if retry else fetch_once()
+    except (requests.RequestException, HTTPStatusError, ValueError) as e:
+        print(f"❌ Failed to fetch the main university list: {e}")
         return []
 
-    data = response.json()
     universities = data.get('data', [])
 
     print(f"✅ Found {len(universities)} universities in the database.")
     return universities
 
 
-def get_detailed_stats(university_id):
+def build_session(pool_size=MAX_IN_FLIGHT):
+    """
+    Creates a requests Session whose connection pool is large enough for every
+    worker to keep its own keep-alive connection to the API host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
+    })
+    return session
+
+
+def get_detailed_stats(university_id, session=None, cache=None, limiter=None, retry=None, dead_letters=None):
     """
     Hits the specific API for one university to get its detailed student/staff stats.
+    Each network attempt takes a token from `limiter` and reports the response to it.
+    Failed attempts are retried per `retry` (a RetryPolicy); what still fails is
+    recorded in `dead_letters` and None is returned.
     """
-    api_url = f"https://www.topuniversities.com/api/institution/en/{university_id}"
+    api_url = DETAIL_URL.format(university_id)
 
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
     }
 
+    def fetch_once():
+        if limiter and not (cache and cache.is_fresh(api_url, DETAIL_TTL)):
+            limiter.acquire()
+        try:
+            with METRICS.stage("detail", url=api_url):
+                if cache:
+                    response = cache.get(session or requests, api_url, headers=headers, timeout=10, ttl=DETAIL_TTL)
+                else:
+                    response = (session or requests).get(api_url, headers=headers, timeout=10)
+        except requests.RequestException:
+            if limiter:
+                limiter.observe(error=True)
+            raise
+        METRICS.count("requests", source="api", status=response.status_code)
+        # fresh hits never reached the server; 304 revalidations did and are observed
+        if limiter and not getattr(response, "from_cache", False):
+            limiter.observe_response(response)
+        if response.status_code != 200:
+            raise HTTPStatusError(response.status_code, api_url, retry_after_seconds(response.headers))
+        return response.json()
+
     try:
-        response = requests.get(api_url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-    except requests.RequestException:
+        return retry.call(fetch_once, label=api_url) if retry else fetch_once()
+    except (requests.RequestException, HTTPStatusError, ValueError) as e:
+        if dead_letters is not None:
+            dead_letters.add(university_id, e, url=api_url)
         return None
-    return None
+
+
+def iter_detailed_stats(university_ids, max_in_flight=MAX_IN_FLIGHT, rate=REQUESTS_PER_SECOND, cache=None,
+                        max_rate=MAX_REQUESTS_PER_SECOND, retry=RETRY_POLICY, dead_letters=None):
+    """
+    Fetches the detailed stats for many universities concurrently and yields
+    them one by one as they complete.
+
+    A thread pool of `max_in_flight` workers shares one pooled Session, and an
+    adaptive token bucket caps the overall request rate: it starts at `rate`,
+    speeds up towards `max_rate` while the API answers quickly and backs off
+    on 429/403/5xx, errors and slow answers, honoring Retry-After. Failed
+    requests are retried per `retry`. Results are yielded in the same order
+    as `university_ids`, with None where a request still failed (also
+    recorded in `dead_letters`). Cache hits served from `cache` do not spend
+    a rate-limit token.
+    """
+    session = build_session(max_in_flight)
+    bucket = AdaptiveRateLimiter(rate, max_rate=max_rate, name="api")
+    total = len(university_ids)
+
+    def fetch(university_id):
+        return get_detailed_stats(university_id, session=session, cache=cache, limiter=bucket, retry=retry,
+                                  dead_letters=dead_letters)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            # map() yields in submission order, so the output lines up with the input
+            for i, details in enumerate(pool.map(fetch, university_ids)):
+                yield details
+                if (i + 1) % 50 == 0 or i + 1 == total:
+                    print(f"⚙️ Fetched details ({i + 1}/{total}) at {bucket.rate:.1f} req/s")
+    finally:
+        session.close()
+        print(f"🚦 Rate: {bucket.summary()}")
+
+
+def fetch_all_detailed_stats(university_ids, max_in_flight=MAX_IN_FLIGHT, rate=REQUESTS_PER_SECOND, cache=None,
+                             max_rate=MAX_REQUESTS_PER_SECOND, retry=RETRY_POLICY, dead_letters=None):
+    """Same as iter_detailed_stats(), collected into a list."""
+    return list(iter_detailed_stats(university_ids, max_in_flight, rate, cache, max_rate, retry, dead_letters))
 
 
 def parse_stats(details):
@@ -77,55 +213,87 @@ def parse_stats(details):
     return parsed_data
 
 
-def main():
+def main(redrive=False):
     """
-    Main function to run the scraper.
+    Main function to run the scraper. With `redrive`, only the institutions
+    left in the dead-letter queue by earlier runs are fetched again; every
+    other row comes from the delta snapshot untouched.
     """
-    universities = get_all_universities()
+    METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
+    cache = HttpCache(CACHE_DIR)
+    universities = get_all_universities(cache=cache)
 
     if not universities:
         print("Could not retrieve university list. Exiting.")
+        METRICS.close()
         return
 
-    all_data = []
-    total_universities = len(universities)
-
-    for i, uni in enumerate(universities):
-        university_id = uni.get('nid')
-        university_name = uni.get('title')
-
-        print(f"⚙️ Processing ({i + 1}/{total_universities}): {university_name}")
-
-        details = get_detailed_stats(university_id)
-
-        final_record = {'University Name': university_name}
-
-        if details:
-            parsed_stats = parse_stats(details)
-            final_record.update(parsed_stats)
-
-        all_data.append(final_record)
-        time.sleep(0.1)  # Be respectful with a small delay between requests
+    listing = [delta.listing_item(uni.get('nid'), uni.get('title'), uni.get('rank_display'), uni.get('path'))
+               for uni in universities]
+    snapshot = delta.load_snapshot(DELTA_SNAPSHOT) if DELTA_MODE else {}
+    dead_letters = DeadLetterQueue(DEAD_LETTERS)
+    if redrive:
+        if not DELTA_MODE:
+            print("❌ Re-driving dead letters needs DELTA_MODE (the other rows come from the snapshot). Exiting.")
+            dead_letters.close()
+            METRICS.close()
+            return
+        keys = {entry['key'] for entry in dead_letters.entries()}
+        to_fetch = [item for item in listing if item['key'] in keys]
+        print(f"🔁 Re-driving {len(to_fetch)} dead letters ({len(keys) - len(to_fetch)} no longer listed)")
+    else:
+        to_fetch, reasons = delta.plan_delta(listing, snapshot, STATS_MAX_AGE_DAYS)
+        if DELTA_MODE:
+            print(f"🔁 Delta mode: {delta.describe(reasons)}")
+
+    print(f"⚙️ Fetching details for {len(to_fetch)} universities "
+          f"({MAX_IN_FLIGHT} in flight, from {REQUESTS_PER_SECOND} req/s up to {MAX_REQUESTS_PER_SECOND})...")
+
+    failed = 0
+    with open_sink(RESULTS_FILE, COLUMNS, batch_size=SINK_BATCH, fsync=SINK_FSYNC) as sink:
+        results = iter_detailed_stats([item['key'] for item in to_fetch], cache=cache, dead_letters=dead_letters)
+        for item, details in zip(to_fetch, results):
+            final_record = {'University Name': item['title']}
+            if details:
+                with METRICS.stage("parse", url=DETAIL_URL.format(item['key'])):
+                    final_record.update(parse_stats(details))
+                delta.update_snapshot(snapshot, item, final_record)
+                dead_letters.resolve(item['key'])
+                METRICS.count("pages", source="api")
+            else:
+                # failed requests are left out of the snapshot (and kept as dead letters) so they get retried
+                failed += 1
+                METRICS.count("failures", source="api")
+            sink.write(final_record)
+    print(f"🗄️ Cache: {cache.summary()}")
+    print(f"📝 Streamed {sink.written} records to '{RESULTS_FILE}' ({failed} failed)")
+    if len(dead_letters):
+        print(f"☠️ Dead letters: {dead_letters.counts()} in '{DEAD_LETTERS}' (run with --redrive to retry them)")
+    dead_letters.close()
 
     print("\n" + "=" * 50)
     print("💾 Scraping complete. Saving data to Excel file...")
 
-    df = pd.DataFrame(all_data)
-
-    # Define the desired column order
-    cols_order = [
-        'University Name', 'Total Students (Total)', 'Total Students (UG students)', 'Total Students (PG students)',
-        'International Students (Total)', 'International Students (UG students)',
-        'International Students (PG students)',
-        'Total Faculty Staff (Total)', 'Total Faculty Staff (Domestic staff)', 'Total Faculty Staff (Int\'l staff)'
-    ]
-    df = df.reindex(columns=cols_order)
+    if DELTA_MODE:
+        delta.save_snapshot(DELTA_SNAPSHOT, snapshot)
+        # the sink only holds this run's records; unchanged rows come from the snapshot
+        df = pd.DataFrame(delta.merge_records(listing, snapshot,
+                                              fallback=lambda item: {'University Name': item['title']}))
+    else:
+        df = read_sink(RESULTS_FILE)
+    # the sink reads back as text and API values may be strings: write numbers as numbers either way
+    df = columnar.typed(df.reindex(columns=COLUMNS))
 
     filename = 'university_api_data.xlsx'
-    df.to_excel(filename, index=False)
+    with METRICS.stage("save", url=filename):
+        df.to_excel(filename, index=False)
+        typed = columnar.write_parquet(df, columnar.parquet_path(filename))
 
-    print(f"🎉 SUCCESS! Data for {len(all_data)} universities saved to '{filename}'")
+    print(f"🎉 SUCCESS! Data for {len(df)} universities saved to '{filename}' (typed copy: '{typed}')")
+    print(f"⏱️ Time by stage:\n{METRICS.summary()}")
+    METRICS.close()
+    print(f"📈 Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(redrive="--redrive" in sys.argv[1:])
\ No newline at end of file
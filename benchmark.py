@@ -0,0 +1,520 @@
+"""
+Offline throughput benchmark for the scrapers, against fixture_server.py.
+
+Each scenario runs one scraper against a local stand-in for the QS site, in
+its own process and scratch directory (so peak RSS is per scenario and no
+output files are left behind), and reports:
+
+    pages/sec          profiles with stats extracted per second of wall time
+    p50/p95/p99        latency per stage (listing, detail/fetch, parse, ...)
+    peak RSS           of the scraper process, and of its browsers if any
+    requests           as counted by the fixture server, with injected errors
+
+Scenarios:
+
+    api_scraper        full main(): ranking API + institution API
+    qs_scraper         full main() with Chrome; otherwise its static path
+                       (StaticFetcher + `.uni-stats-card` parser)
+    final_scraper      full scrape() with Chrome; otherwise its static path
+                       (StaticFetcher + `div.stats-wrapper` parser)
+    qs_scraper_2025    full scrape_qs() with Playwright's Chromium; otherwise
+                       its embedded-state path over Playwright's HTTP client
+    cascade            full cascade.main(): API, then static HTML, then Chrome
+                       (without Chrome, API and static only)
+
+Results can be saved and later compared, which makes the run a regression
+suite: a drop in pages/sec or a rise in a stage's p95 beyond the tolerance
+fails it (exit status 1).
+
+    python benchmark.py                                   # all scenarios
+    python benchmark.py api_scraper --latency 0.05 --error-rate 0.02
+    python benchmark.py --save bench_baseline.json
+    python benchmark.py --compare bench_baseline.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import math
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urljoin
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("api_scraper", "qs_scraper", "final_scraper", "qs_scraper_2025", "cascade")
+RESULT_PREFIX = "BENCHMARK_RESULT "
+CHROME_BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+NOISE_FLOOR_MS = 1.0  # p95 changes smaller than this are never reported as regressions
+
+
+class StageTimer:
+    """
+    Times calls per stage by wrapping functions and methods in place for the
+    duration of a run (sync and async functions alike); restore() undoes
+    every wrap and patch.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+        self._patched = []
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def patch(self, owner, attr, value):
+        self._patched.append((owner, attr, getattr(owner, attr)))
+        setattr(owner, attr, value)
+
+    def wrap(self, owner, attr, stage):
+        original = getattr(owner, attr)
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - started)
+        else:
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - started)
+        self.patch(owner, attr, timed)
+
+    def restore(self):
+        while self._patched:
+            owner, attr, original = self._patched.pop()
+            setattr(owner, attr, original)
+
+
+def percentiles(samples):
+    """{'n', 'p50', 'p95', 'p99', 'max'} of a list of seconds, in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))] * 1000
+
+    return {"n": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+
+def chrome_available():
+    return any(shutil.which(name) for name in CHROME_BINARIES)
+
+
+def listing_urls(base_url, paged=False, total=None, per_page=150, attempts=3):
+    """
+    Profile URLs in listing order, read over plain HTTP with the row markup
+    the scrapers select: page by page (`paged`, as qs_scraper_2025 does), or
+    the first page plus the rows fragments its "Load more" / scroll script
+    fetches.
+    """
+    import requests
+    from lxml import html
+
+    def get(url):
+        for _ in range(attempts):
+            response = requests.get(url, timeout=30)
+            if response.status_code == 200:
+                return response.text
+        response.raise_for_status()
+
+    def hrefs(page_html):
+        if not page_html.strip():
+            return []
+        doc = html.fromstring(page_html)
+        return [urljoin(base_url, h) for h in doc.xpath("//div[contains(@class, 'rankings-table__row')]//a/@href")]
+
+    listing = f"{base_url}/world-university-rankings"
+    if paged:
+        pages = math.ceil(total / per_page)
+        return [u for page in range(pages) for u in hrefs(get(f"{listing}?items_per_page={per_page}&page={page}"))]
+    urls = hrefs(get(listing))
+    page = 1
+    while True:
+        more = hrefs(get(f"{listing}/rows?items_per_page={per_page}&page={page}"))
+        if not more:
+            return urls
+        urls.extend(more)
+        page += 1
+
+
+# --- scenarios: run in the child process, inside a scratch directory ---
+
+def run_api_scraper(base_url, timer, opts):
+    import api_scraper
+    import sinks
+    from sinks import read_sink
+
+    timer.patch(api_scraper, "LISTING_URL", f"{base_url}/api/qs-rankings/en/2025/916481"
+                                            "?qs_ranking_instance_id=916481&items_per_page=2500&page=0")
+    timer.patch(api_scraper, "DETAIL_URL", base_url + "/api/institution/en/{}")
+    timer.patch(api_scraper, "iter_detailed_stats", functools.partial(
+        api_scraper.iter_detailed_stats, max_in_flight=opts.workers, rate=opts.rate,
+        max_rate=opts.max_rate or opts.rate))
+    timer.wrap(api_scraper, "get_all_universities", "listing")
+    timer.wrap(api_scraper, "get_detailed_stats", "detail")
+    timer.wrap(api_scraper, "parse_stats", "parse")
+    timer.wrap(sinks.ResultSink, "_flush_locked", "sink write")
+    api_scraper.main()
+    df = read_sink(api_scraper.RESULTS_FILE)
+    return {"mode": "full", "pages": int(df["Total Students (Total)"].notna().sum())}
+
+
+def _run_static(base_url, timer, opts, parse):
+    """The browserless path shared by qs_scraper and final_scraper: StaticFetcher + an lxml parser."""
+    import static_extract
+    from rate_limit import TokenBucket
+
+    timer.wrap(static_extract.StaticFetcher, "fetch", "fetch")
+    started = time.perf_counter()
+    urls = listing_urls(base_url)
+    timer.record("listing", time.perf_counter() - started)
+    fetcher = static_extract.StaticFetcher(max_workers=opts.workers, rate_limiter=TokenBucket(opts.rate))
+    timed_parse = functools.partial(_timed, timer, "parse", parse)
+    try:
+        results = fetcher.extract_many(urls, timed_parse)
+    finally:
+        fetcher.close()
+    return {"mode": "static", "pages": sum(1 for data in results if static_extract.has_stats(data))}
+
+
+def _timed(timer, stage, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        timer.record(stage, time.perf_counter() - started)
+
+
+def run_qs_scraper(base_url, timer, opts):
+    if not chrome_available():
+        from static_extract import parse_stats_cards_html
+        return _run_static(base_url, timer, opts, lambda page_html, url: parse_stats_cards_html(page_html))
+
+    import qs_scraper
+    import static_extract
+    from sinks import read_sink
+
+    timer.patch(qs_scraper, "BASE_URL", f"{base_url}/world-university-rankings")
+    timer.patch(qs_scraper, "HEADLESS", True)
+    timer.patch(qs_scraper, "NUM_WORKERS", opts.workers)
+    timer.patch(qs_scraper, "MAX_PAGES_PER_SECOND", opts.rate)
+    timer.patch(qs_scraper, "STATIC_REQUESTS_PER_SECOND", opts.rate)
+    timer.wrap(qs_scraper, "load_all_rows", "listing")
+    timer.wrap(static_extract.StaticFetcher, "fetch", "fetch")
+    timer.wrap(qs_scraper, "parse_stats_cards_html", "parse")
+    timer.wrap(qs_scraper, "scrape_profile", "browser profile")
+    qs_scraper.main()
+    df = read_sink(qs_scraper.PROGRESS_CSV)
+    return {"mode": "full", "pages": int(df["Total Students"].fillna("").astype(bool).sum())}
+
+
+def run_final_scraper(base_url, timer, opts):
+    if not chrome_available():
+        from static_extract import parse_stats_wrapper_html
+        return _run_static(base_url, timer, opts, parse_stats_wrapper_html)
+
+    import final_scraper
+    import static_extract
+    from sinks import read_sink
+
+    scraper = final_scraper.UniversityScraper(num_workers=opts.workers, pages_per_second=opts.rate,
+                                              static_requests_per_second=opts.rate)
+    scraper.BASE_URL = f"{base_url}/world-university-rankings"
+    timer.wrap(final_scraper.UniversityScraper, "_get_university_links", "listing")
+    timer.wrap(static_extract.StaticFetcher, "fetch", "fetch")
+    timer.wrap(final_scraper, "parse_stats_wrapper_html", "parse")
+    timer.wrap(final_scraper.UniversityScraper, "_extract_page_details", "browser profile")
+    scraper.scrape()
+    df = read_sink(final_scraper.RESULTS_FILE)
+    return {"mode": "full", "pages": int(df["Total Students (Total)"].fillna("").astype(bool).sum())}
+
+
+async def _chromium_launches():
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as pw:
+        try:
+            browser = await pw.chromium.launch()
+        except Exception:
+            return False
+        await browser.close()
+        return True
+
+
+async def _embedded_state_only(base_url, timer, opts, qs_scraper_2025):
+    """scrape_profile_from_state() over Playwright's HTTP client, `workers` at a time."""
+    from types import SimpleNamespace
+    from playwright.async_api import async_playwright
+    from rate_limit import TokenBucket
+
+    started = time.perf_counter()
+    urls = listing_urls(base_url, paged=True, total=opts.total)
+    timer.record("listing", time.perf_counter() - started)
+    semaphore = asyncio.Semaphore(opts.workers)
+    bucket = TokenBucket(opts.rate)
+    async with async_playwright() as pw:
+        request = await pw.request.new_context()
+        context = SimpleNamespace(request=request)
+
+        async def one(url):
+            async with semaphore:
+                await bucket.acquire_async()
+                return await qs_scraper_2025.scrape_profile_from_state(context, url)
+
+        try:
+            records = await asyncio.gather(*(one(url) for url in urls))
+        finally:
+            await request.dispose()
+    return sum(1 for record in records if record)
+
+
+def run_qs_scraper_2025(base_url, timer, opts):
+    import qs_scraper_2025
+    from sinks import read_sink
+
+    timer.patch(qs_scraper_2025, "BASE_URL", f"{base_url}/world-university-rankings")
+    timer.patch(qs_scraper_2025, "DETAIL_URL", base_url + "/api/institution/en/{}")
+    timer.wrap(qs_scraper_2025, "scrape_profile_from_state", "embedded state")
+    if not asyncio.run(_chromium_launches()):
+        pages = asyncio.run(_embedded_state_only(base_url, timer, opts, qs_scraper_2025))
+        return {"mode": "embedded state", "pages": pages}
+
+    timer.wrap(qs_scraper_2025, "collect_listing_page", "listing")
+    timer.wrap(qs_scraper_2025, "scrape_profile", "browser profile")
+    asyncio.run(qs_scraper_2025.scrape_qs(total=opts.total, per_page=150, concurrency=opts.workers,
+                                          requests_per_second=opts.rate))
+    df = read_sink("qs_table_results.csv")
+    return {"mode": "full", "pages": int(df["Total Students"].fillna("").astype(bool).sum())}
+
+
+def run_cascade(base_url, timer, opts):
+    import api_scraper
+    import cascade
+    from sinks import read_sink
+
+    timer.patch(api_scraper, "LISTING_URL", f"{base_url}/api/qs-rankings/en/2025/916481"
+                                            "?qs_ranking_instance_id=916481&items_per_page=2500&page=0")
+    timer.patch(api_scraper, "DETAIL_URL", base_url + "/api/institution/en/{}")
+    with_browser = chrome_available()
+    timer.patch(cascade, "BACKENDS", ("api", "static", "browser") if with_browser else ("api", "static"))
+    timer.patch(cascade, "MAX_IN_FLIGHT", opts.workers)
+    timer.patch(cascade, "NUM_BROWSERS", opts.workers)
+    for name in ("API_REQUESTS_PER_SECOND", "STATIC_REQUESTS_PER_SECOND", "PAGES_PER_SECOND"):
+        timer.patch(cascade, name, opts.rate)
+    timer.wrap(api_scraper, "get_all_universities", "listing")
+    timer.wrap(cascade.ApiBackend, "fetch", "api")
+    timer.wrap(cascade.StaticBackend, "fetch", "static")
+    timer.wrap(cascade.BrowserBackend, "fetch", "browser profile")
+    cascade.main()
+    df = read_sink(cascade.RESULTS_FILE)
+    return {"mode": "full" if with_browser else "api + static",
+            "pages": int(df["Total Students (Total)"].notna().sum())}
+
+
+RUNNERS = {
+    "api_scraper": run_api_scraper,
+    "qs_scraper": run_qs_scraper,
+    "final_scraper": run_final_scraper,
+    "qs_scraper_2025": run_qs_scraper_2025,
+    "cascade": run_cascade,
+}
+
+
+def child_main(opts):
+    """Runs one scenario and prints its result as one JSON line."""
+    sys.path.insert(0, REPO_DIR)
+    timer = StageTimer()
+    started = time.perf_counter()
+    try:
+        result = RUNNERS[opts.child](opts.base_url, timer, opts)
+    finally:
+        timer.restore()
+    wall = time.perf_counter() - started
+    result.update(
+        wall=wall,
+        samples={stage: values for stage, values in timer.samples.items()},
+        # ru_maxrss is in KiB on Linux
+        rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        browsers_rss_mb=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    )
+    print(RESULT_PREFIX + json.dumps(result))
+
+
+# --- parent: fixture server, child processes, report, regression check ---
+
+def run_once(name, fixture, opts):
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    cmd = [sys.executable, os.path.join(REPO_DIR, "benchmark.py"), "--child", name,
+           "--base-url", fixture.base_url, "--workers", str(opts.workers), "--rate", str(opts.rate),
+           "--max-rate", str(opts.max_rate or opts.rate),
+           "--total", str(len(fixture.institutions))]
+    before = fixture.snapshot()
+    try:
+        proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, timeout=opts.timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {opts.timeout}s"}
+    finally:
+        if not opts.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if opts.verbose:
+        print(proc.stdout, proc.stderr, sep="\n")
+    requests_made = fixture.snapshot() - before
+    line = next((l for l in proc.stdout.splitlines() if l.startswith(RESULT_PREFIX)), None)
+    if line is None:
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]
+        return {"error": tail[0]}
+    result = json.loads(line[len(RESULT_PREFIX):])
+    result["requests"] = sum(v for k, v in requests_made.items() if " " not in k and k != "bytes")
+    result["errors_injected"] = sum(v for k, v in requests_made.items()
+                                    if " " in k and k.split()[-1] in (str(opts.error_status),))
+    result["throttled"] = sum(v for k, v in requests_made.items() if k.endswith(" 429"))
+    return result
+
+
+def aggregate(runs):
+    """Median throughput over repeated runs; stage percentiles over all their samples."""
+    ok = [r for r in runs if "error" not in r]
+    if not ok:
+        return runs[-1]
+    samples = defaultdict(list)
+    for r in ok:
+        for stage, values in r["samples"].items():
+            samples[stage].extend(values)
+    return {
+        "mode": ok[0]["mode"],
+        "runs": len(ok),
+        "pages": int(statistics.median(r["pages"] for r in ok)),
+        "wall": statistics.median(r["wall"] for r in ok),
+        "pages_per_sec": statistics.median(r["pages"] / r["wall"] for r in ok),
+        "stages": {stage: percentiles(values) for stage, values in samples.items()},
+        "rss_mb": max(r["rss_mb"] for r in ok),
+        "browsers_rss_mb": max(r["browsers_rss_mb"] for r in ok),
+        "requests": int(statistics.median(r["requests"] for r in ok)),
+        "errors_injected": int(statistics.median(r["errors_injected"] for r in ok)),
+        "throttled": int(statistics.median(r["throttled"] for r in ok)),
+    }
+
+
+def print_result(name, result):
+    if "error" in result:
+        print(f"❌ {name}: {result['error']}")
+        return
+    print(f"🏁 {name} ({result['mode']}): {result['pages']} pages in {result['wall']:.2f} s = "
+          f"{result['pages_per_sec']:.1f} pages/s, peak RSS {result['rss_mb']:.0f} MB"
+          f" (+{result['browsers_rss_mb']:.0f} MB browsers), {result['requests']} requests"
+          f" ({result['errors_injected']} errors injected"
+          + (f", {result['throttled']} throttled" if result.get("throttled") else "") + ")")
+    print(f"   {'stage':<16} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9}  (ms)")
+    for stage, p in sorted(result["stages"].items()):
+        print(f"   {stage:<16} {p['n']:>6} {p['p50']:>9.2f} {p['p95']:>9.2f} {p['p99']:>9.2f}")
+
+
+def compare(results, baseline, tolerance):
+    """Returns the list of regressions against a saved baseline."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "error" in base or "error" in result or base["mode"] != result["mode"]:
+            continue
+        if result["pages_per_sec"] < base["pages_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {base['pages_per_sec']:.1f} -> {result['pages_per_sec']:.1f} pages/s")
+        for stage, p in result["stages"].items():
+            before = base["stages"].get(stage)
+            if before and p["p95"] > before["p95"] * (1 + tolerance) and p["p95"] - before["p95"] > NOISE_FLOOR_MS:
+                regressions.append(f"{name}/{stage}: p95 {before['p95']:.2f} -> {p['p95']:.2f} ms")
+    return regressions
+
+
+def main(opts):
+    from fixture_server import FixtureServer, RECORDED_FILE, load_institutions
+
+    institutions = load_institutions(opts.institutions, path=os.path.join(REPO_DIR, RECORDED_FILE), seed=opts.seed)
+    fixture = FixtureServer(institutions, latency=opts.latency, jitter=opts.jitter, error_rate=opts.error_rate,
+                            error_status=opts.error_status, client_side=opts.client_side,
+                            embed_stats=opts.embed_stats, seed=opts.seed, max_rate=opts.server_max_rate)
+    config = {key: getattr(opts, key) for key in ("latency", "jitter", "error_rate", "error_status", "client_side",
+                                                  "embed_stats", "workers", "rate", "max_rate", "server_max_rate",
+                                                  "seed", "repeat")}
+    config["institutions"] = len(institutions)
+    print(f"🧪 Fixture at {fixture.base_url}: {len(institutions)} institutions, "
+          f"latency {opts.latency * 1000:.0f}±{opts.jitter * 1000:.0f} ms, error rate {opts.error_rate:.1%}")
+
+    results = {}
+    with fixture:
+        for name in opts.scenarios or SCENARIOS:
+            results[name] = aggregate([run_once(name, fixture, opts) for _ in range(opts.repeat)])
+            print_result(name, results[name])
+
+    if opts.save:
+        with open(opts.save, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"💾 Saved results to '{opts.save}'")
+    if opts.compare:
+        with open(opts.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("⚠️ Baseline was recorded with a different configuration; comparing anyway.")
+        regressions = compare(results, baseline, opts.tolerance)
+        for line in regressions:
+            print(f"📉 Regression: {line}")
+        if regressions:
+            return 1
+        print(f"✅ No regressions beyond {opts.tolerance:.0%} against '{opts.compare}'")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a local QS stand-in.")
+    parser.add_argument("scenarios", nargs="*",
+                        help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--institutions", type=int, default=None, help="default: the recorded ones")
+    parser.add_argument("--latency", type=float, default=0.02, help="fixture seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.01, help="fixture extra seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fixture responses that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--client-side", type=float, default=0.0, help="share of profiles rendered client-side")
+    parser.add_argument("--embed-stats", type=float, default=0.0, help="share of profiles embedding their stats")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests / browsers per scraper")
+    parser.add_argument("--rate", type=float, default=200.0, help="scraper rate limit, requests per second")
+    parser.add_argument("--max-rate", type=float, default=None,
+                        help="ceiling for the api_scraper's adaptive rate (default: --rate, i.e. fixed)")
+    parser.add_argument("--server-max-rate", type=float, default=None,
+                        help="fixture answers 429 + Retry-After above this many requests/s")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario (median throughput)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=int, default=900, help="seconds allowed per run")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--keep", action="store_true", help="keep each run's scratch directory")
+    parser.add_argument("--verbose", action="store_true", help="show the scrapers' output")
+    # internal: run one scenario in this process (used by the parent)
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--total", type=int, help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.child:
+        child_main(opts)
+    else:
+        unknown = [s for s in opts.scenarios if s not in SCENARIOS]
+        if unknown:
+            parser.error(f"unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+        sys.exit(main(opts))
@@ -0,0 +1,385 @@
+"""
+One pipeline over the ways of getting an institution's figures, cheapest first.
+
+Every institution of the ranking API listing goes down a chain of backends:
+
+    api       the institution JSON API (api_scraper.get_detailed_stats)
+    static    the profile page over plain HTTP, parsed with lxml (static_extract)
+    browser   the profile page rendered by headless Chrome from a DriverPool,
+              parsed with the same lxml parsers; browsers are only started
+              once some institution actually gets this far
+
+and moves on to the next backend only while REQUIRED_FIELDS are still blank.
+Values found by an earlier backend are kept, later ones only fill the gaps,
+and the 'Backend' column says which backends supplied the row ("api",
+"api+static", ...). An API payload or a profile page with stats in it is
+the final word: if a field is blank there, the institution does not publish
+it, and fetching the page again, or rendering it in a browser, would not
+change that. A page whose stats block only holds empty placeholders is
+still rendered.
+
+The chain order adapts during the run. Each backend keeps its success rate
+(the share of its attempts that resolved the row: completed it, or gave
+that final word) and a moving average of its latency, and every institution tries the backends in order of
+expected cost to resolve a row, latency / success rate. A backend that
+starts failing (the API gets blocked, profiles go client-side) falls behind
+the others; every `explore_every`-th institution still follows the
+configured order, so a backend that recovers moves up again.
+
+    python cascade.py
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+import api_scraper
+import columnar
+import delta
+from driver_pool import DriverPool
+from http_cache import HttpCache
+from metrics import METRICS
+from rate_limit import AdaptiveRateLimiter
+from resource_policy import ResourcePolicy
+from retry_policy import classify
+from sinks import open_sink, read_sink
+from static_extract import StaticFetcher, has_stats, parse_stats_cards_html, parse_stats_wrapper_html
+
+# ---------- CONFIG ----------
+BACKENDS = ("api", "static", "browser")  # configured order, cheapest first
+REQUIRED_FIELDS = ('Total Students (Total)', 'International Students (Total)', 'Total Faculty Staff (Total)')
+MAX_IN_FLIGHT = 8          # institutions resolved at the same time
+API_REQUESTS_PER_SECOND = 10       # starting rates; both adapt to the server (see rate_limit.py)
+STATIC_REQUESTS_PER_SECOND = 5
+NUM_BROWSERS = 2           # headless browsers for the profiles nothing cheaper could complete
+PAGES_PER_SECOND = 1.0
+EXPLORE_EVERY = 20         # every Nth institution uses the configured order, to re-measure demoted backends
+RESULTS_FILE = "cascade_data.csv"  # rows are streamed here as they are resolved (.csv or .jsonl)
+RESULTS_XLSX = "cascade_data.xlsx"
+METRICS_SNAPSHOT = "cascade_metrics.prom"  # stage timings and counters, rewritten during the run (.json for JSON)
+METRICS_EVENTS = "cascade_events.jsonl"    # one line per timed stage and URL
+# ----------------------------
+
+COLUMNS = api_scraper.COLUMNS + ['URL', 'Backend']
+
+# `.uni-stats-card` titles -> output columns (the cards' staff split is a percentage, not a head count)
+CARD_COLUMNS = {
+    "Total students": 'Total Students (Total)',
+    "UG students": 'Total Students (UG students)',
+    "PG students": 'Total Students (PG students)',
+    "International students": 'International Students (Total)',
+    "Total faculty staff": 'Total Faculty Staff (Total)',
+}
+
+LATENCY_ALPHA = 0.2  # weight of the newest sample in a backend's moving-average latency
+
+
+def parse_profile_html(page_html, url):
+    """
+    Reads a profile page in either layout (`div.stats-wrapper`, then
+    `.uni-stats-card` for whatever is still missing); None if it has neither.
+    """
+    data = parse_stats_wrapper_html(page_html, url) or {}
+    cards = parse_stats_cards_html(page_html)
+    for field, column in CARD_COLUMNS.items():
+        if cards and cards.get(field) and not data.get(column):
+            data[column] = cards[field]
+    return data or None
+
+
+def _blank(value):
+    return value is None or value == "" or (isinstance(value, float) and value != value)
+
+
+class Backend:
+    """
+    One way of getting an institution's fields. Subclasses implement
+    fetch(item) -> dict of output columns (or None), and conclusive(data)
+    if some answers make the backends after them pointless; the cascade
+    reports every attempt back through record().
+    """
+
+    name = None
+    prior_latency = 1.0  # seconds assumed until the first attempt is measured
+
+    def __init__(self):
+        self.attempts = 0
+        self.resolved = 0
+        self.failed = 0
+        self.latency = None
+        self._lock = threading.Lock()
+
+    def fetch(self, item):
+        raise NotImplementedError
+
+    def conclusive(self, data):
+        """True if no later backend can add to `data`, even with required fields still blank."""
+        return False
+
+    def record(self, seconds, outcome):
+        """outcome: "resolved" (the row is complete or final), "partial" or "failed"."""
+        with self._lock:
+            self.attempts += 1
+            self.resolved += outcome == "resolved"
+            self.failed += outcome == "failed"
+            self.latency = seconds if self.latency is None else self.latency + LATENCY_ALPHA * (seconds - self.latency)
+
+    def success_rate(self):
+        # starts at 1/2 and moves towards the observed rate (Laplace smoothing)
+        return (self.resolved + 1) / (self.attempts + 2)
+
+    def expected_cost(self):
+        """Expected seconds spent on this backend per resolved row."""
+        latency = self.prior_latency if self.latency is None else self.latency
+        return latency / self.success_rate()
+
+    def summary(self):
+        latency = f"{self.latency * 1000:.0f} ms avg" if self.latency is not None else "not used"
+        return (f"{self.name}: {self.resolved}/{self.attempts} resolved, {self.failed} failed, {latency}, "
+                f"{self.expected_cost():.2f}s per resolved row")
+
+    def close(self):
+        pass
+
+
+class ApiBackend(Backend):
+    """The institution JSON API, with the HTTP cache and an adaptive rate of its own."""
+
+    name = "api"
+    prior_latency = 0.2
+
+    def __init__(self, cache=None, rate=API_REQUESTS_PER_SECOND, max_in_flight=MAX_IN_FLIGHT):
+        super().__init__()
+        self.cache = cache
+        self.session = api_scraper.build_session(max_in_flight)
+        self.limiter = AdaptiveRateLimiter(rate, name="api")
+
+    def fetch(self, item):
+        # one attempt: escalating to the next backend is the retry
+        details = api_scraper.get_detailed_stats(item['key'], session=self.session, cache=self.cache,
+                                                 limiter=self.limiter)
+        if not details:
+            return None
+        with METRICS.stage("parse", url=api_scraper.DETAIL_URL.format(item['key'])):
+            return api_scraper.parse_stats(details)
+
+    def conclusive(self, data):
+        # a detail payload with stats lists what the institution publishes
+        return has_stats(data)
+
+    def close(self):
+        self.session.close()
+
+
+class StaticBackend(Backend):
+    """The profile page over plain HTTP."""
+
+    name = "static"
+    prior_latency = 0.5
+
+    def __init__(self, rate=STATIC_REQUESTS_PER_SECOND, max_in_flight=MAX_IN_FLIGHT):
+        super().__init__()
+        self.fetcher = StaticFetcher(max_workers=max_in_flight, rate_limiter=AdaptiveRateLimiter(rate, name="static"))
+
+    def fetch(self, item):
+        return self.fetcher.extract(item['url'], parse_profile_html)
+
+    def conclusive(self, data):
+        # the stats were in the HTML; pages without them (or with empty placeholders) need rendering
+        return has_stats(data)
+
+    def close(self):
+        self.fetcher.close()
+
+
+class BrowserBackend(Backend):
+    """The rendered profile page, from a pool of headless Chromes started on first use."""
+
+    name = "browser"
+    prior_latency = 5.0
+
+    def __init__(self, num_workers=NUM_BROWSERS, pages_per_second=PAGES_PER_SECOND, resource_policy=None):
+        super().__init__()
+        self.num_workers = num_workers
+        self.pages_per_second = pages_per_second
+        self.resource_policy = resource_policy or ResourcePolicy()
+        self.pool = None
+        self._start_lock = threading.Lock()
+
+    def _create_driver(self):
+        # imported here: only needed once a profile has to be rendered
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        ResourcePolicy.enable_chrome_logging(options)
+        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        return self.resource_policy.apply_selenium(driver)
+
+    def _render(self, driver, url):
+        with METRICS.stage("navigate", url=url):
+            driver.get(url)
+        with METRICS.stage("extract", url=url):
+            try:
+                WebDriverWait(driver, 10).until(EC.presence_of_element_located(
+                    (By.CSS_SELECTOR, "div.stats-wrapper, .uni-stats-card")))
+            except TimeoutException:
+                pass  # parsed as it is; the cascade sees what is missing
+            data = parse_profile_html(driver.page_source, url)
+        self.resource_policy.collect_selenium(driver)
+        return data
+
+    def fetch(self, item):
+        with self._start_lock:
+            if self.pool is None:
+                print(f"🚀 Starting {self.num_workers} browsers for the profiles nothing cheaper could complete...")
+                self.pool = DriverPool(self._create_driver, self.num_workers,
+                                       rate_limiter=AdaptiveRateLimiter(self.pages_per_second, name="browser"))
+                self.pool.start()
+        return self.pool.submit(self._render, item['url']).result()
+
+    def conclusive(self, data):
+        return data is not None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class Cascade:
+    """
+    Resolves institutions (delta.listing_item() dicts with the nid as key and
+    the profile URL) over `backends`, escalating while `required` fields are
+    blank and reordering the backends by expected cost as it goes.
+    """
+
+    def __init__(self, backends, required=REQUIRED_FIELDS, explore_every=EXPLORE_EVERY):
+        self.backends = list(backends)
+        self.required = tuple(required)
+        self.explore_every = explore_every
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def order(self, index=None):
+        """Backends in the order the `index`-th institution tries them."""
+        if self.explore_every and index is not None and index % self.explore_every == 0:
+            return list(self.backends)
+        return sorted(self.backends, key=lambda backend: backend.expected_cost())
+
+    def is_complete(self, record):
+        return all(not _blank(record.get(field)) for field in self.required)
+
+    def resolve(self, item, index=None):
+        """Returns (record, complete) for one institution; incomplete rows have blank required fields."""
+        record = {'University Name': item['title'], 'URL': item['url']}
+        used = []
+        complete = False
+        for backend in self.order(index):
+            started = time.perf_counter()
+            try:
+                data = backend.fetch(item)
+            except Exception as e:
+                METRICS.count("cascade_errors", backend=backend.name, error_class=classify(e))
+                data = None
+            seconds = time.perf_counter() - started
+            filled = [column for column, value in (data or {}).items()
+                      if column in COLUMNS and not _blank(value) and _blank(record.get(column))]
+            for column in filled:
+                record[column] = data[column]
+            if filled:
+                used.append(backend.name)
+            complete = self.is_complete(record)
+            final = complete or backend.conclusive(data)
+            backend.record(seconds, "resolved" if final else "partial" if filled else "failed")
+            if final:
+                break
+        record['Backend'] = "+".join(used)
+        METRICS.count("cascade", outcome="complete" if complete else "incomplete", backends=record['Backend'] or "none")
+        if used:
+            METRICS.count("pages", source=used[-1])
+        else:
+            METRICS.count("failures", source="cascade")
+        return record, complete
+
+    def run(self, items, max_in_flight=MAX_IN_FLIGHT):
+        """Resolves `items` concurrently and yields (item, record, complete) in the order of `items`."""
+        total = len(items)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            results = pool.map(lambda pair: self.resolve(pair[1], pair[0]), enumerate(items))
+            for i, (item, (record, complete)) in enumerate(zip(items, results), start=1):
+                yield item, record, complete
+                if i % 50 == 0 or i == total:
+                    order = " > ".join(backend.name for backend in self.order())
+                    print(f"⚙️ Resolved ({i}/{total}), backends now tried as {order}")
+
+    def summary(self):
+        return "\n".join(f"   {backend.summary()}" for backend in self.backends)
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+
+def build_backends(names=BACKENDS, cache=None, max_in_flight=MAX_IN_FLIGHT):
+    """Backends by name, in the given order."""
+    factories = {
+        "api": lambda: ApiBackend(cache=cache, rate=API_REQUESTS_PER_SECOND, max_in_flight=max_in_flight),
+        "static": lambda: StaticBackend(rate=STATIC_REQUESTS_PER_SECOND, max_in_flight=max_in_flight),
+        "browser": lambda: BrowserBackend(NUM_BROWSERS, PAGES_PER_SECOND),
+    }
+    return [factories[name]() for name in names]
+
+
+def main():
+    METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
+    cache = HttpCache(api_scraper.CACHE_DIR)
+    universities = api_scraper.get_all_universities(cache=cache)
+    if not universities:
+        print("Could not retrieve university list. Exiting.")
+        METRICS.close()
+        return
+
+    # profile paths in the listing are relative to the site the API is served from
+    items = [delta.listing_item(uni.get('nid'), uni.get('title'), uni.get('rank_display'),
+                                urljoin(api_scraper.LISTING_URL, uni.get('path') or ""))
+             for uni in universities]
+    print(f"⚙️ Resolving {len(items)} universities over {' > '.join(BACKENDS)} ({MAX_IN_FLIGHT} in flight)...")
+
+    incomplete = 0
+    with Cascade(build_backends(BACKENDS, cache=cache, max_in_flight=MAX_IN_FLIGHT)) as cascade, \
+            open_sink(RESULTS_FILE, COLUMNS) as sink:
+        for item, record, complete in cascade.run(items):
+            incomplete += not complete
+            sink.write(record)
+    print(f"📝 Streamed {sink.written} records to '{RESULTS_FILE}' ({incomplete} with required fields blank)")
+    print(f"🧭 Backends:\n{cascade.summary()}")
+    print(f"🗄️ Cache: {cache.summary()}")
+
+    # rows were streamed in listing order
+    df = read_sink(RESULTS_FILE).reindex(columns=COLUMNS)
+    with METRICS.stage("save", url=RESULTS_XLSX):
+        df.to_excel(RESULTS_XLSX, index=False)
+        typed = columnar.write_parquet(df, columnar.parquet_path(RESULTS_XLSX))
+    print(f"🎉 SUCCESS! Data for {len(df)} universities saved to '{RESULTS_XLSX}' (typed copy: '{typed}')")
+    print(f"⏱️ Time by stage:\n{METRICS.summary()}")
+    METRICS.close()
+    print(f"📈 Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
+
+
+if __name__ == "__main__":
+    main()
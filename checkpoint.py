@@ -0,0 +1,224 @@
+"""
+SQLite checkpoint journal for long scraping runs.
+
+Every profile URL gets one row with its state (pending / in_progress / done /
+failed), attempt count, timestamps and the extracted fields as JSON. The
+database runs in WAL mode, so readers never block the writer and several
+worker processes can share one journal: URLs are handed out with claim(),
+which marks a batch as in_progress inside a single IMMEDIATE transaction,
+so two workers never get the same URL. Results are buffered and committed
+in batches; after a crash at most one batch is scraped again. Each enqueue()
+stamps its URLs, so results() can leave out URLs that have since dropped out
+of the listing.
+"""
+
+import json
+import sqlite3
+import time
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url         TEXT PRIMARY KEY,
+    position    INTEGER NOT NULL,
+    rank        TEXT,
+    name        TEXT,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    finished_at REAL,
+    error       TEXT,
+    data        TEXT,
+    listed_at   REAL
+);
+CREATE INDEX IF NOT EXISTS urls_state ON urls (state, position);
+"""
+
+
+class CheckpointJournal:
+    """
+    A resumable work journal backed by SQLite.
+
+    `batch_size` is both the number of URLs claimed at a time and the number
+    of finished URLs buffered before a commit. A worker that dies keeps its
+    claimed URLs until `lease_seconds` pass; after that any worker may
+    claim them again. Failed URLs are retried on later runs until they
+    have been attempted `max_attempts` times.
+    """
+
+    def __init__(self, path, worker_id="main", batch_size=20, lease_seconds=900, max_attempts=3):
+        self.path = path
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._pending_writes = []
+        self.opened_at = time.time()
+
+        # autocommit mode: transactions are opened explicitly below
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+        # journals written before listed_at existed
+        if "listed_at" not in {row["name"] for row in self.conn.execute("PRAGMA table_info(urls)")}:
+            self.conn.execute("ALTER TABLE urls ADD COLUMN listed_at REAL")
+
+    def _transaction(self, statements):
+        """Runs (sql, params_list) pairs as one IMMEDIATE transaction."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                self.conn.executemany(sql, params)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, links, requeue_finished_before=None):
+        """
+        Adds (rank, name, url) tuples in listing order. URLs already in the
+        journal keep their state but get the fresh rank, name and position.
+        All of them are stamped as the latest listing (see results()).
+        With `requeue_finished_before` (an epoch time), URLs that finished
+        before that moment are set back to pending so they are scraped again.
+        """
+        now = time.time()
+        params = [(url, pos, rank, name, now, now, now) for pos, (rank, name, url) in enumerate(links)]
+        sql = """
+            INSERT INTO urls (url, position, rank, name, created_at, updated_at, listed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                position = excluded.position, rank = excluded.rank, name = excluded.name,
+                listed_at = excluded.listed_at
+        """
+        statements = [(sql, params)]
+        if requeue_finished_before is not None:
+            statements.append((
+                "UPDATE urls SET state = 'pending', attempts = 0, updated_at = ? "
+                "WHERE url = ? AND state IN ('done', 'failed') AND finished_at < ?",
+                [(now, url, requeue_finished_before) for _, _, url in links]))
+        self._transaction(statements)
+
+    def requeue_own(self):
+        """Returns URLs this worker id left in_progress (e.g. after a crash) to the queue."""
+        cur = self.conn.execute(
+            "UPDATE urls SET state = 'pending', worker = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE state = 'in_progress' AND worker = ?",
+            (time.time(), self.worker_id))
+        return cur.rowcount
+
+    def claim(self, limit=None):
+        """
+        Atomically claims up to `limit` unfinished URLs (pending, retryable
+        failures from earlier runs and expired leases) in listing order. Returns sqlite3.Row
+        objects with url, rank, name and attempts.
+        """
+        limit = limit or self.batch_size
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                """
+                SELECT url, rank, name, attempts FROM urls
+                WHERE state = 'pending'
+                   OR (state = 'failed' AND attempts < ? AND finished_at < ?)
+                   OR (state = 'in_progress' AND lease_until < ?)
+                ORDER BY position LIMIT ?
+                """,
+                (self.max_attempts, self.opened_at, now, limit)).fetchall()
+            self.conn.executemany(
+                "UPDATE urls SET state = 'in_progress', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE url = ?",
+                [(self.worker_id, now + self.lease_seconds, now, row["url"]) for row in rows])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def mark_done(self, url, data):
+        self._pending_writes.append((DONE, None, json.dumps(data, ensure_ascii=False), url))
+        self._maybe_flush()
+
+    def mark_failed(self, url, error):
+        self._pending_writes.append((FAILED, str(error)[:500], None, url))
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._pending_writes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Commits all buffered results in one transaction."""
+        if not self._pending_writes:
+            return
+        now = time.time()
+        params = [(state, error, data, now, now, url, self.worker_id)
+                  for state, error, data, url in self._pending_writes]
+        # the worker check keeps a slow worker from overwriting a URL whose lease
+        # expired and that another worker has since claimed
+        self._transaction([(
+            "UPDATE urls SET state = ?, error = ?, data = COALESCE(?, data), finished_at = ?, "
+            "updated_at = ?, lease_until = NULL WHERE url = ? AND worker = ?",
+            params)])
+        self._pending_writes = []
+
+    def counts(self):
+        """Returns {state: number of URLs}."""
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def unfinished(self):
+        """Number of URLs a claim() could still hand out (ignoring live leases)."""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM urls WHERE state IN ('pending', 'in_progress') "
+            "OR (state = 'failed' AND attempts < ?)", (self.max_attempts,)).fetchone()[0]
+
+    def dead_letters(self):
+        """Failed URLs that will not be claimed again: they used up all `max_attempts`."""
+        rows = self.conn.execute(
+            "SELECT url, rank, name, attempts, error FROM urls WHERE state = 'failed' AND attempts >= ? "
+            "ORDER BY position", (self.max_attempts,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def redrive(self, urls=None):
+        """
+        Sets failed URLs (all of them, or only `urls`) back to pending with
+        a fresh attempt budget; finished rows are left alone. Returns the
+        re-queued URLs in listing order.
+        """
+        rows = self.conn.execute("SELECT url FROM urls WHERE state = 'failed' ORDER BY position").fetchall()
+        wanted = None if urls is None else set(urls)
+        redriven = [row["url"] for row in rows if wanted is None or row["url"] in wanted]
+        now = time.time()
+        self._transaction([(
+            "UPDATE urls SET state = 'pending', attempts = 0, worker = NULL, updated_at = ? "
+            "WHERE url = ? AND state = 'failed'",
+            [(now, url) for url in redriven])])
+        return redriven
+
+    def results(self, latest=True):
+        """
+        Yields (rank, name, url, state, data) in listing order for the URLs
+        of the latest enqueue(), so profiles that left the ranking are not
+        exported again; with `latest=False`, for every URL in the journal.
+        """
+        sql = "SELECT rank, name, url, state, data FROM urls"
+        if latest:
+            sql += " WHERE listed_at IS (SELECT MAX(listed_at) FROM urls)"
+        for row in self.conn.execute(sql + " ORDER BY position"):
+            yield row["rank"], row["name"], row["url"], row["state"], json.loads(row["data"] or "{}")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,161 @@
+"""
+Typed columnar (Parquet / Feather) output for scraped and merged datasets.
+
+The Excel and CSV outputs hold display strings such as "11,632", "45%",
+"801+" or "474=", which every consumer has to parse again. This module
+converts a DataFrame to an Arrow table with a fixed schema, chosen by
+column name:
+
+    counts       "11,632" -> int64           (Total Students, staff, Column1, ...)
+    percentages  "45%"    -> float64         (Domestic Staff %, Int'l Staff %, Column2)
+    scores       "28.3"   -> float64         (AR SCORE, ..., Overall SCORE)
+    ranks        "474="   -> int32 + flag    (Rank, Previous Rank, AR RANK, ...)
+    categories   "Europe" -> dictionary      (Country/Territory, Region, Size, Focus, ...)
+
+A rank column "X RANK" becomes two columns: "X RANK" with the (lower) rank
+as an integer and "X RANK Flag" with "=" (tied), "+" (that rank or lower),
+"band" (a range such as "631-640") or null for a plain rank.
+Columns the schema does not know are kept as strings, so nothing is lost.
+Parsing is done by normalize.py; column names are normalized the same way.
+
+    python columnar.py merged_qs_rankings.csv          -> merged_qs_rankings.parquet
+    python columnar.py --header 2 rankings.xlsx        (header on the 3rd row)
+"""
+
+import argparse
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+import normalize
+
+COUNT_COLUMNS = {"Index", "staff", "Column1", "Column3"}
+# scraper columns starting with one of these hold head counts, e.g. 'Total Students (UG students)'
+COUNT_PREFIXES = ("Total Students", "UG Students", "PG Students", "International Students",
+                  "Total Faculty Staff", "Domestic Staff")
+PERCENT_COLUMNS = {"Column2"}
+CATEGORY_COLUMNS = ("Country/Territory", "Region", "Size", "Focus", "Research", "Status")
+TEXT_COLUMNS = {"Name", "Institution", "University", "University Name", "URL", "Profile URL"}
+
+RANK_FLAGS = ("=", "+", "band")
+
+# keep integer columns with blanks as integers when loading back
+PANDAS_TYPES = {pa.int64(): pd.Int64Dtype(), pa.int32(): pd.Int32Dtype()}
+
+
+def column_kind(name):
+    """Returns 'count', 'percent', 'score', 'rank', 'category' or 'text' for a column name."""
+    if name in TEXT_COLUMNS:
+        return "text"
+    if name in CATEGORY_COLUMNS:
+        return "category"
+    if "%" in name or name in PERCENT_COLUMNS:
+        return "percent"
+    if name in COUNT_COLUMNS or name.startswith(COUNT_PREFIXES):
+        return "count"
+    if name.endswith("SCORE"):
+        return "score"
+    if name == "Rank" or name.endswith("Rank") or name.endswith("RANK"):
+        return "rank"
+    return "text"
+
+
+def ranks(series):
+    """'474=' -> (474, '='), '801+' -> (801, '+'), '631-640' -> (631, 'band'), '12' -> (12, NA)."""
+    bands = normalize.rank_bands(series)
+    flag = pd.Series(pd.NA, index=series.index, dtype="string")
+    flag = flag.mask(bands["tie"].fillna(False), "=")
+    flag = flag.mask(bands["low"].notna() & bands["high"].isna(), "+")
+    flag = flag.mask((bands["high"] > bands["low"]).fillna(False), "band")
+    return bands["low"], flag
+
+
+def to_arrow(df):
+    """Converts a scraped or merged DataFrame to an Arrow table with the fixed schema."""
+    arrays, fields = [], []
+
+    def add(name, values, arrow_type):
+        arrays.append(pa.array(values, type=arrow_type, from_pandas=True))
+        fields.append(pa.field(name, arrow_type))
+
+    for original in df.columns:
+        # "Int’l Staff %" and "Int'l Staff %" end up as the same field
+        column, name = df[original], normalize.label(original)
+        kind = column_kind(name)
+        if kind == "count":
+            add(name, normalize.counts(column), pa.int64())
+        elif kind == "percent":
+            add(name, normalize.percents(column), pa.float64())
+        elif kind == "score":
+            add(name, normalize.numbers(column), pa.float64())
+        elif kind == "rank":
+            rank, flag = ranks(column)
+            add(name, rank, pa.int32())
+            add(f"{name} Flag", pd.Categorical(flag, categories=RANK_FLAGS), pa.dictionary(pa.int8(), pa.string()))
+        elif kind == "category":
+            add(name, pd.Categorical(normalize.text(column)), pa.dictionary(pa.int16(), pa.string()))
+        else:
+            add(name, normalize.text(column), pa.string())
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def typed(df):
+    """`df` with the fixed schema's types as pandas dtypes (nullable Int64 counts, float percentages, ...)."""
+    return to_arrow(df).to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def write_parquet(df, path, compression="zstd"):
+    """Writes `df` as typed Parquet. Returns the path."""
+    pq.write_table(to_arrow(df), path, compression=compression)
+    return path
+
+
+def write_feather(df, path, compression="zstd"):
+    """Writes `df` as typed Feather (Arrow IPC), the fastest format to load back. Returns the path."""
+    feather.write_feather(to_arrow(df), path, compression=compression)
+    return path
+
+
+def read_table(path, columns=None):
+    """Loads a file written by write_parquet() / write_feather() into a DataFrame."""
+    if path.endswith(".feather"):
+        table = feather.read_table(path, columns=columns)
+    else:
+        table = pq.read_table(path, columns=columns)
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def parquet_path(path):
+    """'qs_table_827.xlsx' -> 'qs_table_827.parquet'."""
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def main(paths, header=0):
+    """Converts CSV / Excel files to typed Parquet next to them and compares load times."""
+    for path in paths:
+        started = time.perf_counter()
+        if path.endswith(".csv"):
+            df = pd.read_csv(path, dtype=str, header=header)
+        else:
+            df = pd.read_excel(path, dtype=str, header=header)
+        load_source = time.perf_counter() - started
+
+        out = write_parquet(df, parquet_path(path))
+        started = time.perf_counter()
+        read_table(out)
+        load_parquet = time.perf_counter() - started
+
+        print(f"✅ {path} -> {out}: {os.path.getsize(path) / 1024:.0f} KB -> {os.path.getsize(out) / 1024:.0f} KB, "
+              f"load {load_source * 1000:.0f} ms -> {load_parquet * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert CSV / Excel outputs to typed Parquet.")
+    parser.add_argument("paths", nargs="*", default=["merged_qs_rankings.csv"])
+    parser.add_argument("--header", type=int, default=0, help="row holding the column names")
+    args = parser.parse_args()
+    main(args.paths, args.header)
@@ -0,0 +1,104 @@
+"""
+Delta scraping: only refetch institutions that are new, moved in the ranking,
+were renamed, or whose stored stats are older than a cutoff.
+
+Each scraper keeps a JSON snapshot of its previous run, keyed by a stable id
+(the API `nid`, or the profile URL for the browser scrapers):
+
+    {"<key>": {"title": ..., "rank": ..., "url": ..., "fetched_at": <epoch>, "record": {...}}}
+
+A run compares the fresh listing against the snapshot with plan_delta(),
+fetches only what it returns, stores the new records with update_snapshot()
+and rebuilds the full dataset, in listing order, with merge_records().
+"""
+
+import json
+import os
+import time
+from collections import Counter
+
+
+def listing_item(key, title="", rank="", url=""):
+    """One row of a fresh listing, in the shape plan_delta() expects."""
+    return {"key": str(key), "title": (title or "").strip(), "rank": str(rank or "").strip(), "url": url or ""}
+
+
+def load_snapshot(path):
+    """Returns the snapshot stored at `path`, or an empty one on the first run."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_snapshot(path, snapshot):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def plan_delta(listing, snapshot, max_age_days=30):
+    """
+    Returns (items_to_fetch, reasons) for a fresh listing.
+
+    An item is refetched when it is not in the snapshot, its rank, title or
+    profile URL changed, it has no stored record, or its record is older
+    than `max_age_days`. `reasons` counts why, for the run summary.
+    """
+    cutoff = time.time() - max_age_days * 24 * 3600
+    to_fetch = []
+    reasons = Counter()
+
+    for item in listing:
+        previous = snapshot.get(item["key"])
+        if previous is None:
+            reason = "new"
+        elif not previous.get("record"):
+            reason = "missing"
+        elif previous.get("rank") != item["rank"]:
+            reason = "rank changed"
+        elif previous.get("title") != item["title"] or previous.get("url") != item["url"]:
+            reason = "renamed"
+        elif previous.get("fetched_at", 0) < cutoff:
+            reason = "stale"
+        else:
+            reasons["unchanged"] += 1
+            continue
+        reasons[reason] += 1
+        to_fetch.append(item)
+
+    return to_fetch, reasons
+
+
+def update_snapshot(snapshot, item, record):
+    """Stores a freshly fetched record for a listing item."""
+    snapshot[item["key"]] = {
+        "title": item["title"],
+        "rank": item["rank"],
+        "url": item["url"],
+        "fetched_at": time.time(),
+        "record": record,
+    }
+
+
+def merge_records(listing, snapshot, fallback=None):
+    """
+    Rebuilds the full dataset in listing order from the snapshot, which by now
+    holds the fresh records for refetched items and the previous ones for the
+    rest. Items that were never fetched successfully get `fallback(item)`, or
+    are skipped when no fallback is given.
+    """
+    records = []
+    for item in listing:
+        record = snapshot.get(item["key"], {}).get("record")
+        if not record and fallback:
+            record = fallback(item)
+        if record:
+            records.append(record)
+    return records
+
+
+def describe(reasons):
+    return ", ".join(f"{count} {reason}" for reason, count in reasons.most_common()) or "nothing to do"
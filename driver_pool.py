@@ -0,0 +1,168 @@
+"""
+A pool of browser workers that pull profile URLs from a shared work queue.
+
+Each worker thread owns one WebDriver created by the given factory. A task is
+called as task(driver, item); results come back as futures, and map() returns
+them in input (i.e. ranking) order. When a task raises, only that worker's
+browser is thrown away and restarted: the item is retried once on a fresh
+browser and the other workers carry on untouched. A shared TokenBucket keeps
+the combined page-load rate under the politeness limit, so throughput grows
+with the number of workers until that limit is reached. Task durations and
+failures are reported back to it, so an AdaptiveRateLimiter slows the pool
+down when pages get slow or fail. Errors that belong to the page rather than
+the browser (see retry_policy.classify: not found, client, parse) fail the
+item straight away and keep the browser.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import METRICS
+from retry_policy import CLIENT, NOT_FOUND, PARSE, classify
+
+# errors that say something about the page, not the browser: no restart, no retry
+PAGE_ERRORS = {NOT_FOUND, CLIENT, PARSE}
+
+
+class DriverPool:
+
+    def __init__(self, driver_factory, num_workers=4, rate_limiter=None, item_retries=1, max_start_failures=3):
+        self.driver_factory = driver_factory
+        self.num_workers = num_workers
+        self.rate_limiter = rate_limiter
+        self.item_retries = item_retries
+        self.max_start_failures = max_start_failures
+        self._jobs = queue.Queue()
+        self._threads = []
+        self._alive = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def start(self):
+        self._alive = self.num_workers
+        for worker_id in range(1, self.num_workers + 1):
+            t = threading.Thread(target=self._run_worker, args=(worker_id,), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def submit(self, task, item):
+        future = Future()
+        if self._alive == 0:
+            future.set_exception(RuntimeError("no browser workers left"))
+        else:
+            self._jobs.put((task, item, future, 0))
+        return future
+
+    def imap(self, task, items, on_error=None, label=None):
+        """
+        Runs task(driver, item) for every item and yields the results in the
+        order of `items` as soon as each one is ready. A failed item yields
+        on_error(item, exc), or None.
+        """
+        futures = [self.submit(task, item) for item in items]
+        for i, (item, future) in enumerate(zip(items, futures), start=1):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"   - Giving up on {item}: {e}")
+                result = on_error(item, e) if on_error else None
+            if label:
+                print(f"⚙️ Processed ({i}/{len(items)}): {label(item)}")
+            yield result
+
+    def map(self, task, items, on_error=None, label=None):
+        """Same as imap(), collected into a list."""
+        return list(self.imap(task, items, on_error, label))
+
+    def _start_driver(self, worker_id):
+        failures = 0
+        while True:
+            try:
+                with METRICS.stage("browser start", worker=worker_id):
+                    return self.driver_factory()
+            except Exception as e:
+                failures += 1
+                print(f"⚠️ Worker {worker_id}: browser failed to start ({failures}/{self.max_start_failures}): {e}")
+                if failures >= self.max_start_failures:
+                    return None
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _retire(self, worker_id, job):
+        """Hands the job back and stops this worker; fails everything if no worker is left."""
+        with self._lock:
+            self._alive -= 1
+            last_worker = self._alive == 0
+        print(f"❌ Worker {worker_id} retired: its browser cannot be started.")
+        if not last_worker:
+            self._jobs.put(job)
+            return
+        job[2].set_exception(RuntimeError("no browser workers left"))
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None:
+                job[2].set_exception(RuntimeError("no browser workers left"))
+
+    def _run_worker(self, worker_id):
+        driver = None
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            task, item, future, tries = job
+
+            if driver is None:
+                driver = self._start_driver(worker_id)
+                if driver is None:
+                    self._retire(worker_id, job)
+                    return
+
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                future.set_result(task(driver, item))
+                if self.rate_limiter:
+                    self.rate_limiter.observe(latency=time.monotonic() - started)
+            except Exception as e:
+                if classify(e) in PAGE_ERRORS:
+                    future.set_exception(e)
+                    continue
+                if self.rate_limiter:
+                    self.rate_limiter.observe(error=True)
+                # isolate the failure: restart only this worker's browser
+                print(f"⚠️ Worker {worker_id}: {e!r} — restarting its browser.")
+                METRICS.count("browser_restarts")
+                self._quit(driver)
+                driver = None
+                if tries < self.item_retries:
+                    METRICS.count("retries", source="pool")
+                    self._jobs.put((task, item, future, tries + 1))
+                else:
+                    future.set_exception(e)
+
+        if driver is not None:
+            self._quit(driver)
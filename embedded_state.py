@@ -0,0 +1,119 @@
+"""
+Reads profile stats from the structured data a profile page is built from,
+instead of clicking the "Students & staff" tab and scraping rendered text.
+
+A profile's raw HTML carries the Drupal settings blob
+(<script data-drupal-selector="drupal-settings-json">) and any hydration
+JSON. If one of them already holds the `stats_*` list, it is used directly.
+Otherwise the node id found there is used to call the institution endpoint
+the page itself loads its numbers from (the API used by api_scraper.py).
+to_record() maps either source onto the columns scrape_qs() writes.
+"""
+
+import json
+import re
+
+from lxml import html
+
+# embedded JSON blobs: Drupal settings and generic hydration state
+JSON_SCRIPT_RE = re.compile(
+    r'<script[^>]+(?:data-drupal-selector="drupal-settings-json"|id="__NEXT_DATA__"|type="application/json")[^>]*>'
+    r'(.*?)</script>', re.S)
+NID_PATTERNS = (
+    re.compile(r'"currentPath"\s*:\s*"node\\?/(\d+)"'),
+    re.compile(r'<link[^>]+rel="shortlink"[^>]+href="[^"]*/node/(\d+)"'),
+    re.compile(r'data-history-node-id="(\d+)"'),
+)
+
+# API stat type -> scrape_qs() column
+STATE_FIELDS = {
+    'stats_total_student': 'Total Students',
+    'stats_total_inter_student': 'International Students',
+    'stats_total_faculty': 'Total Faculty Staff',
+    'stats_dom_faculty': 'Domestic Staff %',
+    'stats_int_faculty': "Int'l Staff %",
+}
+PERCENT_FIELDS = ('Domestic Staff %', "Int'l Staff %")
+
+
+def embedded_json_blobs(page_html):
+    """Yields every parseable JSON blob embedded in the page."""
+    for match in JSON_SCRIPT_RE.finditer(page_html):
+        try:
+            yield json.loads(match.group(1))
+        except ValueError:
+            continue
+
+
+def find_stats(obj):
+    """Depth-first search for a list of {'type': 'stats_...', 'value': ...} entries."""
+    if isinstance(obj, list):
+        if obj and all(isinstance(x, dict) and str(x.get('type', '')).startswith('stats_') for x in obj):
+            return obj
+        items = obj
+    elif isinstance(obj, dict):
+        items = obj.values()
+    else:
+        return None
+    for item in items:
+        found = find_stats(item)
+        if found:
+            return found
+    return None
+
+
+def find_nid(page_html):
+    """Returns the Drupal node id of the profile page, or None."""
+    for pattern in NID_PATTERNS:
+        match = pattern.search(page_html)
+        if match:
+            return match.group(1)
+    return None
+
+
+def page_title(page_html):
+    """Text of the first <h1>, which the DOM extractor used as the university name."""
+    try:
+        h1 = html.fromstring(page_html).find('.//h1')
+    except ValueError:
+        return None
+    return " ".join(h1.text_content().split()) if h1 is not None else None
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(',', '').replace('%', '').strip())
+    except ValueError:
+        return None
+
+
+def to_record(stats, uni_name):
+    """
+    Maps a `stats_*` list onto the scrape_qs() columns, formatted like the
+    rendered page ("11,632", "45%"). Staff splits given as head counts are
+    turned into percentages of the total faculty; without a total they are
+    left blank rather than shown as a share they are not.
+    """
+    values = {STATE_FIELDS[s['type']]: s.get('value') for s in stats if s.get('type') in STATE_FIELDS}
+    total_faculty = _number(values.get('Total Faculty Staff'))
+
+    record = {"University": uni_name}
+    for field in STATE_FIELDS.values():
+        raw = values.get(field)
+        number = _number(raw) if raw not in (None, '') else None
+        if number is None:
+            record[field] = "" if raw is None else str(raw).strip()
+        elif field in PERCENT_FIELDS:
+            if '%' in str(raw):
+                record[field] = f"{round(number)}%"
+            elif total_faculty:
+                record[field] = f"{round(100 * number / total_faculty)}%"
+            else:
+                record[field] = ""
+        else:
+            record[field] = f"{int(number):,}"
+    return record
+
+
+def has_values(record):
+    return bool(record) and any(record[field] for field in STATE_FIELDS.values())
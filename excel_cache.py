@@ -0,0 +1,129 @@
+"""
+Columnar sidecar cache for Excel inputs.
+
+Parsing a workbook through openpyxl is by far the slowest part of a
+merge.py run, while the workbooks themselves rarely change.
+read_excel_cached() keeps a Feather copy of what pd.read_excel() returned,
+together with a small JSON record of the source it was built from:
+
+    path, size, mtime, SHA-256 of the content, and the read options
+
+- size and mtime unchanged           -> load the Feather copy
+- mtime changed, content hash equal  -> load it too (file was copied/touched)
+- anything else, or other options    -> parse the workbook and rebuild
+
+Each set of read options (e.g. header=2) gets its own sidecar. The round
+trip is exact: column names are kept in the JSON record (Feather only
+allows string names), and object columns that mix numbers and text, such
+as ranks like 12 and "801+", are stored as JSON text and decoded on load.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+CACHE_DIR = ".excel_cache"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _options_key(options):
+    return json.dumps(options, sort_keys=True, default=str)
+
+
+def sidecar_paths(path, options, cache_dir=CACHE_DIR):
+    """(feather path, JSON record path) for a workbook and its read options."""
+    name = hashlib.sha1(f"{os.path.abspath(path)}|{_options_key(options)}".encode()).hexdigest()[:20]
+    base = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0][:40]}-{name}")
+    return base + ".feather", base + ".json"
+
+
+def _encode(df):
+    """Makes `df` storable as Feather; returns (frame, JSON-encoded column positions)."""
+    out = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    json_columns = []
+    for pos in range(df.shape[1]):
+        column = df.iloc[:, pos].reset_index(drop=True)
+        try:
+            pa.array(column, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            column = column.map(lambda v: None if v is None or v != v else json.dumps(v, default=str))
+            json_columns.append(pos)
+        out[f"c{pos}"] = column
+    return out, json_columns
+
+
+def _decode(frame, record):
+    for pos in record["json_columns"]:
+        name = f"c{pos}"
+        frame[name] = frame[name].map(lambda v: json.loads(v) if isinstance(v, str) else float("nan"),
+                                      na_action=None).astype(object)
+    frame.columns = pd.Index(record["columns"])
+    return frame
+
+
+def _write_atomic(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def read_excel_cached(path, cache_dir=CACHE_DIR, log=None, **options):
+    """
+    Same as pd.read_excel(path, **options), served from a Feather sidecar
+    when the workbook has not changed since it was last parsed.
+    `log` (e.g. print) receives one line saying whether the cache was used.
+    """
+    data_path, record_path = sidecar_paths(path, options, cache_dir)
+    stat = os.stat(path)
+    record = None
+    if os.path.exists(data_path) and os.path.exists(record_path):
+        with open(record_path, encoding="utf-8") as f:
+            record = json.load(f)
+        if record.get("options") != _options_key(options):
+            record = None
+
+    if record:
+        unchanged = record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns
+        if not unchanged and record["size"] == stat.st_size and record["sha256"] == file_hash(path):
+            # same bytes under a new mtime: remember the new mtime and keep the sidecar
+            record["mtime_ns"] = stat.st_mtime_ns
+            _write_atomic(record_path, lambda tmp: _dump(record, tmp))
+            unchanged = True
+        if unchanged:
+            if log:
+                log(f"Loaded '{path}' from cache sidecar '{data_path}'")
+            return _decode(feather.read_table(data_path).to_pandas(), record)
+
+    df = pd.read_excel(path, **options)
+    os.makedirs(cache_dir, exist_ok=True)
+    frame, json_columns = _encode(df)
+    _write_atomic(data_path, lambda tmp: feather.write_feather(frame, tmp))
+    record = {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_hash(path),
+        "options": _options_key(options),
+        "columns": list(df.columns),
+        "json_columns": json_columns,
+    }
+    _write_atomic(record_path, lambda tmp: _dump(record, tmp))
+    if log:
+        log(f"Parsed '{path}' and cached it in '{data_path}'")
+    return df
+
+
+def _dump(record, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, default=str)
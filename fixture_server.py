@@ -0,0 +1,435 @@
+"""
+Local stand-in for topuniversities.com, for offline benchmarks and debugging.
+
+Serves the pages and APIs the scrapers read, with the markup they expect:
+
+    /world-university-rankings                 listing: first rows + "Load more" / infinite scroll
+    /world-university-rankings?page=N&items_per_page=M   one listing page (qs_scraper_2025)
+    /world-university-rankings/rows?page=N     listing rows fragment loaded by the page script
+    /universities/<slug>                       profile: `div.stats-wrapper` and/or `.uni-stats-card`
+    /api/qs-rankings/en/2025/<id>              ranking JSON (api_scraper listing)
+    /api/institution/en/<nid>                  institution stats JSON (api_scraper, embedded state)
+
+Institutions are the recorded rows of merged_qs_rankings.csv (names and
+figures as scraped), topped up with deterministic synthetic ones when more
+are asked for. Latency, jitter and error injection (503, or 429 with
+Retry-After) are configurable per route kind. Every decision is derived
+from the seed, the path and how many times that path was requested, so a
+run can be repeated exactly. A share of profiles can render their stats
+client-side only (empty static HTML), which sends them down the browser path.
+
+    python fixture_server.py --port 8765 --latency 0.05 --error-rate 0.02
+"""
+
+import argparse
+import html
+import json
+import math
+import os
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RECORDED_FILE = "merged_qs_rankings.csv"
+ROUTE_KINDS = ("listing", "rows", "profile", "api_listing", "api_detail")
+SYLLABLES = ("ka", "lo", "mi", "ran", "te", "sol", "vi", "dor", "na", "bel", "ur", "sen", "tor", "ha", "gre")
+
+
+def slugify(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def _count(value):
+    return f"{int(value):,}"
+
+
+def synthetic_institution(i, seed=0):
+    """A made-up but plausible institution, the same for a given (i, seed)."""
+    rng = random.Random(f"{seed}|{i}")
+    place = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    name = rng.choice(("University of {}", "{} University", "{} Institute of Technology",
+                       "{} State University")).format(place)
+    students = rng.randint(1_000, 60_000)
+    ug = int(students * rng.uniform(0.4, 0.8))
+    international = int(students * rng.uniform(0.01, 0.45))
+    faculty = max(50, int(students / rng.uniform(5, 25)))
+    int_pct = rng.randint(1, 60)
+    return {
+        "name": f"{name} ({i})", "total_students": _count(students),
+        "ug_students": _count(ug), "pg_students": _count(students - ug),
+        "international_students": _count(international),
+        "ug_international": _count(international // 2), "pg_international": _count(international - international // 2),
+        "faculty": _count(faculty), "domestic_staff": _count(faculty * (100 - int_pct) // 100),
+        "intl_staff": _count(faculty * int_pct // 100),
+        "domestic_pct": f"{100 - int_pct}%", "intl_pct": f"{int_pct}%",
+    }
+
+
+def _number(text):
+    """'11,632' -> 11632; None for anything that is not a plain figure (some recorded cells hold prose)."""
+    text = str(text).strip()
+    return int(re.sub(r"[,\s%]", "", text)) if re.fullmatch(r"\d[\d,\s]*%?", text) else None
+
+
+def _recorded(path):
+    """Institutions from a merged_qs_rankings.csv-style file (only rows with a student count)."""
+    import pandas as pd
+
+    df = pd.read_csv(path, dtype=str).fillna("")
+    rows = []
+    for r in df.to_dict("records"):
+        students = _number(r.get("Total Students", ""))
+        if not r.get("Name") or students is None:
+            continue
+        international = _number(r.get("International Students", "")) or 0
+        faculty = _number(r.get("Total Faculty Staff", "")) or 0
+        int_pct = _number(r.get("Int'l Staff %", "")) or 0
+        ug = students * 3 // 5
+        rows.append({
+            # figures as recorded; the UG/PG and staff splits are derived from them
+            "name": r["Name"].strip(), "total_students": r["Total Students"],
+            "ug_students": _count(ug), "pg_students": _count(students - ug),
+            "international_students": r.get("International Students", ""),
+            "ug_international": _count(international // 2),
+            "pg_international": _count(international - international // 2),
+            "faculty": r.get("Total Faculty Staff", ""),
+            "domestic_staff": _count(faculty * (100 - int_pct) // 100), "intl_staff": _count(faculty * int_pct // 100),
+            "domestic_pct": r.get("Domestic Staff %", ""), "intl_pct": r.get("Int'l Staff %", ""),
+        })
+    return rows
+
+
+def load_institutions(count=None, path=RECORDED_FILE, seed=0):
+    """
+    Recorded institutions from `path` (if it exists), followed by synthetic
+    ones up to `count`. Each gets a rank, a node id and a profile slug.
+    """
+    rows = _recorded(path) if path and os.path.exists(path) else []
+    count = len(rows) if count is None else count
+    rows = rows[:count] + [synthetic_institution(i, seed) for i in range(len(rows), count)]
+    seen = set()
+    for i, row in enumerate(rows):
+        slug = slugify(row["name"])
+        if slug in seen:
+            slug = f"{slug}-{i}"
+        seen.add(slug)
+        row.update(rank=i + 1, nid=str(100000 + i), slug=slug)
+    return rows
+
+
+# --- markup, mirroring the selectors in static_extract.py / stats_extract.py / the scrapers ---
+
+def stats_list(inst):
+    """The `stats_*` list served by the institution API."""
+    return [
+        {"type": "stats_total_student", "value": inst["total_students"]},
+        {"type": "stats_ug_student", "value": inst["ug_students"]},
+        {"type": "stats_pg_student", "value": inst["pg_students"]},
+        {"type": "stats_total_inter_student", "value": inst["international_students"]},
+        {"type": "stats_ug_inter_student", "value": inst["ug_international"]},
+        {"type": "stats_pg_inter_student", "value": inst["pg_international"]},
+        {"type": "stats_total_faculty", "value": inst["faculty"]},
+        {"type": "stats_dom_faculty", "value": inst["domestic_pct"]},
+        {"type": "stats_int_faculty", "value": inst["intl_pct"]},
+    ]
+
+
+def _stat_box(label, value, ratios):
+    parts = "".join(f'<div class="_ratio-box"><div class="_name">{html.escape(n)}</div>'
+                    f'<div class="_value">{html.escape(v)}</div></div>' for n, v in ratios)
+    return (f'<div class="_stat-box"><div class="_label">{html.escape(label)}</div>'
+            f'<div class="_value">{html.escape(value)}</div>{parts}</div>')
+
+
+def stats_wrapper_html(inst):
+    return '<div class="stats-wrapper">' + "".join((
+        _stat_box("Total students", inst["total_students"],
+                  [("UG students", inst["ug_students"]), ("PG students", inst["pg_students"])]),
+        _stat_box("International students", inst["international_students"],
+                  [("UG students", inst["ug_international"]), ("PG students", inst["pg_international"])]),
+        _stat_box("Total faculty staff", inst["faculty"],
+                  [("Domestic staff", inst["domestic_staff"]), ("Int'l staff", inst["intl_staff"])]),
+    )) + "</div>"
+
+
+def stats_cards_html(inst):
+    cards = (("Total students", inst["total_students"]), ("UG students", inst["ug_students"]),
+             ("PG students", inst["pg_students"]), ("International students", inst["international_students"]),
+             ("Total faculty staff", inst["faculty"]), ("Domestic staff", inst["domestic_pct"]),
+             ("Int'l staff", inst["intl_pct"]))
+    return '<div class="uni-stats-cards">' + "".join(
+        f'<div class="uni-stats-card"><div class="uni-stats-card__title">{html.escape(t)}</div>'
+        f'<div class="uni-stats-card__number">{html.escape(v)}</div></div>' for t, v in cards) + "</div>"
+
+
+# fills the stats blocks from the institution API, for profiles rendered client-side
+CLIENT_SIDE_JS = """
+fetch('/api/institution/en/%(nid)s').then(r => r.json()).then(d => {
+  document.getElementById('stats').innerHTML = d.html;
+});
+"""
+
+
+def profile_html(inst, layouts, client_side=False, embed_stats=False):
+    settings = {"path": {"currentPath": f"node/{inst['nid']}"}}
+    if embed_stats:
+        settings["institution"] = {"stats": stats_list(inst)}
+    blocks = "".join(stats_wrapper_html(inst) if layout == "wrapper" else stats_cards_html(inst)
+                     for layout in layouts)
+    body = ('<div id="stats"></div><script>' + CLIENT_SIDE_JS % inst + '</script>') if client_side \
+        else f'<div id="stats">{blocks}</div>'
+    name = html.escape(inst["name"])
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{name} | Top Universities</title>'
+            f'<link rel="shortlink" href="/node/{inst["nid"]}">'
+            f'<script type="application/json" data-drupal-selector="drupal-settings-json">'
+            f'{json.dumps(settings)}</script></head>'
+            f'<body data-history-node-id="{inst["nid"]}"><h1>{name}</h1>'
+            f'<nav><a href="#students-staff">Students &amp; staff</a></nav>{body}</body></html>')
+
+
+def listing_rows_html(rows):
+    return "".join(
+        f'<div class="rankings-table__row views-row ind-row">'
+        f'<div class="rankings-table__rank">{inst["rank"]}</div>'
+        f'<a class="uni-link rankings-table__title" href="/universities/{inst["slug"]}">{html.escape(inst["name"])}</a>'
+        f'</div>' for inst in rows)
+
+
+# "Load more" button (qs_scraper) and infinite scroll (final_scraper) both fetch the next rows fragment
+LOADER_JS = """
+let next = 1, loading = false;
+const button = document.querySelector('button.js-rankings-load-more');
+async function loadMore() {
+  if (loading || !button.isConnected) return;
+  loading = true;
+  const r = await fetch('/world-university-rankings/rows?items_per_page=%(per_page)d&page=' + next);
+  const text = await r.text();
+  if (r.ok) {
+    document.getElementById('rows').insertAdjacentHTML('beforeend', text);
+    next += 1;
+    if (next >= %(pages)d) button.remove();
+  }
+  loading = false;
+}
+button.addEventListener('click', loadMore);
+window.addEventListener('scroll', () => {
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 50) loadMore();
+});
+"""
+
+
+def listing_html(rows, page=None, pages=1, per_page=150):
+    script = ""
+    if page is None and pages > 1:
+        script = ('<button class="js-rankings-load-more">Load more</button><script>'
+                  + LOADER_JS % {"per_page": per_page, "pages": pages} + '</script>')
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>QS World University Rankings</title></head>'
+            f'<body><div id="rows" class="qs-rankings">{listing_rows_html(rows)}</div>{script}</body></html>')
+
+
+class FixtureServer:
+    """
+    Threaded HTTP server serving `institutions` (see load_institutions()).
+    `latency` is seconds per response, either one number or a dict by route
+    kind (ROUTE_KINDS); `jitter` adds up to that many seconds at random.
+    `error_rate` (number or dict by route kind) is the share of requests
+    answered with `error_status`; a 429 carries Retry-After: `retry_after`.
+    `layouts` are the profile stats blocks rendered ("wrapper", "cards").
+    `client_side` and `embed_stats` are the shares of profiles whose stats
+    are only rendered by a script, and whose settings JSON embeds the stats.
+    `max_rate` (requests per second, one second of burst) makes the server
+    throttle like a real one: requests above it get a 429 with Retry-After.
+    """
+
+    def __init__(self, institutions=None, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, retry_after=1, layouts=("wrapper", "cards"),
+                 client_side=0.0, embed_stats=0.0, per_page=150, seed=0, max_rate=None):
+        self.institutions = load_institutions(seed=seed) if institutions is None else institutions
+        self.by_slug = {inst["slug"]: inst for inst in self.institutions}
+        self.by_nid = {inst["nid"]: inst for inst in self.institutions}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.layouts = tuple(layouts)
+        self.client_side = client_side
+        self.embed_stats = embed_stats
+        self.per_page = per_page
+        self.seed = seed
+        self.max_rate = max_rate
+        self._allowance = max_rate or 0.0
+        self._allowance_at = time.monotonic()
+        self.counts = Counter()
+        self._requests_per_path = Counter()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self):
+        """Copy of the request counters: '<kind>' and '<kind> <status>' entries."""
+        with self._lock:
+            return Counter(self.counts)
+
+    def _share(self, value, kind):
+        return value.get(kind, 0.0) if isinstance(value, dict) else value
+
+    def _flag(self, key, share):
+        """Deterministic per-key yes/no with probability `share`."""
+        return share > 0 and zlib.crc32(f"{self.seed}|{key}".encode()) % 10_000 < share * 10_000
+
+    def _plan(self, kind, path):
+        """(delay seconds, inject error?) for this request, reproducible for a given seed."""
+        with self._lock:
+            attempt = self._requests_per_path[path]
+            self._requests_per_path[path] += 1
+        rng = random.Random(f"{self.seed}|{path}|{attempt}")
+        delay = self._share(self.latency, kind) + rng.uniform(0, self._share(self.jitter, kind))
+        return delay, rng.random() < self._share(self.error_rate, kind)
+
+    def _over_limit(self):
+        """True if this request exceeds `max_rate` (a token bucket refilled at that rate)."""
+        if not self.max_rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.max_rate, self._allowance + (now - self._allowance_at) * self.max_rate)
+            self._allowance_at = now
+            if self._allowance < 1:
+                return True
+            self._allowance -= 1
+            return False
+
+    def _route(self, path, query):
+        """Returns (kind, status, content type, body) for a request path."""
+        parts = [p for p in path.split("/") if p]
+        if parts == ["world-university-rankings"] or parts == ["world-university-rankings", "rows"]:
+            per_page = int(query.get("items_per_page", [self.per_page])[0])
+            page = int(query["page"][0]) if "page" in query else None
+            pages = max(1, math.ceil(len(self.institutions) / per_page))
+            rows = self.institutions[(page or 0) * per_page:((page or 0) + 1) * per_page]
+            if parts[-1] == "rows":
+                return "rows", 200, "text/html", listing_rows_html(rows)
+            return "listing", 200, "text/html", listing_html(rows, page, pages, per_page)
+        if len(parts) == 2 and parts[0] == "universities":
+            inst = self.by_slug.get(parts[1])
+            if not inst:
+                return "profile", 404, "text/html", "<h1>Not found</h1>"
+            return "profile", 200, "text/html", profile_html(
+                inst, self.layouts, self._flag(f"client|{inst['slug']}", self.client_side),
+                self._flag(f"embed|{inst['slug']}", self.embed_stats))
+        if parts[:3] == ["api", "qs-rankings", "en"]:
+            per_page = int(query.get("items_per_page", [2500])[0])
+            page = int(query.get("page", [0])[0])
+            rows = self.institutions[page * per_page:(page + 1) * per_page]
+            data = [{"nid": i["nid"], "title": i["name"], "rank_display": str(i["rank"]),
+                     "path": f"/universities/{i['slug']}"} for i in rows]
+            return "api_listing", 200, "application/json", json.dumps(
+                {"data": data, "total_record": len(self.institutions)})
+        if parts[:3] == ["api", "institution", "en"] and len(parts) == 4:
+            inst = self.by_nid.get(parts[3])
+            if not inst:
+                return "api_detail", 404, "application/json", json.dumps({"error": "not found"})
+            body = {"nid": inst["nid"], "title": inst["name"], "stats": stats_list(inst),
+                    # pre-rendered blocks for client-side profiles
+                    "html": "".join(stats_wrapper_html(inst) if layout == "wrapper" else stats_cards_html(inst)
+                                    for layout in self.layouts)}
+            return "api_detail", 200, "application/json", json.dumps(body)
+        return "other", 404, "text/plain", "not found"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # headers and body are separate writes; without this, Nagle + delayed ACK add ~40 ms
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                kind, status, content_type, body = server._route(url.path, parse_qs(url.query))
+                delay, fail = server._plan(kind, self.path)
+                if delay:
+                    time.sleep(delay)
+                headers = {}
+                if server._over_limit():
+                    status, content_type, body = 429, "text/plain", "rate limit exceeded"
+                    headers["Retry-After"] = str(server.retry_after)
+                elif fail:
+                    status, content_type, body = server.error_status, "text/plain", "injected error"
+                    if status == 429:
+                        headers["Retry-After"] = str(server.retry_after)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with server._lock:
+                    server.counts[kind] += 1
+                    server.counts[f"{kind} {status}"] += 1
+                    server.counts["bytes"] += len(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the QS site.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--institutions", type=int, default=None, help="number of institutions (default: recorded)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--client-side", type=float, default=0.0, help="share of profiles rendered client-side")
+    parser.add_argument("--max-rate", type=float, default=None, help="answer 429 above this many requests/s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fixture = FixtureServer(load_institutions(args.institutions, seed=args.seed), args.host, args.port,
+                            args.latency, args.jitter, args.error_rate, args.error_status,
+                            client_side=args.client_side, seed=args.seed, max_rate=args.max_rate)
+    print(f"🧪 Serving {len(fixture.institutions)} institutions at {fixture.base_url}/world-university-rankings")
+    try:
+        fixture.serve_forever()
+    except KeyboardInterrupt:
+        fixture.stop()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from metrics import METRICS
+
+
+class CachedResponse:
+    """
+    The small part of a requests.Response that the scrapers use, rebuilt from disk.
+    `from_cache` is True only if no request was made; a 304 revalidation hit the
+    network and keeps that response's headers and elapsed time.
+    """
+
+    def __init__(self, url, status_code, text, headers, from_cache, elapsed=None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+        self.from_cache = from_cache
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpCache:
+    """
+    On-disk HTTP response cache keyed by URL.
+
+    Every successful body is stored together with its ETag / Last-Modified
+    validators. Within `ttl` seconds the body is served straight from disk;
+    after that the entry is revalidated with a conditional GET and a
+    304 Not Modified is answered from disk, so a re-run mostly costs small
+    revalidation requests instead of full downloads.
+    """
+
+    def __init__(self, cache_dir=".http_cache", ttl=24 * 3600):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0, "errors": 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+        METRICS.count("cache", result=name)
+
+    def load(self, url):
+        """Returns the stored entry for `url`, or None if there is none (or it is unreadable)."""
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def is_fresh(self, url, ttl=None):
+        """True if `url` would be served from disk without touching the network."""
+        ttl = self.ttl if ttl is None else ttl
+        entry = self.load(url)
+        return bool(entry) and time.time() - entry["fetched_at"] < ttl
+
+    def store(self, url, response):
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "body": response.text,
+        }
+        self._write(url, entry)
+        return entry
+
+    def _write(self, url, entry):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file first so a crash never leaves a half-written entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def get(self, session, url, headers=None, timeout=10, ttl=None):
+        """
+        GETs `url` through the cache using `session` (a requests Session or the
+        requests module). Returns a CachedResponse for cache hits and 304s and
+        the live response for everything else.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = self.load(url)
+
+        if entry and time.time() - entry["fetched_at"] < ttl:
+            self._count("fresh")
+            return CachedResponse(url, 200, entry["body"], {}, from_cache=True)
+
+        request_headers = dict(headers or {})
+        if entry:
+            if entry.get("etag"):
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = session.get(url, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and entry:
+            # unchanged on the server: restart the TTL and serve the stored body
+            entry["fetched_at"] = time.time()
+            self._write(url, entry)
+            self._count("revalidated")
+            return CachedResponse(url, 200, entry["body"], response.headers, from_cache=False,
+                                  elapsed=getattr(response, "elapsed", None))
+
+        if response.status_code == 200:
+            self.store(url, response)
+            self._count("downloaded")
+        else:
+            self._count("errors")
+        return response
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['fresh']} fresh from disk, {s['revalidated']} revalidated (304), "
+                f"{s['downloaded']} downloaded, {s['errors']} errors")
@@ -7,9 +7,23 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 import time
-import re
+
+import columnar
+from metrics import METRICS
+from page_wait import scroll_until_loaded
+from retry_policy import CircuitBreaker, RetryPolicy, classify
+from stats_extract import read_stats_wrapper, parse_stats_wrapper
+
+MAX_ATTEMPTS = 3  # tries per profile for retryable errors (timeouts, network, throttling)
+METRICS_SNAPSHOT = "interactive_scraper_metrics.prom"  # stage timings and counters, rewritten during the run
+METRICS_EVENTS = "interactive_scraper_events.jsonl"    # one line per timed stage and URL
+
+# backoff per error class; the breaker pauses the loop while most profile loads fail
+RETRY_POLICY = RetryPolicy(max_attempts=MAX_ATTEMPTS, base_delay=2.0, breaker=CircuitBreaker(name="site"),
+                           name="browser")
 
 
 # --- BACKEND SCRAPING LOGIC ---
@@ -28,7 +42,8 @@ class UniversityScraper:
         options.add_argument('--log-level=3')
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
         options.add_experimental_option('useAutomationExtension', False)
-        self.driver = webdriver.Chrome(service=service, options=options)
+        with METRICS.stage("browser start"):
+            self.driver = webdriver.Chrome(service=service, options=options)
         self.update_status("Driver setup complete. Browser window will open.")
 
     def _handle_popups(self):
@@ -41,8 +56,8 @@ class UniversityScraper:
                 self.update_status("  > Cookie banner accepted.")
                 time.sleep(1)
                 continue
-            except:
-                pass
+            except WebDriverException:
+                pass  # not shown (yet) or not clickable
 
             try:
                 close_button = self.driver.find_element(By.CSS_SELECTOR, "div.qs-modal-close")
@@ -50,33 +65,30 @@ class UniversityScraper:
                 self.update_status("  > Promotional pop-up closed.")
                 time.sleep(1)
                 continue
-            except:
-                pass
+            except WebDriverException:
+                pass  # not shown (yet) or not clickable
 
             time.sleep(0.5)
         self.update_status("Pop-up check complete.")
 
     def _get_university_links(self):
         self.update_status(f"Navigating to {self.BASE_URL}")
-        self.driver.get(self.BASE_URL)
+        with METRICS.stage("navigate", url=self.BASE_URL):
+            self.driver.get(self.BASE_URL)
 
-        self._handle_popups()
+        with METRICS.stage("popup", url=self.BASE_URL):
+            self._handle_popups()
 
         self.update_status("Waiting for university list to load...")
-        WebDriverWait(self.driver, 45).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div.ind-row"))
-        )
+        with METRICS.stage("wait", url=self.BASE_URL):
+            WebDriverWait(self.driver, 45).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.ind-row"))
+            )
         self.update_status("Main content loaded successfully.")
 
-        last_height = self.driver.execute_script("return document.body.scrollHeight")
-        while True:
-            self.update_status("Scrolling down to load all universities...")
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(4)
-            new_height = self.driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
+        self.update_status("Scrolling down to load all universities...")
+        with METRICS.stage("listing", url=self.BASE_URL):
+            scroll_until_loaded(self.driver, "a.uni-link", quiet=4, deadline=300, log=self.update_status)
 
         uni_elements = self.driver.find_elements(By.CSS_SELECTOR, "a.uni-link")
         links = [elem.get_attribute('href') for elem in uni_elements]
@@ -84,47 +96,27 @@ class UniversityScraper:
         return links
 
     def _extract_details(self, url):
-        self.driver.get(url)
-        data = {'URL': url, 'University Name': 'Not Found'}
-        try:
-            data['University Name'] = self.driver.title.split('|')[0].strip()
-        except:
-            pass
-
-        try:
-            stats_container = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.stats-wrapper")))
-
-            def get_stat_box(label_text):
+        """
+        Loads one profile, retried per RETRY_POLICY. A page without a stats
+        block still gives a row; any other error is raised.
+        """
+        def attempt():
+            with METRICS.stage("navigate", url=url):
+                self.driver.get(url)
+            with METRICS.stage("extract", url=url):
+                data = {'URL': url, 'University Name': self.driver.title.split('|')[0].strip() or 'Not Found'}
                 try:
-                    return stats_container.find_element(By.XPATH,
-                                                        f".//div[contains(@class, '_label') and contains(text(), '{label_text}')]/ancestor::div[contains(@class, '_stat-box')]")
-                except:
-                    return None
+                    # one execute_script round trip for the whole stats block
+                    parse_stats_wrapper(read_stats_wrapper(self.driver), data)
+                except TimeoutException:
+                    METRICS.count("missing_stats", source="browser")
+                    self.update_status(f"  - No detailed stats found for {data['University Name']}")
+            return data
 
-            def process_box(box, data_prefix):
-                if not box: return
-                try:
-                    data[f'{data_prefix} (Total)'] = re.sub(r'[^\d]', '',
-                                                            box.find_element(By.CSS_SELECTOR, "div._value").text)
-                except:
-                    pass
-                try:
-                    for ratio in box.find_elements(By.CSS_SELECTOR, "div._ratio-box"):
-                        name = ratio.find_element(By.CSS_SELECTOR, "div._name").text
-                        value = ratio.find_element(By.CSS_SELECTOR, "div._value").text
-                        data[f'{data_prefix} ({name})'] = value
-                except:
-                    pass
-
-            process_box(get_stat_box('Total students'), 'Total Students')
-            process_box(get_stat_box('International students'), 'International Students')
-            process_box(get_stat_box('Total faculty staff'), 'Total Faculty Staff')
-        except:
-            self.update_status(f"  - No detailed stats found for {data['University Name']}")
-        return data
+        return RETRY_POLICY.call(attempt, label=url)
 
     def run(self):
+        METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
         try:
             self._setup_driver()
             links = self._get_university_links()
@@ -133,7 +125,14 @@ class UniversityScraper:
             total = len(links)
             for i, link in enumerate(links):
                 self.update_status(f"Processing ({i + 1}/{total}): {link.split('/')[-1]}")
-                details = self._extract_details(link)
+                try:
+                    details = self._extract_details(link)
+                    METRICS.count("pages", source="browser")
+                except Exception as e:
+                    error_class = getattr(e, "error_class", None) or classify(e)
+                    self.update_status(f"  - Failed after {getattr(e, 'attempts', 1)} attempts ({error_class}: {e})")
+                    METRICS.count("failures", source="browser", error_class=error_class)
+                    details = {'URL': link, 'University Name': 'Not Found'}
                 all_data.append(details)
                 time.sleep(0.5)
 
@@ -146,8 +145,11 @@ class UniversityScraper:
                           'Total Faculty Staff (Int\'l staff)', 'URL']
             df = df.reindex(columns=cols_order)
             filename = 'university_student_staff_data.xlsx'
-            df.to_excel(filename, index=False)
+            with METRICS.stage("save", url=filename):
+                df.to_excel(filename, index=False)
+                columnar.write_parquet(df, columnar.parquet_path(filename))
             self.update_status(f"\nSUCCESS! ✅\nData saved to '{filename}'")
+            self.update_status(f"Time by stage:\n{METRICS.summary()}")
 
         except Exception as e:
             self.update_status(f"\nERROR: An unexpected error occurred.\nDetails: {e}")
@@ -155,6 +157,8 @@ class UniversityScraper:
             if self.driver:
                 self.driver.quit()
                 self.update_status("Browser closed.")
+            METRICS.close()
+            self.update_status(f"Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
 
 
 # --- GUI APPLICATION ---
@@ -1,83 +1,158 @@
-import pandas as pd
+import os
+
+import columnar
+import excel_cache
+import xlsx_patch
+from source_merge import Source, SourceMerger, supplied_counts
+
+# The main file's generic column names (see find_header_row) that are
+# filled from the sources.
+UPDATE_COLS = ['staff', 'Column1', 'Column2', 'Column3']
+
+# Each source's column names mapped to the main file's column names.
+QS_TABLE_COLUMNS = {
+    'Institution': 'Name',
+    'University': 'Name',
+    'Total Students': 'Column1',
+    'International Students': 'Column3',
+    'Total Faculty Staff': 'staff',
+    "Int'l Staff %": 'Column2'
+}
+PROFILE_COLUMNS = {
+    'University Name': 'Name',
+    'Total Students (Total)': 'Column1',
+    'International Students (Total)': 'Column3',
+    'Total Faculty Staff (Total)': 'staff'
+}
+PROGRESS_COLUMNS = {
+    'University': 'Name',
+    'Total Students': 'Column1',
+    'International Students': 'Column3',
+    'Total Faculty Staff': 'staff'
+}
+
+# Every scraper output, most trusted first (higher priority wins). Values already
+# in the main file are kept; missing ones are taken from the best source that has them.
+SOURCES = [
+    Source('university_api_data.xlsx', PROFILE_COLUMNS, priority=40, label='api'),
+    Source('qs_table_827.xlsx', QS_TABLE_COLUMNS, priority=30, label='qs_table'),
+    Source('qs_rankings_progress.csv', PROGRESS_COLUMNS, priority=20, label='qs_progress',
+           key_column='Profile URL'),
+    Source('university_data.xlsx', PROFILE_COLUMNS, priority=10, label='selenium', key_column='URL'),
+    Source('qs_table_sample*.xlsx', QS_TABLE_COLUMNS, priority=0, label='qs_table_samples'),
+]
+
+
+def find_header_row(path, column='Name', max_rows=10):
+    """
+    Returns the 0-based row holding the main file's column names: the first
+    of its top `max_rows` rows with a `column` cell. Exports of the ranking
+    workbook have it on the first row, the original download below two
+    title rows. Raises ValueError if no such row exists.
+    """
+    sheet = xlsx_patch.XlsxSheet(path)
+    for row in range(1, max_rows + 1):
+        if column in (name.strip() for name in sheet.header(row)):
+            return row - 1
+    raise ValueError(f"no '{column}' column in the first {max_rows} rows of '{path}'")
 
 
-def update_rankings_in_place(main_file_path, source_file_path):
+def patch_changed_cells(main_file_path, df_main, changed, header=2):
+    """
+    Writes only the cells flagged in `changed` (a boolean frame over df_main's
+    columns) into the existing workbook, keeping its title rows and formatting.
+    Data rows are located below the header row and checked against df_main's
+    names; raises ValueError if the sheet no longer lines up with df_main.
+    Returns the number of cells written.
+    """
+    sheet = xlsx_patch.XlsxSheet(main_file_path)
+    header_row = header + 1
+    columns = {name.strip(): letters for name, letters in sheet.header(header_row).items()}
+    rows = sheet.data_rows(header_row)
+    if len(rows) != len(df_main) or 'Name' not in columns:
+        raise ValueError(f"sheet has {len(rows)} data rows, expected {len(df_main)}")
+
+    for col in changed.columns:
+        if col not in columns:
+            raise ValueError(f"column '{col}' not found in the sheet header")
+        for pos in changed.index[changed[col].to_numpy()]:
+            name = df_main['Name'].iat[pos]
+            if str(sheet.value(f"{columns['Name']}{rows[pos]}")).strip() != name:
+                raise ValueError(f"row {rows[pos]} does not hold '{name}'")
+            value = df_main[col].iat[pos]
+            sheet.set(f"{columns[col]}{rows[pos]}", value.item() if hasattr(value, 'item') else value)
+    if sheet.changed:
+        sheet.save()
+    return sheet.changed
+
+
+def update_rankings_from_sources(main_file_path, sources=SOURCES, fuzzy=True,
+                                 report_path='merge_match_report.csv',
+                                 provenance_path='merge_provenance.csv', threshold=0.75,
+                                 patch=True, header=None, keep_existing=True):
     """
-    Updates the main QS rankings file in-place with data from a source file.
+    Updates the main QS rankings file in-place from any number of sources.
 
-    It matches institutions by name and fills in any missing data for total
-    students, international students, total faculty, and international faculty
-    percentage. The original main file is overwritten with the changes.
+    Every source is matched against the main file's names once, and each of
+    UPDATE_COLS is then filled from the highest-priority source that has a
+    value for that institution. The source of every value is written to
+    `provenance_path`.
 
     Args:
         main_file_path (str): Path to the main QS rankings Excel file to be updated.
-        source_file_path (str): Path to the source Excel file with the data.
+        sources (list): source_merge.Source entries; missing files are skipped.
+        fuzzy (bool): Match names through name_match.NameIndex instead of exact equality.
+        report_path (str): Where to write the per-row match report (CSV).
+        provenance_path (str): Where to write which source supplied each value (CSV).
+        threshold (float): Minimum match score accepted when fuzzy.
+        patch (bool): Write only the filled cells into the existing workbook
+            instead of rewriting it; falls back to a full rewrite if the sheet
+            cannot be lined up with the loaded rows.
+        header (int): Row (0-based) holding the main file's column names;
+            found with find_header_row() when None.
+        keep_existing (bool): Keep values already in the main file over source values.
     """
     try:
-        # Load the main rankings file. The actual headers are on the 3rd row (index 2).
-        df_main = pd.read_excel(main_file_path, header=2)
+        # Load the main rankings file from its header row, wherever the title rows put it.
+        # Unchanged workbooks are served from a columnar sidecar instead of being re-parsed.
+        if header is None:
+            header = find_header_row(main_file_path)
+        df_main = excel_cache.read_excel_cached(main_file_path, log=print, header=header)
         print(f"Successfully loaded '{main_file_path}' with {len(df_main)} rows.")
 
-        # Load the source data file.
-        df_source = pd.read_excel(source_file_path)
-        print(f"Successfully loaded '{source_file_path}' with {len(df_source)} rows.")
-
-        # --- Column Mapping and Renaming ---
-        # The main file's header is read from its 3rd row, resulting in generic
-        # column names. We map the source columns to these target column names.
-        column_mapping = {
-            'Institution': 'Name',
-            'Total Students': 'Column1',
-            'International Students': 'Column3',
-            'Total Faculty Staff': 'staff',
-            "Int'l Staff %": 'Column2'
-        }
-        df_source_renamed = df_source.rename(columns=column_mapping)
-
-        # --- Data Cleaning ---
         # Strip whitespace from institution names to ensure accurate matching.
         df_main['Name'] = df_main['Name'].str.strip()
-        df_source_renamed['Name'] = df_source_renamed['Name'].str.strip()
-
-        # Clean source data: convert numeric strings (e.g., "1,234") to numbers.
-        numeric_cols = ['Column1', 'Column3', 'staff']
-        for col in numeric_cols:
-            if col in df_source_renamed.columns:
-                df_source_renamed[col] = pd.to_numeric(
-                    df_source_renamed[col].astype(str).str.replace(',', ''),
-                    errors='coerce'
-                )
-
-        # Clean percentage column: remove '%' and convert to a number.
-        if 'Column2' in df_source_renamed.columns:
-            df_source_renamed['Column2'] = pd.to_numeric(
-                df_source_renamed['Column2'].astype(str).str.replace('%', ''),
-                errors='coerce'
-            )
-
-        # --- Update Main DataFrame ---
-        # Set 'Name' as the index for both DataFrames to align rows for updating.
-        df_main.set_index('Name', inplace=True)
-        df_source_renamed.set_index('Name', inplace=True)
 
-        # The columns we intend to potentially fill in the main dataframe.
-        update_cols = ['staff', 'Column1', 'Column2', 'Column3']
+        print(f"Checking for and filling missing data in columns: {UPDATE_COLS}")
+        merger = SourceMerger(df_main, UPDATE_COLS, fuzzy=fuzzy, threshold=threshold)
+        merged, provenance, report = merger.merge(sources, keep_existing=keep_existing)
+        if report_path and len(report):
+            report.to_csv(report_path, index=False)
+        if provenance_path:
+            provenance.to_csv(provenance_path, index=False)
+            print(f"Saved value provenance to '{provenance_path}'")
+        print(supplied_counts(provenance, UPDATE_COLS).to_string())
 
-        print(f"Checking for and filling missing data in columns: {update_cols}")
-
-        # update() with overwrite=False fills NaN (blank) values in df_main
-        # without overwriting existing data.
-        df_main.update(df_source_renamed[update_cols], overwrite=False)
-
-        # Reset the index to turn 'Name' back into a column.
-        df_main.reset_index(inplace=True)
-
-        print("Update process complete.")
+        changed = merged[UPDATE_COLS].notna() & merged[UPDATE_COLS].ne(df_main[UPDATE_COLS])
+        print(f"Update process complete: {int(changed.to_numpy().sum())} cells filled.")
 
         # --- Saving the result ---
-        # Overwrite the original main file with the updated data.
-        df_main.to_excel(main_file_path, index=False)
-        print(f"Successfully saved changes back to '{main_file_path}'")
+        # Patch just the filled cells into the workbook; rewrite it whole only if that fails.
+        saved = False
+        if patch:
+            try:
+                written = patch_changed_cells(main_file_path, merged, changed, header)
+                print(f"Patched {written} cells in '{main_file_path}'")
+                saved = True
+            except (ValueError, KeyError) as e:
+                print(f"Could not patch '{main_file_path}' in place ({e}); rewriting it instead.")
+        if not saved:
+            merged.to_excel(main_file_path, index=False)
+            print(f"Successfully saved changes back to '{main_file_path}'")
+
+        # Typed copy for downstream loads (integer counts, float percentages, parsed ranks).
+        typed_path = columnar.write_parquet(merged, columnar.parquet_path(main_file_path))
+        print(f"Saved typed copy to '{typed_path}'")
 
     except FileNotFoundError as e:
         print(f"Error: {e}. Please ensure the file paths are correct.")
@@ -85,10 +160,20 @@ def update_rankings_in_place(main_file_path, source_file_path):
         print(f"An unexpected error occurred: {e}")
 
 
+def update_rankings_in_place(main_file_path, source_file_path, **kwargs):
+    """
+    Updates the main QS rankings file in-place with data from one QS table
+    export (total students, international students, total faculty and
+    international faculty percentage). Takes the same keyword arguments as
+    update_rankings_from_sources().
+    """
+    source = Source(source_file_path, QS_TABLE_COLUMNS, label=os.path.basename(source_file_path))
+    update_rankings_from_sources(main_file_path, [source], **kwargs)
+
+
 if __name__ == '__main__':
-    # Define the input file paths.
-    # The main_file will be read and then overwritten with the updates.
+    # The main_file will be read and then overwritten with the updates from
+    # every source in SOURCES that exists.
     main_file = 'Copy of 2026_QS_World_University_Rankings_1.2_(For_qs.com)_(3)(1).xlsx'
-    source_file = 'qs_table_827.xlsx'
 
-    update_rankings_in_place(main_file, source_file)
\ No newline at end of file
+    update_rankings_from_sources(main_file)
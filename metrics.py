@@ -0,0 +1,292 @@
+"""
+Run metrics shared by all scrapers: per-stage timings, counters and histograms.
+
+Every module records into the process-wide METRICS instance; nothing is
+written anywhere until a scraper calls METRICS.configure() with output paths:
+
+    snapshot_path   rewritten every `interval` seconds during the run and at
+                    close(): Prometheus text format, or JSON if the path ends
+                    in .json (counters, histograms with p50/p95/p99)
+    events_path     JSON Lines, one event per timed stage and URL
+                    ({"ts", "event": "stage", "stage", "url", "seconds", "ok"})
+                    plus whatever else is passed to event()
+
+Stages are timed with a context manager or a decorator (sync and async):
+
+    with METRICS.stage("navigate", url=url):
+        driver.get(url)
+
+    @METRICS.timed("parse")
+    def parse_stats(details): ...
+
+    METRICS.count("pages", source="static")
+    METRICS.observe("rate_limit_wait_seconds", delay)
+    METRICS.gauge("rate_limit_rate", 12.5, limiter="static")
+
+At the end of a run, METRICS.summary() says where the time went.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = "scraper"
+# seconds; wide enough for a 2-minute page load or Excel export
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style) that also tracks the maximum."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99),
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts))}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prom_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms, with optional snapshot / event outputs."""
+
+    def __init__(self, snapshot_path=None, events_path=None, interval=5.0, namespace=NAMESPACE):
+        self.namespace = namespace
+        self.snapshot_path = None
+        self.interval = interval
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._events = None
+        self._events_lock = threading.Lock()
+        self._started = time.time()
+        self._next_flush = float("inf")
+        self.configure(snapshot_path, events_path)
+
+    def configure(self, snapshot_path=None, events_path=None, interval=None):
+        """Sets where the snapshot and the event log go (None keeps metrics in memory only)."""
+        if interval is not None:
+            self.interval = interval
+        self.snapshot_path = snapshot_path
+        self._next_flush = time.monotonic() + self.interval if snapshot_path else float("inf")
+        with self._events_lock:
+            if self._events:
+                self._events.close()
+            self._events = open(events_path, "a", encoding="utf-8") if events_path else None
+        return self
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._started = time.time()
+
+    # --- recording ---
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def gauge(self, name, value, **labels):
+        """Sets a value that goes up and down (e.g. the current request rate)."""
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+        self._maybe_flush()
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+        self._maybe_flush()
+
+    def event(self, event, **fields):
+        """Appends one line to the event log, if there is one."""
+        if self._events is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str)
+        with self._events_lock:
+            if self._events is not None:
+                self._events.write(line + "\n")
+
+    @contextmanager
+    def stage(self, name, url=None, **fields):
+        """
+        Times the block as stage `name`: observed in the stage_seconds
+        histogram, counted in stages{outcome=ok|error} and logged as an event.
+        """
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe("stage_seconds", seconds, stage=name)
+            self.count("stages", stage=name, outcome="ok" if ok else "error")
+            self.event("stage", stage=name, url=url, seconds=round(seconds, 4), ok=ok, **fields)
+
+    def timed(self, name):
+        """Decorator form of stage() for functions and coroutine functions."""
+        def decorate(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    with self.stage(name):
+                        return await fn(*args, **kwargs)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    with self.stage(name):
+                        return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    # --- reading ---
+
+    def counter(self, name, **labels):
+        """Current value of one counter (0 if never counted)."""
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            gauges = [{"name": name, "labels": dict(labels), "value": value}
+                      for (name, labels), value in sorted(self._gauges.items())]
+            histograms = [{"name": name, "labels": dict(labels), **h.to_dict()}
+                          for (name, labels), h in sorted(self._histograms.items())]
+        return {"started": self._started, "uptime": time.time() - self._started,
+                "counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def prometheus(self):
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{ns}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_prom_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            metric = f"{ns}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{_prom_labels(labels)} {value}")
+        for (name, labels), h in histograms:
+            metric = f"{ns}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                cumulative += n
+                lines.append(f"{metric}_bucket{_prom_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric}_sum{_prom_labels(labels)} {h.sum}")
+            lines.append(f"{metric}_count{_prom_labels(labels)} {h.count}")
+        lines.append(f"{ns}_uptime_seconds {time.time() - self._started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path=None):
+        """Writes the snapshot atomically; .json paths get JSON, anything else Prometheus text."""
+        path = path or self.snapshot_path
+        if not path:
+            return None
+        text = json.dumps(self.snapshot(), indent=1) if path.endswith(".json") else self.prometheus()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+        return path
+
+    def _maybe_flush(self):
+        now = time.monotonic()
+        if now < self._next_flush:
+            return
+        with self._lock:
+            if now < self._next_flush:
+                return
+            self._next_flush = now + self.interval
+        self.write_snapshot()
+        with self._events_lock:
+            if self._events is not None:
+                self._events.flush()
+
+    def summary(self, top=6):
+        """One line per stage, by total time: count, share of the timed total, p50 / p95."""
+        with self._lock:
+            stages = [(dict(labels)["stage"], h) for (name, labels), h in self._histograms.items()
+                      if name == "stage_seconds"]
+        total = sum(h.sum for _, h in stages) or 1.0
+        stages.sort(key=lambda item: -item[1].sum)
+        return "\n".join(f"   {stage}: {h.count}x, {h.sum:.1f}s ({h.sum / total:.0%}), "
+                         f"p50 {h.quantile(0.5):.2f}s, p95 {h.quantile(0.95):.2f}s"
+                         for stage, h in stages[:top])
+
+    def close(self):
+        """Writes the final snapshot and closes the event log."""
+        self.write_snapshot()
+        with self._events_lock:
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+
+
+METRICS = Metrics()
@@ -0,0 +1,267 @@
+"""
+Indexed fuzzy matching of institution names across sources.
+
+The ranking workbook, the scraped tables and the API output spell names
+differently: "Christian-Albrechts-Universität zu Kiel" vs
+"Christian-Albrechts-University zu Kiel", "University Duesseldorf" vs
+"Universität Düsseldorf", "Université Côte d’Azur" vs
+"Université Côte d'Azur", "Taipei Medical University (TMU)" vs
+"Taipei Medical University". Comparing every name with every other name
+is O(N·M), so NameIndex builds an inverted index once:
+
+1. every name is canonicalized: accents (and ae/oe/ue), apostrophes, punctuation,
+   "(ABBREVIATION)" suffixes and stop words removed, and "Universität",
+   "Université", "Universidad", ... folded into "university";
+2. a character-trigram -> names index proposes candidates that share the
+   most of the query's rarest trigrams; trigrams so common that they
+   appear in a large part of the index ("uni", "ver", ...) are not indexed;
+3. only those candidates are scored: an IDF-weighted token overlap
+   averaged with the trigram Dice coefficient.
+
+An exact key (profile URL slug or Drupal nid) always wins over names, and a
+source name's "(ABBREVIATION)" is looked up among the indexed abbreviations
+before any fuzzy scoring. A fuzzy match is only "low" confidence when the
+two names carry different abbreviations or the indexed name has distinctive
+words the source name lacks.
+
+    index = NameIndex(main_names)
+    report = match_report(index, source_names)   # one row per source name
+"""
+
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from math import log
+
+import pandas as pd
+
+import normalize
+
+STOP_WORDS = {"the", "of", "de", "la", "le", "les", "des", "du", "der", "die", "zu", "di", "del", "da",
+              "do", "dos", "das", "in", "at", "and", "y", "et", "e", "und", "named", "after",
+              "della", "delle", "dello", "degli", "dei"}
+# spellings of "university" in institution names
+UNIVERSITY_WORDS = {"universitat", "universitaet", "universite", "universidad", "universidade", "universita",
+                    "universitas", "universiti", "universiteit", "universitet", "universitatea",
+                    "uniwersytet", "univerzita", "universiteti", "universitesi", "univ"}
+# letters NFKD does not decompose into ASCII
+TRANSLITERATE = str.maketrans({"ø": "o", "æ": "ae", "œ": "oe", "ß": "ss", "đ": "d", "ł": "l", "ı": "i"})
+GERMAN_DIGRAPHS_RE = re.compile(r"([aou])e")
+PARENTHESES_RE = re.compile(r"\(([^)]*)\)")
+NID_RE = re.compile(r"^\d+$")
+
+HIGH_SCORE = 0.9   # and a clear lead over the runner-up -> "high" confidence
+MIN_MARGIN = 0.05
+# share of the indexed name's token weight the source name lacks before a fuzzy
+# match is only "low": "Universidad Europea" is not necessarily "... de Madrid"
+MAX_UNMATCHED = 0.4
+
+
+def canonical_tokens(name):
+    """'Université Côte d’Azur (UCA)' -> ['university', 'cote', 'd', 'azur']."""
+    name = normalize.label(name).lower().translate(TRANSLITERATE)
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    name = PARENTHESES_RE.sub(" ", name)
+    tokens = re.findall(r"[a-z0-9]+", name)
+    tokens = ["university" if t in UNIVERSITY_WORDS else t for t in tokens if t not in STOP_WORDS]
+    # "Duesseldorf" / "Düsseldorf" -> "dusseldorf" (applied to both sides, so always consistent)
+    return [GERMAN_DIGRAPHS_RE.sub(r"\1", t) for t in tokens]
+
+
+def abbreviation(name):
+    """'Tallinn University of Technology (TalTech)' -> 'taltech', or None."""
+    match = PARENTHESES_RE.search(str(name))
+    if not match:
+        return None
+    tokens = re.findall(r"[a-z0-9]+", match.group(1).lower())
+    return " ".join(tokens) or None
+
+
+def same_abbreviation(a, b):
+    """'sku' / 'sksu' are one acronym respelled; 'itb' / 'itenas bandung' are not."""
+    if a == b:
+        return True
+    if " " in a or " " in b:
+        return False
+    short, long_ = sorted((a, b), key=len)
+    letters = iter(long_)
+    return short[0] == long_[0] and all(c in letters for c in short)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def url_key(url):
+    """Exact key for a profile URL or nid: the last path segment ('.../universities/mit' -> 'mit')."""
+    if url is None or (isinstance(url, float) and url != url):
+        return None
+    url = str(url).strip().rstrip("/")
+    if not url:
+        return None
+    return url.split("?")[0].rsplit("/", 1)[-1].lower()
+
+
+class NameIndex:
+    """
+    Inverted character-trigram index over a list of names.
+    `keys` (optional, same length) holds an exact key per name, e.g. url_key(profile_url).
+    """
+
+    def __init__(self, names, keys=None, max_posting_share=0.01, candidates=20, probes=8):
+        self.names = [str(n) for n in names]
+        self.canonical = [" ".join(canonical_tokens(n)) for n in self.names]
+        self.candidates = candidates
+        self.probes = probes
+        self._trigrams = [trigrams(c) for c in self.canonical]
+
+        # a bare abbreviation ("MIT") matches exactly, but only if no two names share it
+        aliases = defaultdict(list)
+        self._abbreviations = [abbreviation(n) for n in self.names]
+        for i, alias in enumerate(self._abbreviations):
+            if alias:
+                aliases[alias].append(i)
+        self._aliases = {alias: ids[0] for alias, ids in aliases.items() if len(ids) == 1}
+        self._exact = dict(self._aliases)
+        for i, canon in enumerate(self.canonical):
+            self._exact.setdefault(canon, i)
+        self._keys = {}
+        for i, key in enumerate(keys if keys is not None else []):
+            key = url_key(key)
+            if key:
+                self._keys.setdefault(key, i)
+
+        postings = defaultdict(list)
+        for i, grams in enumerate(self._trigrams):
+            for gram in grams:
+                postings[gram].append(i)
+        # trigrams shared by a large part of the index say nothing about identity
+        limit = max(50, int(max_posting_share * len(self.names)))
+        self._postings = {gram: ids for gram, ids in postings.items() if len(ids) <= limit}
+
+        token_counts = Counter(t for c in self.canonical for t in set(c.split()))
+        total = len(self.names) + 1
+        self._idf = {t: log(total / n) for t, n in token_counts.items()}
+        self._default_idf = log(total)
+        self._tokens = [frozenset(c.split()) for c in self.canonical]
+        self._weights = [self._weight(tokens) for tokens in self._tokens]
+
+    def _weight(self, tokens):
+        return sum(self._idf.get(t, self._default_idf) for t in tokens)
+
+    def score(self, query, i):
+        """
+        Similarity in [0, 1] between a query from _query() and indexed name
+        `i`: the mean of the trigram Dice coefficient and the IDF-weighted
+        token Dice coefficient.
+        """
+        grams, tokens, weight = query
+        other = self._trigrams[i]
+        dice = 2 * len(grams & other) / (len(grams) + len(other)) if grams and other else 0.0
+        total = weight + self._weights[i]
+        overlap = 2 * self._weight(tokens & self._tokens[i]) / total if total else 0.0
+        return (dice + overlap) / 2
+
+    def _query(self, canon):
+        tokens = frozenset(canon.split())
+        return trigrams(canon), tokens, self._weight(tokens)
+
+    def candidate_ids(self, grams):
+        """
+        Indexed names sharing the most rare trigrams with the query, best first.
+        Only the query's `probes` rarest trigrams are looked up: a true match
+        shares most of them, and common trigrams would only add noise and time.
+        """
+        lists = sorted((self._postings[g] for g in grams if g in self._postings), key=len)
+        shared = Counter()
+        for ids in lists[:self.probes]:
+            shared.update(ids)
+        return [i for i, _ in shared.most_common(self.candidates)]
+
+    def _best(self, canon):
+        query = self._query(canon)
+        scored = sorted(((self.score(query, i), i) for i in self.candidate_ids(query[0])), reverse=True)
+        if not scored:
+            return None, 0.0, 0.0
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        return scored[0][1], scored[0][0], runner_up
+
+    def match(self, name, key=None):
+        """
+        Returns (index or None, score, runner-up score, method) for one name.
+        method is 'key', 'exact', 'alias', 'fuzzy', 'slug' or 'none'.
+        """
+        key = url_key(key)
+        if key and key in self._keys:
+            return self._keys[key], 1.0, 0.0, "key"
+        canon = " ".join(canonical_tokens(name)) if name is not None and name == name else ""
+        if canon and canon in self._exact:
+            return self._exact[canon], 1.0, 0.0, "exact"
+        # 'Institut Teknologi Bandung (ITB)' -> 'Bandung Institute of Technology (ITB)'
+        alias = abbreviation(name) if canon else None
+        if alias and alias in self._aliases:
+            return self._aliases[alias], 1.0, 0.0, "alias"
+        best, score, runner_up = self._best(canon) if canon else (None, 0.0, 0.0)
+        method = "fuzzy"
+        # a profile slug ('christian-albrechts-university-zu-kiel') is a second spelling of the name
+        if key and not NID_RE.match(key):
+            slug_best, slug_score, slug_runner_up = self._best(" ".join(canonical_tokens(key.replace("-", " "))))
+            if slug_score > score:
+                best, score, runner_up, method = slug_best, slug_score, slug_runner_up, "slug"
+        return (best, score, runner_up, method) if best is not None else (None, 0.0, 0.0, "none")
+
+    def distinct(self, name, i):
+        """
+        True if `name` and indexed name `i` are likely different institutions
+        despite a fuzzy score: both carry an abbreviation and they differ
+        ('(ITB)' vs '(ITENAS Bandung)'), or at least MAX_UNMATCHED of i's token
+        weight is missing from `name` ('Universidad Europea' vs '... de Madrid').
+        """
+        alias = abbreviation(name)
+        if alias and self._abbreviations[i] and not same_abbreviation(alias, self._abbreviations[i]):
+            return True
+        missing = self._tokens[i] - frozenset(canonical_tokens(name))
+        return self._weights[i] > 0 and self._weight(missing) >= MAX_UNMATCHED * self._weights[i]
+
+
+def confidence(score, runner_up, threshold):
+    if score >= HIGH_SCORE and score - runner_up >= MIN_MARGIN:
+        return "high"
+    if score >= threshold and score - runner_up >= MIN_MARGIN:
+        return "medium"
+    return "low"
+
+
+def match_report(index, names, keys=None, threshold=0.75):
+    """
+    Matches every name (and optional exact key) against `index`. Returns a
+    DataFrame with source_name, matched_name, matched_index, score,
+    runner_up, method, confidence and accepted (confidence high or medium).
+    Fuzzy matches to a distinct institution (NameIndex.distinct) are "low".
+    """
+    keys = list(keys) if keys is not None else [None] * len(names)
+    rows = []
+    for name, key in zip(names, keys):
+        i, score, runner_up, method = index.match(name, key)
+        if method in ("key", "exact", "alias"):
+            level = "high"
+        elif i is not None and name is not None and name == name and index.distinct(name, i):
+            level = "low"
+        else:
+            level = confidence(score, runner_up, threshold)
+        rows.append({
+            "source_name": name,
+            "source_key": url_key(key),
+            "matched_name": index.names[i] if i is not None else None,
+            "matched_index": i,
+            "score": round(score, 3),
+            "runner_up": round(runner_up, 3),
+            "method": method,
+            "confidence": level,
+            "accepted": i is not None and level != "low",
+        })
+    report = pd.DataFrame(rows, columns=["source_name", "source_key", "matched_name", "matched_index", "score",
+                                         "runner_up", "method", "confidence", "accepted"])
+    report["matched_index"] = report["matched_index"].astype("Int64")
+    return report
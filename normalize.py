@@ -0,0 +1,218 @@
+"""
+Vectorized normalization of QS stat, rank and label strings.
+
+Every function takes a whole column (a pandas Series, NumPy array or list)
+and converts it in one pass with Arrow compute kernels instead of calling
+re.sub() / float() once per cell. Each column is dictionary-encoded first,
+so a value such as "801+" that repeats across hundreds of rows is parsed
+once:
+
+    counts(["11,632", "3 798", None])        -> [11632, 3798, <NA>]      (Int64)
+    percents(["45%", "9 %", 55])             -> [45.0, 9.0, 55.0]        (float64)
+    numbers(["28.3", "-"])                   -> [28.3, NaN]              (float64)
+    rank_bands(["474=", "801+", "1001-1200"])-> low / high / tie columns
+    labels(["Int’l Staff %", "Int’ l staff"])-> ["Int'l Staff %", "Int'l staff"]
+
+Values that are already numeric (e.g. read from Excel) pass through.
+
+    python normalize.py [merged_qs_rankings.csv] [--scale N] [--repeat R]
+
+benchmarks these against the per-element approach on the stat and rank
+columns of the file (optionally repeated N times).
+"""
+
+import argparse
+import re
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# apostrophe look-alikes seen in scraped labels: ’ ‘ ʼ ´ `
+APOSTROPHES = "[’‘ʼ´`]"
+RANK_RE = r"^\s*(?P<pre>=)?\s*(?P<low>\d+)\s*(?:(?P<tie>=)|(?P<plus>\+)|[-–]\s*(?P<high>\d+))?\s*$"
+NUMBER_RE = r"^[-+]?(\d+\.?\d*|\.\d+)$"
+
+
+def _series(values):
+    return values if isinstance(values, pd.Series) else pd.Series(values)
+
+
+def _distinct(values):
+    """
+    Dictionary-encodes a column as Arrow strings. Returns (distinct values,
+    indices); results computed on the distinct values are expanded back with
+    _expand().
+    """
+    strings = pa.array(_series(values).astype("string"), type=pa.string(), from_pandas=True)
+    if isinstance(strings, pa.ChunkedArray):
+        strings = strings.combine_chunks()
+    encoded = pc.dictionary_encode(pc.utf8_trim_whitespace(strings))
+    return encoded.dictionary, encoded.indices
+
+
+# Arrow -> pandas types that keep nulls without a float round trip
+PANDAS_TYPES = {pa.int32(): pd.Int32Dtype(), pa.bool_(): pd.BooleanDtype()}
+
+
+def _expand(parsed, indices, index):
+    return pd.Series(pc.take(parsed, indices).to_pandas(types_mapper=PANDAS_TYPES.get), index=index)
+
+
+def text(values):
+    """Stripped strings with blanks as NA; numbers are turned into their text form."""
+    values = _series(values).astype("string").str.strip()
+    return values.mask(values == "")
+
+
+def _to_float(values, strip):
+    values = _series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64")
+    distinct, indices = _distinct(values)
+    cleaned = pc.replace_substring_regex(distinct, strip, "")
+    valid = pc.match_substring_regex(cleaned, NUMBER_RE)
+    parsed = pc.cast(pc.if_else(valid, cleaned, pa.scalar(None, pa.string())), pa.float64())
+    return _expand(parsed, indices, values.index)
+
+
+def counts(values):
+    """Head counts with thousand separators: '11,632' / '3 798' / 11632.0 -> 11632 (nullable Int64)."""
+    values = _to_float(values, r"[,\s]").round()
+    # a digit run too long for int64 is not a head count
+    return values.mask(values.abs() >= 2 ** 63).astype("Int64")
+
+
+def percents(values):
+    """Percentages: '45%' / '9 %' / 45 -> 45.0."""
+    return _to_float(values, r"[%\s]")
+
+
+def numbers(values):
+    """Plain decimals such as scores: '28.3' -> 28.3; placeholders like '-' become NaN."""
+    return _to_float(values, r"\s")
+
+
+def rank_bands(values):
+    """
+    Splits rank strings into a DataFrame with columns:
+        low   first rank of the band ('1001-1200' -> 1001)
+        high  last rank of the band, NA when open-ended ('801+')
+        tie   True for shared ranks ('474=' or '=474')
+    Unparseable values give NA in all three columns.
+    """
+    values = _series(values)
+    distinct, indices = _distinct(values)
+    parts = pc.extract_regex(distinct, RANK_RE)
+    field = {name: pc.struct_field(parts, name) for name in ("pre", "low", "tie", "plus", "high")}
+    matched = parts.is_valid()
+
+    low = pc.cast(pc.if_else(matched, field["low"], pa.scalar(None, pa.string())), pa.int32())
+    high = pc.if_else(pc.not_equal(field["high"], ""), field["high"], pa.scalar(None, pa.string()))
+    high = pc.coalesce(pc.cast(high, pa.int32()),
+                       pc.if_else(pc.equal(field["plus"], "+"), pa.scalar(None, pa.int32()), low))
+    tie = pc.if_else(matched, pc.or_(pc.equal(field["pre"], "="), pc.equal(field["tie"], "=")),
+                     pa.scalar(None, pa.bool_()))
+    return pd.DataFrame({"low": _expand(low, indices, values.index),
+                         "high": _expand(high, indices, values.index),
+                         "tie": _expand(tie, indices, values.index)})
+
+
+def label(name):
+    """Normalizes one label or column name: straight apostrophes, single spaces."""
+    name = re.sub(APOSTROPHES, "'", str(name))
+    name = re.sub(r"'\s+(?=[a-z])", "'", name)  # "Int' l staff" -> "Int'l staff"
+    return " ".join(name.split())
+
+
+def labels(values):
+    """Vectorized label() for a column of labels."""
+    values = text(values).str.replace(APOSTROPHES, "'", regex=True)
+    values = values.str.replace(r"'\s+(?=[a-z])", "'", regex=True)
+    return values.str.replace(r"\s+", " ", regex=True)
+
+
+def normalize_columns(df):
+    """Returns `df` with normalized column names, so "Int’l Staff %" matches "Int'l Staff %"."""
+    return df.rename(columns=label)
+
+
+# --- per-element baseline, as the scrapers and merge.py used to clean values ---
+
+def _count_per_element(value):
+    digits = re.sub(r"[^\d]", "", str(value)) if pd.notna(value) else ""
+    return int(digits) if digits else None
+
+
+def _percent_per_element(value):
+    try:
+        return float(str(value).replace("%", ""))
+    except ValueError:
+        return None
+
+
+def _rank_per_element(value):
+    match = re.match(RANK_RE, str(value)) if pd.notna(value) else None
+    if not match:
+        return None
+    low = int(match["low"])
+    high = int(match["high"]) if match["high"] else (None if match["plus"] else low)
+    return low, high, bool(match["pre"] or match["tie"])
+
+
+def _best_of(fn, repeat):
+    """Returns (result, best wall time of `repeat` runs)."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def benchmark(path="merged_qs_rankings.csv", scale=1, repeat=5):
+    """Times vectorized vs per-element cleaning on the stat and rank columns of `path` (best of `repeat`)."""
+    df = pd.read_csv(path, dtype=str)
+    if scale > 1:
+        df = pd.concat([df] * scale, ignore_index=True)
+    count_cols = ["Total Students", "International Students", "Total Faculty Staff"]
+    percent_cols = ["Domestic Staff %", "Int'l Staff %"]
+    rank_cols = [c for c in df.columns if c == "Rank" or c.endswith("Rank") or c.endswith("RANK")]
+    jobs = [
+        ("counts", count_cols, counts, _count_per_element),
+        ("percents", percent_cols, percents, _percent_per_element),
+        ("rank bands", rank_cols, rank_bands, _rank_per_element),
+    ]
+
+    print(f"📊 {path}: {len(df)} rows")
+    for name, cols, vectorized, per_element in jobs:
+        slow, slow_time = _best_of(lambda: {col: df[col].map(per_element) for col in cols}, repeat)
+        fast, fast_time = _best_of(lambda: {col: vectorized(df[col]) for col in cols}, repeat)
+
+        # count cells where the two paths disagree (e.g. the digit-stripping
+        # baseline turns stray prose in a stat column into a huge number)
+        differ = 0
+        for col in cols:
+            if name == "rank bands":
+                expected = [v if isinstance(v, tuple) else (None, None, None) for v in slow[col]]
+                got = fast[col].astype(object).where(fast[col].notna(), None)
+                differ += sum(a != b for a, b in zip(got.itertuples(index=False, name=None), expected))
+            else:
+                a, b = fast[col].astype("Float64"), slow[col].astype("Float64")
+                differ += int((~((a == b).fillna(False) | (a.isna() & b.isna()))).sum())
+
+        cells = len(df) * len(cols)
+        print(f"   {name:<10} {cells:>8} cells: per-element {slow_time * 1000:8.1f} ms, "
+              f"vectorized {fast_time * 1000:7.1f} ms ({slow_time / fast_time:5.1f}x), "
+              f"{differ} cells differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark vectorized normalization.")
+    parser.add_argument("path", nargs="?", default="merged_qs_rankings.csv")
+    parser.add_argument("--scale", type=int, default=1, help="repeat the file's rows N times")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per approach (best is reported)")
+    args = parser.parse_args()
+    benchmark(args.path, args.scale, args.repeat)
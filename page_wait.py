@@ -0,0 +1,81 @@
+"""
+Event-driven waiting for lazily loaded ranking lists.
+
+Instead of sleeping a fixed 4-5 seconds after every scroll or "Load more"
+click, wait_for_new_rows() installs a MutationObserver in the page and
+returns as soon as the row count grows and settles, or when no new rows
+arrive within a quiet period (the end of the list). Every step reports how
+long it actually waited.
+"""
+
+import time
+
+# execute_async_script: arguments = selector, previous count, quiet ms, settle ms, callback
+NEW_ROWS_JS = """
+const [selector, previous, quietMs, settleMs] = arguments;
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+const count = () => document.querySelectorAll(selector).length;
+let current = count();
+let timer = null;
+let observer = null;
+
+const finish = () => {
+    if (observer) observer.disconnect();
+    clearTimeout(timer);
+    done({count: current, grew: current > previous, waited_ms: performance.now() - start});
+};
+// after the first new rows, give the rest of the batch `settleMs` to render;
+// with no new rows at all, give up after `quietMs`
+const arm = () => {
+    clearTimeout(timer);
+    timer = setTimeout(finish, current > previous ? settleMs : quietMs);
+};
+
+observer = new MutationObserver(() => {
+    const n = count();
+    if (n !== current) {
+        current = n;
+        arm();
+    }
+});
+observer.observe(document.body, {childList: true, subtree: true});
+arm();
+"""
+
+
+def wait_for_new_rows(driver, selector, previous_count, quiet=5.0, settle=0.3):
+    """
+    Blocks until the number of elements matching `selector` grows beyond
+    `previous_count` and stops changing for `settle` seconds, or until
+    `quiet` seconds pass without any new rows.
+    Returns {'count', 'grew', 'waited'} with `waited` in seconds.
+    """
+    driver.set_script_timeout(quiet + settle + 30)
+    result = driver.execute_async_script(NEW_ROWS_JS, selector, previous_count,
+                                         int(quiet * 1000), int(settle * 1000))
+    return {"count": result["count"], "grew": result["grew"], "waited": result["waited_ms"] / 1000}
+
+
+def scroll_until_loaded(driver, selector, quiet=5.0, deadline=300, log=print):
+    """
+    Scrolls to the bottom until a scroll brings no new rows within `quiet`
+    seconds or `deadline` seconds have passed overall. Returns the list of
+    per-step results from wait_for_new_rows().
+    """
+    started = time.monotonic()
+    count = len(driver.find_elements("css selector", selector))
+    steps = []
+    while time.monotonic() - started < deadline:
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        step = wait_for_new_rows(driver, selector, count, quiet=quiet)
+        steps.append(step)
+        log(f"📜 Scroll {len(steps)}: {step['count'] - count:+d} rows ({step['count']} total), "
+            f"waited {step['waited']:.2f}s")
+        if not step["grew"]:
+            break
+        count = step["count"]
+    else:
+        log(f"⚠️ Stopped scrolling after the {deadline}s deadline; the list may be incomplete.")
+    log(f"⏱️ List loading took {time.monotonic() - started:.1f}s over {len(steps)} scrolls.")
+    return steps
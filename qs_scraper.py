@@ -8,11 +8,14 @@ https://www.topuniversities.com/world-university-rankings and extracts:
 - Total faculty staff
 - Domestic staff
 
-Saves incremental CSV and final Excel.
+Progress is kept in a SQLite checkpoint journal (see checkpoint.py), so a
+restarted run picks up only the unfinished profiles. Finished rows are also
+appended to a CSV as they complete (see sinks.py). Saves a final Excel.
 """
 
+import os
 import time
-import csv
+import socket
 import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -25,20 +28,59 @@ from selenium.common.exceptions import (
     NoSuchElementException, TimeoutException, StaleElementReferenceException,
     WebDriverException
 )
+import sys
 from tqdm import tqdm
-import traceback
+
+import columnar
+import delta
+from driver_pool import DriverPool
+from metrics import METRICS
+from rate_limit import AdaptiveRateLimiter
+from retry_policy import CircuitBreaker, RetryPolicy, classify
+from page_wait import wait_for_new_rows
+from resource_policy import ResourcePolicy
+from sinks import open_sink
+from static_extract import StaticFetcher, has_stats, parse_stats_cards_html
+from stats_extract import STATS_CARD_FIELDS, stats_card_field
+from checkpoint import CheckpointJournal, DONE
 
 # ---------- CONFIG ----------
-START_INDEX = 0            # set >0 to resume from a particular row count of the link list (0 = start)
-INCREMENTAL_CSV = "qs_rankings_progress.csv"
+CHECKPOINT_DB = "qs_rankings_checkpoint.sqlite3"  # resume journal; delete it to start a fresh crawl
+WORKER_ID = socket.gethostname()  # give each worker sharing the journal its own id
+COMMIT_BATCH = 20          # URLs claimed / results committed per journal transaction
+MAX_RUN_ATTEMPTS = 3       # failed URLs are retried by later runs up to this many times
 FINAL_XLSX = "qs_rankings_full.xlsx"
+PROGRESS_CSV = "qs_rankings_progress.csv"  # finished rows are appended here as they complete
+SINK_FSYNC = "batch"       # "never", "batch" or "close"
 BASE_URL = "https://www.topuniversities.com/world-university-rankings"
 HEADLESS = False           # set True to run headless (useful on servers)
-MAX_RETRIES = 3
-DELAY_BETWEEN_OPEN = 2.5   # seconds between opening profile pages (politeness)
-LOAD_MORE_WAIT = 2         # seconds after clicking Load More
+MAX_RETRIES = 3            # tries per profile within a run for retryable errors (timeouts, network)
+NUM_WORKERS = 3            # headless browsers scraping profiles in parallel
+PAGES_PER_SECOND = 1.0     # starting profile-load rate across all workers; adapts to how the site responds
+MAX_PAGES_PER_SECOND = 4.0 # the adaptive rate never goes above this (politeness)
+USE_STATIC = True          # try plain HTTP + lxml first; browsers only for pages that need them
+STATIC_REQUESTS_PER_SECOND = 5.0       # starting rate of plain HTTP fetches; adapts like the above
+MAX_STATIC_REQUESTS_PER_SECOND = 20.0
+LOAD_MORE_QUIET = 5        # give up on a Load More click that brings no new rows within this many seconds
+LOAD_DEADLINE = 600        # seconds allowed for loading the whole listing
+DELTA_MODE = False         # set True to only revisit new/moved/renamed/stale profiles
+DELTA_SNAPSHOT = "qs_rankings_snapshot.json"
+STATS_MAX_AGE_DAYS = 30    # delta mode: revisit profiles scraped longer ago than this
+METRICS_SNAPSHOT = "qs_scraper_metrics.prom"  # stage timings and counters, rewritten during the run (.json for JSON)
+METRICS_EVENTS = "qs_scraper_events.jsonl"    # one line per timed stage and URL
 # ----------------------------
 
+# profile workers skip images, fonts, media and third-party trackers
+RESOURCE_POLICY = ResourcePolicy()
+
+# backoff per error class; the breaker pauses every worker while most profile loads fail
+RETRY_POLICY = RetryPolicy(max_attempts=MAX_RETRIES, base_delay=2.0, breaker=CircuitBreaker(name="site"),
+                           name="browser")
+
+OUTPUT_COLUMNS = ["Rank", "University", "Profile URL",
+                  "Total Students", "UG Students", "PG Students", "International Students",
+                  "Total Faculty Staff", "Domestic Staff"]
+
 def setup_driver():
     options = Options()
     if HEADLESS:
@@ -51,7 +93,7 @@ def setup_driver():
 
 def click_cookie_if_present(driver, wait):
     try:
-        cookie_btn = wait.until(EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler")), timeout=5)
+        cookie_btn = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler")))
         cookie_btn.click()
         time.sleep(1)
     except Exception:
@@ -59,17 +101,30 @@ def click_cookie_if_present(driver, wait):
         pass
 
 def load_all_rows(driver, wait, max_click_failures=5):
-    """Click 'Load more' until it disappears or cannot be clicked."""
+    """
+    Click 'Load more' until it disappears or cannot be clicked. After each
+    click, waits only until the new rows have rendered (or LOAD_MORE_QUIET
+    seconds pass without any), and stops at LOAD_DEADLINE overall.
+    """
     failures = 0
-    while True:
+    started = time.monotonic()
+    rows = len(driver.find_elements(By.CSS_SELECTOR, "div.rankings-table__row"))
+    while time.monotonic() - started < LOAD_DEADLINE:
         try:
             # attempt to find "Load more" button (class used on site)
-            load_more = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button.js-rankings-load-more")), timeout=10)
-            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", load_more)
-            time.sleep(0.5)
-            driver.execute_script("arguments[0].click();", load_more)
-            time.sleep(LOAD_MORE_WAIT)
-            failures = 0
+            load_more = WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.CSS_SELECTOR, "button.js-rankings-load-more")))
+            driver.execute_script("arguments[0].scrollIntoView({block:'center'}); arguments[0].click();", load_more)
+            step = wait_for_new_rows(driver, "div.rankings-table__row", rows, quiet=LOAD_MORE_QUIET)
+            print(f"Load more: {step['count'] - rows:+d} rows ({step['count']} total), waited {step['waited']:.2f}s")
+            rows = step["count"]
+            if step["grew"]:
+                failures = 0
+            else:
+                failures += 1
+                if failures >= max_click_failures:
+                    print("Load More keeps bringing no new rows; assuming all loaded.")
+                    break
         except TimeoutException:
             # no button found — assume all loaded
             break
@@ -80,27 +135,32 @@ def load_all_rows(driver, wait, max_click_failures=5):
             if failures >= max_click_failures:
                 print("Too many failures clicking Load More; stopping attempts.")
                 break
+    else:
+        print(f"Stopped loading rows after the {LOAD_DEADLINE}s deadline; the listing may be incomplete.")
+    print(f"Loaded {rows} rows in {time.monotonic() - started:.1f}s.")
+
+# Reads every listing row in one script evaluation: [rank, name, absolute href]
+LISTING_ROWS_JS = """
+return Array.from(document.querySelectorAll('div.rankings-table__row')).map(row => {
+    const rank = row.querySelector('.rankings-table__rank');
+    const title = row.querySelector('.rankings-table__title');
+    const a = row.querySelector('a');
+    return [rank ? rank.innerText.trim() : '', title ? title.innerText.trim() : '', a ? a.href : ''];
+});
+"""
 
 def collect_university_links(driver):
     """Return list of (rank_text, uni_name, profile_url) for all rows visible."""
-    rows = driver.find_elements(By.CSS_SELECTOR, "div.rankings-table__row")
-    links = []
-    for r in rows:
-        try:
-            rank = r.find_element(By.CSS_SELECTOR, ".rankings-table__rank").text.strip()
-        except Exception:
-            rank = ""
-        try:
-            name = r.find_element(By.CSS_SELECTOR, ".rankings-table__title").text.strip()
-        except Exception:
-            name = ""
-        try:
-            a = r.find_element(By.TAG_NAME, "a")
-            href = a.get_attribute("href")
-        except Exception:
-            href = ""
-        if href:
-            links.append((rank, name, href))
+    rows = driver.execute_script(LISTING_ROWS_JS) or []
+    links = [(rank, name, href) for rank, name, href in rows if href]
+
+    # report incomplete rows in bulk instead of one exception per row
+    no_href = len(rows) - len(links)
+    no_rank = sum(1 for rank, _, _ in links if not rank)
+    no_name = sum(1 for _, name, _ in links if not name)
+    if no_href or no_rank or no_name:
+        print(f"Listing rows: {len(rows)} total, skipped {no_href} without a link; "
+              f"{no_rank} without rank, {no_name} without name.")
     return links
 
 def extract_stats_from_profile(driver, wait):
@@ -109,18 +169,11 @@ def extract_stats_from_profile(driver, wait):
     Use robust fallback: search for title text in page as well.
     Returns dict of target fields (some may be empty strings).
     """
-    desired = {
-        "Total students": "",
-        "UG students": "",
-        "PG students": "",
-        "International students": "",
-        "Total faculty staff": "",
-        "Domestic staff": ""
-    }
+    desired = {field: "" for field in STATS_CARD_FIELDS}
 
     try:
         # Wait briefly for stats cards to appear; they may be inside X blocks
-        wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".uni-stats-card")), timeout=8)
+        WebDriverWait(driver, 8).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".uni-stats-card")))
         cards = driver.find_elements(By.CSS_SELECTOR, ".uni-stats-card")
         for c in cards:
             try:
@@ -129,19 +182,9 @@ def extract_stats_from_profile(driver, wait):
                 if not title:
                     continue
                 # Normalize title and map
-                t = title.lower()
-                if "total students" in t:
-                    desired["Total students"] = value
-                elif "ug students" in t or "undergraduate students" in t:
-                    desired["UG students"] = value
-                elif "pg students" in t or "postgraduate students" in t:
-                    desired["PG students"] = value
-                elif "international students" in t:
-                    desired["International students"] = value
-                elif "total faculty staff" in t or "faculty staff" in t:
-                    desired["Total faculty staff"] = value
-                elif "domestic staff" in t:
-                    desired["Domestic staff"] = value
+                field = stats_card_field(title)
+                if field:
+                    desired[field] = value
             except Exception:
                 continue
     except Exception:
@@ -165,107 +208,195 @@ def extract_stats_from_profile(driver, wait):
 
     return desired
 
-def append_to_csv(row, csv_path=INCREMENTAL_CSV):
-    header = ["Rank", "University", "Profile URL",
-              "Total Students", "UG Students", "PG Students", "International Students",
-              "Total Faculty Staff", "Domestic Staff"]
-    file_exists = False
-    try:
-        with open(csv_path, "r", encoding="utf-8") as fr:
-            file_exists = True
-    except FileNotFoundError:
-        file_exists = False
-
-    with open(csv_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(header)
-        writer.writerow(row)
-
-def main():
-    driver = setup_driver()
+def scrape_profile(driver, url):
+    """
+    Loads one profile in a pool worker's browser and returns its stats,
+    retried per RETRY_POLICY. Raises the last error if all attempts fail.
+    """
+    wait = WebDriverWait(driver, 15)
+
+    def attempt():
+        with METRICS.stage("navigate", url=url):
+            driver.get(url)
+        with METRICS.stage("extract", url=url):
+            stats = extract_stats_from_profile(driver, wait)
+        RESOURCE_POLICY.collect_selenium(driver)
+        return stats
+
+    return RETRY_POLICY.call(attempt, label=url)
+
+def profile_worker_driver():
+    """Profile pages are loaded by headless workers; the listing browser follows HEADLESS."""
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    ResourcePolicy.enable_chrome_logging(options)
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+    return RESOURCE_POLICY.apply_selenium(driver)
+
+def profile_row(rank_text, uni_name, url, stats):
+    """Flattens one profile's stats into a row matching OUTPUT_COLUMNS."""
+    return [
+        rank_text,
+        uni_name,
+        url,
+        stats.get("Total students", ""),
+        stats.get("UG students", ""),
+        stats.get("PG students", ""),
+        stats.get("International students", ""),
+        stats.get("Total faculty staff", ""),
+        stats.get("Domestic staff", "")
+    ]
+
+def load_listing():
+    """Opens the rankings page in a browser, loads every row and returns the (rank, name, url) links."""
+    with METRICS.stage("browser start"):
+        driver = setup_driver()
     wait = WebDriverWait(driver, 15)
-    driver.get(BASE_URL)
-    time.sleep(3)
+    with METRICS.stage("navigate", url=BASE_URL):
+        driver.get(BASE_URL)
+        time.sleep(3)
 
-    click_cookie_if_present(driver, wait)
-    time.sleep(1)
+    with METRICS.stage("popup", url=BASE_URL):
+        click_cookie_if_present(driver, wait)
+        time.sleep(1)
 
     print("Loading all rows (this may take a while)...")
-    load_all_rows(driver, wait)
+    with METRICS.stage("listing", url=BASE_URL):
+        load_all_rows(driver, wait)
 
     # Collect all links
     links = collect_university_links(driver)
     print(f"Collected {len(links)} university links.")
 
-    # If you are resuming, skip to START_INDEX
-    total_links = len(links)
-    if START_INDEX >= total_links:
-        print("START_INDEX >= total links. Nothing to do.")
-        driver.quit()
-        return
-
-    # Iterate through links and extract
-    for idx in tqdm(range(START_INDEX, total_links), desc="Universities"):
-        rank_text, uni_name, url = links[idx]
-        # Retry logic for each profile
-        success = False
-        for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                # open profile in a new tab
-                driver.execute_script("window.open(arguments[0]);", url)
-                driver.switch_to.window(driver.window_handles[-1])
-                time.sleep(DELAY_BETWEEN_OPEN)  # politeness
-
-                stats = extract_stats_from_profile(driver, wait)
-
-                row = [
-                    rank_text,
-                    uni_name,
-                    url,
-                    stats.get("Total students", ""),
-                    stats.get("UG students", ""),
-                    stats.get("PG students", ""),
-                    stats.get("International students", ""),
-                    stats.get("Total faculty staff", ""),
-                    stats.get("Domestic staff", "")
-                ]
-                append_to_csv(row)
-                success = True
-
-                # close tab and return
-                driver.close()
-                driver.switch_to.window(driver.window_handles[0])
-
-                # short sleep to avoid hammering
-                time.sleep(1)
+    # The listing browser is no longer needed; profiles go to the worker pool
+    driver.quit()
+    return links
+
+def main(redrive=False):
+    """
+    Scrapes every profile in the listing. With `redrive`, only the profiles
+    that failed in earlier runs are scraped again (with a fresh attempt
+    budget); finished rows in the journal and the delta snapshot are kept.
+    """
+    METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
+    journal = CheckpointJournal(CHECKPOINT_DB, worker_id=WORKER_ID, batch_size=COMMIT_BATCH,
+                                max_attempts=MAX_RUN_ATTEMPTS)
+    snapshot = {}
+    if redrive:
+        redriven = set(journal.redrive())
+        print(f"Re-driving {len(redriven)} failed profiles from {CHECKPOINT_DB}.")
+        if DELTA_MODE:
+            # the export is rebuilt in the current ranking order, so the listing is still needed
+            listing = [delta.listing_item(url, name, rank_text, url) for rank_text, name, url in load_listing()]
+            snapshot = delta.load_snapshot(DELTA_SNAPSHOT)
+            to_fetch = [it for it in listing if it["url"] in redriven]
+    else:
+        links = load_listing()
+
+        # Queue every link in the journal; URLs finished by an earlier run stay done,
+        # so a restart only visits the unfinished ones.
+        if DELTA_MODE:
+            # Delta mode: keyed by profile URL, only revisit what changed since the last run
+            listing = [delta.listing_item(url, name, rank_text, url) for rank_text, name, url in links]
+            snapshot = delta.load_snapshot(DELTA_SNAPSHOT)
+            to_fetch, reasons = delta.plan_delta(listing, snapshot, STATS_MAX_AGE_DAYS)
+            print(f"Delta mode: {delta.describe(reasons)}")
+            # only changed profiles are scraped again; rows finished since the last
+            # snapshot belong to an interrupted delta run and are kept
+            snapshot_time = os.path.getmtime(DELTA_SNAPSHOT) if os.path.exists(DELTA_SNAPSHOT) else 0
+            journal.enqueue([(it["rank"], it["title"], it["url"]) for it in to_fetch],
+                            requeue_finished_before=snapshot_time)
+        else:
+            journal.enqueue(links)
+    recovered = journal.requeue_own()
+    if recovered:
+        print(f"Recovered {recovered} URLs left in progress by an earlier run.")
+    print(f"Journal: {journal.counts()}")
+
+    # Claim unfinished links in batches and scrape them with NUM_WORKERS browsers
+    progress = tqdm(total=journal.unfinished(), desc="Universities")
+    page_rate = AdaptiveRateLimiter(PAGES_PER_SECOND, max_rate=MAX_PAGES_PER_SECOND, name="browser")
+    static_rate = AdaptiveRateLimiter(STATIC_REQUESTS_PER_SECOND, max_rate=MAX_STATIC_REQUESTS_PER_SECOND, name="static")
+    pool = DriverPool(profile_worker_driver, NUM_WORKERS, rate_limiter=page_rate)
+    fetcher = StaticFetcher(rate_limiter=static_rate)
+    static_hits = 0
+    sink = open_sink(PROGRESS_CSV, OUTPUT_COLUMNS, batch_size=COMMIT_BATCH, fsync=SINK_FSYNC, append=True)
+    with pool, sink:
+        while True:
+            batch = journal.claim(COMMIT_BATCH * NUM_WORKERS)
+            if not batch:
                 break
-            except (WebDriverException, Exception) as e:
-                print(f"Attempt {attempt} failed for {uni_name}: {e}")
-                traceback.print_exc()
-                # close any extra tabs if open
+            urls = [entry["url"] for entry in batch]
+            if USE_STATIC:
+                static_stats = fetcher.extract_many(urls, lambda html, url: parse_stats_cards_html(html))
+            else:
+                static_stats = [None] * len(urls)
+            # only pages whose static HTML lacks the stats go to a browser
+            futures = [None if has_stats(stats) else pool.submit(scrape_profile, url)
+                       for url, stats in zip(urls, static_stats)]
+            # results are recorded in claim (ranking) order
+            for entry, stats, future in zip(batch, static_stats, futures):
                 try:
-                    while len(driver.window_handles) > 1:
-                        driver.switch_to.window(driver.window_handles[-1])
-                        driver.close()
-                    driver.switch_to.window(driver.window_handles[0])
-                except Exception:
-                    pass
-                time.sleep(2 * attempt)
-        if not success:
-            # write an empty row indicating failure
-            print(f"Failed to scrape {uni_name} after {MAX_RETRIES} attempts. Writing blank row.")
-            append_to_csv([rank_text, uni_name, url, "", "", "", "", "", ""])
+                    if future is None:
+                        static_hits += 1
+                    else:
+                        stats = future.result()
+                    journal.mark_done(entry["url"], stats)
+                    sink.write(dict(zip(OUTPUT_COLUMNS, profile_row(entry["rank"], entry["name"], entry["url"], stats))))
+                    METRICS.count("pages", source="static" if future is None else "browser")
+                except Exception as e:
+                    # recorded as failed; the next run retries it until MAX_RUN_ATTEMPTS,
+                    # after that only a --redrive run does
+                    error_class = getattr(e, "error_class", None) or classify(e)
+                    print(f"Failed to scrape {entry['name']} after {getattr(e, 'attempts', 1)} attempts "
+                          f"({error_class}: {e}). Marked as failed.")
+                    journal.mark_failed(entry["url"], f"{error_class}: {e}")
+                    METRICS.count("failures", source="browser", error_class=error_class)
+                progress.update(1)
+    progress.close()
+    fetcher.close()
+    journal.flush()
+    print(f"{static_hits} profiles were read from static HTML without a browser.")
+    print(f"Journal: {journal.counts()}")
+    dead_letters = journal.dead_letters()
+    if dead_letters:
+        print(f"{len(dead_letters)} profiles failed in {MAX_RUN_ATTEMPTS} runs; "
+              f"run 'python qs_scraper.py --redrive' to retry them.")
+    print(f"Resource policy: {RESOURCE_POLICY.summary()}")
+    print(f"Rate: browsers {page_rate.summary()}; static {static_rate.summary()}")
 
     # finished: create final Excel
     try:
-        df = pd.read_csv(INCREMENTAL_CSV)
-        df.to_excel(FINAL_XLSX, index=False)
+        if DELTA_MODE:
+            to_fetch_by_url = {it["url"]: it for it in to_fetch}
+            # profiles re-driven from an earlier delta run are not in its enqueue
+            for rank_text, uni_name, url, state, stats in journal.results(latest=False):
+                if state == DONE and url in to_fetch_by_url:
+                    delta.update_snapshot(snapshot, to_fetch_by_url[url], profile_row(rank_text, uni_name, url, stats))
+            delta.save_snapshot(DELTA_SNAPSHOT, snapshot)
+            # previous rows for unchanged profiles + fresh rows, in ranking order
+            rows = delta.merge_records(listing, snapshot,
+                                       fallback=lambda it: [it["rank"], it["title"], it["url"]] + [""] * 6)
+        else:
+            # failed profiles are exported as blank rows, as before; profiles
+            # that are no longer in the listing are left out
+            rows = [profile_row(rank_text, uni_name, url, stats)
+                    for rank_text, uni_name, url, state, stats in journal.results()]
+        df = pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+        with METRICS.stage("save", url=FINAL_XLSX):
+            df.to_excel(FINAL_XLSX, index=False)
+            typed = columnar.write_parquet(df, columnar.parquet_path(FINAL_XLSX))
         print(f"Saved final Excel to {FINAL_XLSX}")
+        print(f"Saved typed copy to {typed}")
     except Exception as e:
         print("Could not write final Excel:", e)
 
-    driver.quit()
+    journal.close()
+    print(f"Time by stage:\n{METRICS.summary()}")
+    METRICS.close()
+    print(f"Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
 
 if __name__ == "__main__":
-    main()
+    main(redrive="--redrive" in sys.argv[1:])
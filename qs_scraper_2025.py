@@ -185,144 +185,387 @@ import math
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import pandas as pd
 import time
-import random
 
+import columnar
+import delta
+import embedded_state
+from api_scraper import DETAIL_URL
+from metrics import METRICS
+from rate_limit import AdaptiveRateLimiter, retry_after_seconds
+from retry_policy import CircuitBreaker, DeadLetterQueue, HTTPStatusError, RetryPolicy
+from resource_policy import ResourcePolicy
+from sinks import open_sink, read_sink
 
-async def scrape_qs(total=1503, per_page=150, headless=True):
-    base = "https://www.topuniversities.com/world-university-rankings"
-    num_pages = math.ceil(total / per_page)  # e.g. 1503 / 150 -> 11 pages (0..10)
-    uni_urls = []
-    results = []
+LISTING_LINKS_JS = """
+    () => {
+        const all = Array.from(document.querySelectorAll("a[href*='/universities/']"));
+        // prefer anchors inside listing rows if possible (heuristic)
+        const filtered = all.filter(a => a.closest('.views-row') || a.closest('[class*="ranking"]') || a.closest('.qs-rankings') || a.closest('.uni-listing'));
+        const source = filtered.length ? filtered : all;
+        const seen = new Set();
+        const entries = [];
+        for (const a of source) {
+            const h = a.getAttribute('href');
+            if (!h) continue;
+            // absolute, root-relative or relative path
+            const href = h.startsWith('http') ? h : h.startsWith('/') ? location.origin + h : new URL(h, location.href).href;
+            // dedupe preserving order
+            if (seen.has(href)) continue;
+            seen.add(href);
+            // rank and name as shown in the listing row, when the link is inside one
+            const row = a.closest('.rankings-table__row, .views-row');
+            const rank = row && row.querySelector('.rankings-table__rank');
+            const title = row && row.querySelector('.rankings-table__title');
+            entries.push([href, rank ? rank.innerText.trim() : '', title ? title.innerText.trim() : '']);
+        }
+        return entries;
+    }
+"""
 
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=headless)
-        # use a context so we can open new tabs without losing listing page
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36"
-        )
-        page = await context.new_page()
 
-        # 1) collect profile URLs from each listing page
-        for page_idx in range(num_pages):
-            listing_url = f"{base}?items_per_page={per_page}&page={page_idx}"
-            print(f"[Listing] Loading page {page_idx + 1}/{num_pages}: {listing_url}")
-            try:
-                await page.goto(listing_url, timeout=60000)
-            except Exception as e:
-                print("  goto failed:", e)
-                continue
+async def get_by_label(p, label):
+    el = await p.query_selector(f"text={label}")
+    if not el:
+        return None
+    try:
+        sib = await el.evaluate_handle("e => e.nextElementSibling")
+        if not sib:
+            return None
+        txt = await sib.text_content()
+        return txt.strip() if txt else None
+    except Exception:
+        return None
+
 
+async def collect_listing_page(context, listing_url, label, policy, limiter=None):
+    """
+    Opens one listing page in its own tab and returns its (profile URL, rank,
+    name) entries in page order; rank and name are '' where the link is not
+    in a ranking row. The page's response is reported to `limiter`.
+    """
+    page = await context.new_page()
+    page_stats = await policy.apply_playwright(page)
+    try:
+        print(f"[Listing] Loading page {label}: {listing_url}")
+        try:
+            started = time.monotonic()
+            with METRICS.stage("navigate", url=listing_url):
+                response = await page.goto(listing_url, timeout=60000)
+            if limiter and response:
+                limiter.observe_response(response, time.monotonic() - started)
+        except Exception as e:
+            print("  goto failed:", e)
+            if limiter:
+                limiter.observe(error=True)
+            return []
+
+        with METRICS.stage("listing", url=listing_url):
             # wait for at least one university link to appear
             try:
                 await page.wait_for_selector("a[href*='/universities/']", timeout=20000)
             except PlaywrightTimeoutError:
-                print("  no anchors found on listing page", page_idx)
+                print("  no anchors found on listing page", label)
 
             # scroll a bit to ensure lazy loaded items appear
             for _ in range(8):
                 await page.mouse.wheel(0, 1000)
                 await page.wait_for_timeout(300)
 
-            # use page.evaluate to collect hrefs (normalized to absolute)
-            urls = await page.evaluate("""
-                () => {
-                    const all = Array.from(document.querySelectorAll("a[href*='/universities/']"));
-                    // prefer anchors inside listing rows if possible (heuristic)
-                    const filtered = all.filter(a => a.closest('.views-row') || a.closest('[class*="ranking"]') || a.closest('.qs-rankings') || a.closest('.uni-listing'));
-                    const source = filtered.length ? filtered : all;
-                    const hrefs = source.map(a => {
-                        const h = a.getAttribute('href');
-                        if (!h) return null;
-                        if (h.startsWith('http')) return h;
-                        if (h.startsWith('/')) return location.origin + h;
-                        // relative path fallback
-                        return new URL(h, location.href).href;
-                    }).filter(Boolean);
-                    // dedupe preserving order
-                    return Array.from(new Set(hrefs));
-                }
-            """)
-            print(f"  found {len(urls)} anchors (listing page {page_idx + 1})")
-            uni_urls.extend(urls)
-
-            # small polite random wait
-            await page.wait_for_timeout(500 + random.randint(200, 800))
+            # use page.evaluate to collect hrefs (normalized to absolute) with their rows' rank and name
+            entries = await page.evaluate(LISTING_LINKS_JS)
+        print(f"  found {len(entries)} anchors (listing page {label})")
+        return entries
+    finally:
+        await page.close()
+        policy.add_page(page_stats)
+
+
+async def scrape_profile_from_state(context, url, limiter=None):
+    """
+    Reads the stats from the profile's embedded JSON, or from the institution
+    endpoint the page loads them from, without rendering the page. Returns
+    None when neither source has them, so the caller can use the DOM path.
+    Responses are reported to `limiter`.
+    """
+    try:
+        started = time.monotonic()
+        with METRICS.stage("state fetch", url=url):
+            response = await context.request.get(url, timeout=60000)
+            page_html = await response.text() if response.ok else None
+        if limiter:
+            limiter.observe_response(response, time.monotonic() - started)
+        if page_html is None:
+            return None
+        METRICS.count("bytes", len(page_html.encode("utf-8")), source="state")
+
+        stats = None
+        for blob in embedded_state.embedded_json_blobs(page_html):
+            stats = embedded_state.find_stats(blob)
+            if stats:
+                break
+        if not stats:
+            nid = embedded_state.find_nid(page_html)
+            if not nid:
+                return None
+            started = time.monotonic()
+            with METRICS.stage("detail", url=DETAIL_URL.format(nid)):
+                api_response = await context.request.get(DETAIL_URL.format(nid), timeout=30000)
+                payload = await api_response.json() if api_response.ok else None
+            if limiter:
+                limiter.observe_response(api_response, time.monotonic() - started)
+            if payload is None:
+                return None
+            stats = embedded_state.find_stats(payload)
+        if not stats:
+            return None
+
+        record = embedded_state.to_record(stats, embedded_state.page_title(page_html) or url)
+        return record if embedded_state.has_values(record) else None
+    except Exception as e:
+        print("  Embedded-state extraction failed for", url, "-", e)
+        if limiter:
+            limiter.observe(error=True)
+        return None
+
+
+async def scrape_profile(context, url, policy, limiter=None):
+    """
+    Scrapes the students & staff figures from one rendered profile page.
+    Raises on failure (HTTPStatusError for an error status), so the caller
+    can retry. The page's response is reported to `limiter`.
+    """
+    profile = await context.new_page()
+    page_stats = await policy.apply_playwright(profile)
+    try:
+        started = time.monotonic()
+        with METRICS.stage("navigate", url=url):
+            response = await profile.goto(url, timeout=60000)
+        if limiter and response:
+            limiter.observe_response(response, time.monotonic() - started)
+        if response and response.status >= 400:
+            raise HTTPStatusError(response.status, url, retry_after_seconds(response.headers))
+        with METRICS.stage("wait", url=url):
+            await profile.wait_for_load_state("networkidle")
+            await profile.wait_for_timeout(1000)  # small wait for dynamic content
+
+        # try to click Students & Staff tab if it exists
+        try:
+            with METRICS.stage("tab click", url=url):
+                # try a couple of selectors: direct href, visible text, or aria
+                tab = await profile.query_selector("a[href*='students-staff']")
+                if not tab:
+                    tab = await profile.query_selector("text='Students & staff'")
+                if not tab:
+                    tab = await profile.query_selector("text=Students & staff")
+                if tab:
+                    await tab.click()
+                    await profile.wait_for_timeout(900)
+        except Exception:
+            pass
+
+        with METRICS.stage("extract", url=url):
+            uni_name = (await profile.text_content("h1")) or url
+            total_students = await get_by_label(profile, "Total students")
+            intl_students = await get_by_label(profile, "International students")
+            faculty_staff = await get_by_label(profile, "Total faculty staff")
+            dom_staff_pct = await get_by_label(profile, "Domestic staff")
+            int_staff_pct = await get_by_label(profile, "Int'l staff") or await get_by_label(profile,
+                                                                                             "Int’ l staff")
+
+        return {
+            "University": uni_name.strip() if uni_name else url,
+            "Total Students": (total_students or "").strip(),
+            "International Students": (intl_students or "").strip(),
+            "Total Faculty Staff": (faculty_staff or "").strip(),
+            "Domestic Staff %": (dom_staff_pct or "").strip(),
+            "Int'l Staff %": (int_staff_pct or "").strip()
+        }
+    except Exception as e:
+        if limiter and not isinstance(e, HTTPStatusError):
+            limiter.observe(error=True)
+        raise
+    finally:
+        await profile.close()
+        policy.add_page(page_stats)
+
+
+BASE_URL = "https://www.topuniversities.com/world-university-rankings"
+
+# columns of the streamed results file; URL is only used to restore listing order
+RESULT_COLUMNS = ["University", "Total Students", "International Students", "Total Faculty Staff",
+                  "Domestic Staff %", "Int'l Staff %", "URL"]
+
+
+async def scrape_qs(total=1503, per_page=150, headless=True, delta_mode=False,
+                    snapshot_path="qs_table_snapshot.json", max_age_days=30,
+                    concurrency=4, requests_per_second=2.0, max_requests_per_second=8.0,
+                    resource_policy=None, use_embedded_state=True,
+                    results_path="qs_table_results.csv", sink_batch=50, sink_fsync="batch",
+                    metrics_snapshot="qs_table_metrics.prom", metrics_events="qs_table_events.jsonl",
+                    max_attempts=3, dead_letters_path="qs_table_dead_letters.sqlite3", redrive=False):
+    """
+    Collects profile URLs from the ranking listing pages and scrapes the
+    students & staff figures from every profile.
+
+    Up to `concurrency` pages (listing or profile) are open at once in the
+    shared browser context, and page loads start at `requests_per_second`
+    overall; the rate then adapts to the site (up while responses are fast
+    and healthy, down on 429/403/5xx, errors or slow pages, pausing for
+    Retry-After), up to `max_requests_per_second`. Results keep the order of the URL list.
+    Every page goes through `resource_policy` (by default images, fonts,
+    media and third-party trackers are blocked).
+
+    With `use_embedded_state`, each profile is first read from its embedded
+    JSON / institution endpoint; the tab-clicking DOM extractor only runs for
+    profiles where that yields nothing.
+
+    Each record is written to `results_path` (.csv or .jsonl) as soon as it
+    is scraped, in batches of `sink_batch` with the given fsync policy, so
+    an interrupted run keeps everything scraped so far.
+
+    With `delta_mode`, only profiles that are new, moved in the listing or
+    were scraped more than `max_age_days` ago are visited; the rest are
+    taken from the snapshot of the previous run.
+
+    Stage timings and counters are kept in `metrics_snapshot` (Prometheus
+    text, or JSON for a .json path) during the run, with one JSONL line per
+    timed stage and URL in `metrics_events` (see metrics.py).
+
+    A rendered profile that fails is retried up to `max_attempts` times with
+    backoff per error class, and the whole crawl pauses while most profiles
+    fail (see retry_policy.py). What still fails goes to the dead-letter
+    queue at `dead_letters_path`; with `redrive`, only those profiles are
+    scraped again, appended to `results_path`, and the export keeps every
+    earlier row.
+    """
+    METRICS.configure(metrics_snapshot, metrics_events)
+    base = BASE_URL
+    num_pages = math.ceil(total / per_page)  # e.g. 1503 / 150 -> 11 pages (0..10)
+    entries = []
+
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limit = AdaptiveRateLimiter(requests_per_second, max_rate=max_requests_per_second, name="qs_table")
+    policy = resource_policy or ResourcePolicy()
+    retry = RetryPolicy(max_attempts=max_attempts, base_delay=2.0, breaker=CircuitBreaker(name="site"),
+                        name="qs_table")
+    dead_letters = DeadLetterQueue(dead_letters_path)
+
+    async def bounded(coro_fn, *args):
+        async with semaphore:
+            await rate_limit.acquire_async()
+            return await coro_fn(*args)
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=headless)
+        # use a context so we can open new tabs without losing listing page
+        context = await browser.new_context(
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36"
+        )
+
+        # 1) collect profile URLs from all listing pages in parallel; gather() keeps page order
+        listing_pages = await asyncio.gather(*(
+            bounded(collect_listing_page, context, f"{base}?items_per_page={per_page}&page={page_idx}",
+                    f"{page_idx + 1}/{num_pages}", policy, rate_limit)
+            for page_idx in range(num_pages)
+        ))
+        for page_entries in listing_pages:
+            entries.extend(page_entries)
 
         # dedupe across pages and limit to total
-        uni_urls = list(dict.fromkeys(uni_urls))[:total]
+        first = {}
+        for url, rank, title in entries:
+            first.setdefault(url, (url, rank, title))
+        entries = list(first.values())[:total]
+        uni_urls = [url for url, _, _ in entries]
         print("Total unique university URLs collected:", len(uni_urls))
         if len(uni_urls) < total:
             print(
                 "Warning: collected fewer URLs than requested. You may need to increase scrolling/waiting or check page structure.")
 
-        # 2) Visit each profile page and scrape details
-        for idx, url in enumerate(uni_urls, start=1):
-            print(f"[{idx}/{len(uni_urls)}] Scraping: {url}")
-            profile = await context.new_page()
-            try:
-                await profile.goto(url, timeout=60000)
-                await profile.wait_for_load_state("networkidle")
-                await profile.wait_for_timeout(1000)  # small wait for dynamic content
+        # keyed by URL with the rank shown in the listing: a new institution does not
+        # shift every row below it, only rows whose own rank changed are refetched
+        listing = [delta.listing_item(url, title, rank, url) for url, rank, title in entries]
+        snapshot = delta.load_snapshot(snapshot_path) if delta_mode else {}
+        if redrive:
+            failed = {entry["url"] for entry in dead_letters.entries()}
+            to_fetch = [item for item in listing if item["url"] in failed]
+            print(f"Re-driving {len(to_fetch)} dead letters ({len(failed) - len(to_fetch)} no longer listed)")
+        else:
+            to_fetch, reasons = delta.plan_delta(listing, snapshot, max_age_days)
+            if delta_mode:
+                print("Delta mode:", delta.describe(reasons))
+
+        # 2) Visit the profile pages, `concurrency` at a time, streaming records to the sink
+        done = 0
+        from_state = 0
+        sink = open_sink(results_path, RESULT_COLUMNS, batch_size=sink_batch, fsync=sink_fsync, append=redrive)
 
-                # try to click Students & Staff tab if it exists
+        async def scrape_one(item):
+            nonlocal done, from_state
+            record = None
+            if use_embedded_state:
+                record = await bounded(scrape_profile_from_state, context, item["url"], rate_limit)
+                from_state += record is not None
+            if record is None:
+                source = "browser"
                 try:
-                    # try a couple of selectors: direct href, visible text, or aria
-                    tab = await profile.query_selector("a[href*='students-staff']")
-                    if not tab:
-                        tab = await profile.query_selector("text='Students & staff'")
-                    if not tab:
-                        tab = await profile.query_selector("text=Students & staff")
-                    if tab:
-                        await tab.click()
-                        await profile.wait_for_timeout(900)
-                except Exception:
-                    pass
-
-                async def get_by_label(p, label):
-                    el = await p.query_selector(f"text={label}")
-                    if not el:
-                        return None
-                    try:
-                        sib = await el.evaluate_handle("e => e.nextElementSibling")
-                        if not sib:
-                            return None
-                        txt = await sib.text_content()
-                        return txt.strip() if txt else None
-                    except Exception:
-                        return None
-
-                uni_name = (await profile.text_content("h1")) or url
-                total_students = await get_by_label(profile, "Total students")
-                intl_students = await get_by_label(profile, "International students")
-                faculty_staff = await get_by_label(profile, "Total faculty staff")
-                dom_staff_pct = await get_by_label(profile, "Domestic staff")
-                int_staff_pct = await get_by_label(profile, "Int'l staff") or await get_by_label(profile,
-                                                                                                 "Int’ l staff")
-
-                results.append({
-                    "University": uni_name.strip() if uni_name else url,
-                    "Total Students": (total_students or "").strip(),
-                    "International Students": (intl_students or "").strip(),
-                    "Total Faculty Staff": (faculty_staff or "").strip(),
-                    "Domestic Staff %": (dom_staff_pct or "").strip(),
-                    "Int'l Staff %": (int_staff_pct or "").strip()
-                })
-
-            except Exception as e:
-                print("  Failed to scrape", url, "-", e)
-            finally:
-                await profile.close()
-                # polite pause every few requests
-                if idx % 10 == 0:
-                    await asyncio.sleep(1 + random.random() * 2)
+                    # every attempt waits for its own slot and rate-limit token
+                    record = await retry.call_async(bounded, scrape_profile, context, item["url"], policy,
+                                                    rate_limit, label=item["url"])
+                except Exception as e:
+                    print("  Failed to scrape", item["url"], "-", e)
+                    dead_letters.add(item["url"], e, url=item["url"])
+            else:
+                source = "state"
+            if record:
+                sink.write({**record, "URL": item["url"]})
+                delta.update_snapshot(snapshot, item, record)
+                dead_letters.resolve(item["url"])
+                METRICS.count("pages", source=source)
+            else:
+                METRICS.count("failures", source=source)
+            done += 1
+            print(f"[{done}/{len(to_fetch)}] Scraped: {item['url']}")
+
+        try:
+            await asyncio.gather(*(scrape_one(item) for item in to_fetch))
+        finally:
+            sink.close()
+        print(f"Streamed {sink.written} records to {results_path}")
+        if use_embedded_state:
+            print(f"{from_state}/{len(to_fetch)} profiles read from embedded state; "
+                  f"{len(to_fetch) - from_state} needed the DOM extractor.")
 
         await browser.close()
 
+    print("Resource policy:", policy.summary())
+    print("Rate:", rate_limit.summary())
+    if len(dead_letters):
+        print(f"Dead letters: {dead_letters.counts()} in {dead_letters_path} (scrape_qs(redrive=True) retries them)")
+    dead_letters.close()
+
+    if delta_mode:
+        delta.save_snapshot(snapshot_path, snapshot)
+        # fresh records plus the previous ones for unchanged profiles, in listing order
+        df = pd.DataFrame(delta.merge_records(listing, snapshot))
+    else:
+        # records were written in completion order; put them back in listing order
+        position = {url: i for i, url in enumerate(uni_urls)}
+        df = read_sink(results_path)
+        if redrive:
+            # re-driven rows were appended to the previous run's; keep the latest row per profile
+            df = df.drop_duplicates("URL", keep="last")
+        df = df.sort_values("URL", key=lambda urls: urls.map(position), kind="stable").drop(columns="URL")
+
     # 3) save
-    df = pd.DataFrame(results)
-    df.to_excel(f"qs_table_{len(results)}.xlsx", index=False)
-    print("Done. Saved to qs_table_{}.xlsx".format(len(results)))
+    filename = f"qs_table_{len(df)}.xlsx"
+    with METRICS.stage("save", url=filename):
+        df.to_excel(filename, index=False)
+        columnar.write_parquet(df, columnar.parquet_path(filename))
+    print("Done. Saved to {} (typed copy: {})".format(filename, columnar.parquet_path(filename)))
+    print("Time by stage:\n" + METRICS.summary())
+    METRICS.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(scrape_qs(total=1503, per_page=150, headless=True))
+    asyncio.run(scrape_qs(total=1503, per_page=150, headless=True, concurrency=4))
@@ -0,0 +1,192 @@
+import asyncio
+import email.utils
+import threading
+import time
+from datetime import datetime, timezone
+
+from metrics import METRICS
+
+
+class TokenBucket:
+    """
+    A thread-safe token-bucket rate limiter.
+
+    `rate` tokens are added every second up to `burst`; every request takes one
+    token and waits when the bucket is empty. It replaces the fixed
+    `time.sleep()` politeness pauses so that a pool of workers can share a
+    single request budget instead of each sleeping on its own.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def _reserve(self):
+        """Takes a token and returns how long the caller must wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Blocks the calling thread until a token is available."""
+        delay = self._reserve()
+        METRICS.observe("rate_limit_wait_seconds", delay)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """Same as acquire() but yields to the event loop while waiting."""
+        delay = self._reserve()
+        METRICS.observe("rate_limit_wait_seconds", delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def observe(self, status=None, latency=None, retry_after=None, error=False):
+        """Feedback about one response; a fixed-rate bucket ignores it (see AdaptiveRateLimiter)."""
+
+    def observe_response(self, response, latency=None):
+        """
+        observe() for a requests, Playwright or cached response: its status,
+        Retry-After header and, unless given, its elapsed time.
+        """
+        status = getattr(response, "status_code", None) or getattr(response, "status", None)
+        if latency is None and getattr(response, "elapsed", None) is not None:
+            latency = response.elapsed.total_seconds()
+        self.observe(status, latency, retry_after_seconds(getattr(response, "headers", None)))
+
+
+# answers that mean "slow down": rate limited or blocked
+THROTTLE_STATUSES = {403, 429}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After value (delta-seconds or HTTP date), or None."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_after_seconds(headers):
+    """Retry-After from a headers mapping (requests' are case-insensitive, Playwright's lower-case)."""
+    if not headers:
+        return None
+    return parse_retry_after(headers.get("Retry-After") or headers.get("retry-after"))
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    A TokenBucket whose rate follows the server (AIMD).
+
+    Every healthy response raises the rate a little, so that it grows by
+    `increase` requests/s per second of traffic, up to `max_rate`. A 429,
+    403, 5xx, network error or latency spike (more than `latency_factor`
+    times the running average of healthy responses) multiplies it by
+    `decrease`, down to `min_rate`; responses arriving within `cooldown`
+    seconds of a cut count as the same overload and do not cut again. A
+    Retry-After header pauses every caller for that long (at most
+    `max_pause` seconds).
+
+    Callers report each response with observe() / observe_response(); the
+    waiting side (acquire(), acquire_async()) is the same as TokenBucket's,
+    so it drops in wherever a TokenBucket is used. The current rate is
+    published as the rate_limit_rate gauge.
+    """
+
+    def __init__(self, rate, min_rate=None, max_rate=None, increase=None, decrease=0.5,
+                 latency_factor=3.0, warmup=10, cooldown=1.0, max_pause=300.0, name="requests"):
+        self.min_rate = float(min_rate if min_rate is not None else rate / 20)
+        self.max_rate = float(max_rate if max_rate is not None else rate * 4)
+        super().__init__(min(max(rate, self.min_rate), self.max_rate))
+        self.increase = float(increase if increase is not None else rate / 10)
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.name = name
+        self.stats = {"cuts": 0, "pauses": 0, "peak": self.rate}
+        self._baseline = None
+        self._healthy = 0
+        self._last_cut = float("-inf")
+        self._paused_until = 0.0
+        METRICS.gauge("rate_limit_rate", self.rate, limiter=name)
+
+    def _set_rate(self, rate, now):
+        self._refill(now)
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self._tokens = min(self._tokens, self.burst)
+        self.stats["peak"] = max(self.stats["peak"], rate)
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            delay = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(delay, self._paused_until - now)
+
+    def _is_spike(self, latency):
+        return (self.latency_factor is not None and self._healthy >= self.warmup
+                and latency > self.latency_factor * self._baseline)
+
+    def observe(self, status=None, latency=None, retry_after=None, error=False):
+        throttled = error or status in THROTTLE_STATUSES or (status is not None and status >= 500)
+        reason = None
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + min(retry_after, self.max_pause))
+                self.stats["pauses"] += 1
+            if not throttled and latency is not None and self._is_spike(latency):
+                reason = "latency"
+            elif throttled:
+                reason = "error" if error or status is None else str(status)
+            if reason:
+                if now - self._last_cut >= self.cooldown:
+                    self._last_cut = now
+                    self.stats["cuts"] += 1
+                    self._set_rate(max(self.min_rate, self.rate * self.decrease), now)
+                else:
+                    reason = None
+            else:
+                if latency is not None:
+                    self._baseline = latency if self._baseline is None else 0.9 * self._baseline + 0.1 * latency
+                    self._healthy += 1
+                if now >= self._paused_until:
+                    self._set_rate(min(self.max_rate, self.rate + self.increase / self.rate), now)
+            rate = self.rate
+        if reason:
+            METRICS.count("throttled", limiter=self.name, reason=reason)
+        METRICS.gauge("rate_limit_rate", rate, limiter=self.name)
+
+    def summary(self):
+        s = self.stats
+        return (f"{self.rate:.2f}/s now (peak {s['peak']:.2f}/s, range {self.min_rate:g}-{self.max_rate:g}), "
+                f"{s['cuts']} cuts, {s['pauses']} Retry-After pauses")
@@ -0,0 +1,167 @@
+"""
+Blocks the parts of a profile page the stats extraction never reads: images,
+fonts, media and third-party ads/analytics. Works for Playwright (page.route)
+and Selenium/Chrome (CDP Network.setBlockedURLs), and counts what was blocked.
+
+Blocked requests never download, so the bytes saved are estimated per
+resource type from ESTIMATED_BYTES.
+"""
+
+import json
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+DEFAULT_BLOCKED_TYPES = ("image", "font", "media")
+
+DEFAULT_BLOCKED_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "adservice.google.com", "facebook.net", "facebook.com", "hotjar.com",
+    "clarity.ms", "licdn.com", "ads-twitter.com", "tiktok.com", "bing.com", "criteo.com",
+    "taboola.com", "outbrain.com", "quantserve.com", "scorecardresearch.com",
+)
+
+# Chrome's CDP blocklist matches URLs, not resource types, so types are mapped to extensions
+TYPE_URL_PATTERNS = {
+    "image": ("*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*", "*.ico*", "*.avif*"),
+    "font": ("*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"),
+    "media": ("*.mp4*", "*.webm*", "*.mp3*", "*.m3u8*", "*.ogg*"),
+}
+
+# rough transfer size of a typical request of each type, used for "bytes saved"
+ESTIMATED_BYTES = {
+    "image": 60_000, "font": 40_000, "media": 500_000, "script": 50_000,
+    "stylesheet": 20_000, "xhr": 5_000, "fetch": 5_000, "other": 5_000,
+}
+
+
+class ResourcePolicy:
+    """
+    Allow/deny rules by resource type and domain. An allowed domain always
+    wins over a blocked type or domain, so first-party data requests can be
+    whitelisted explicitly. On Selenium the CDP blocklist cannot make
+    exceptions, so allowed domains turn off type blocking there (see
+    blocked_url_patterns()).
+    """
+
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_domains=DEFAULT_BLOCKED_DOMAINS,
+                 allowed_domains=(), allowed_types=("document", "xhr", "fetch")):
+        self.blocked_types = set(blocked_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.allowed_domains = tuple(allowed_domains)
+        self.allowed_types = set(allowed_types)
+        self.totals = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _matches(host, domains):
+        return any(host == d or host.endswith("." + d) for d in domains)
+
+    def should_block(self, resource_type, url):
+        host = urlparse(url).hostname or ""
+        if self._matches(host, self.allowed_domains):
+            return False
+        if self._matches(host, self.blocked_domains):
+            return True
+        if resource_type in self.allowed_types:
+            return False
+        return resource_type in self.blocked_types
+
+    def _record(self, page_stats, blocked, resource_type, size=0):
+        if blocked:
+            page_stats["blocked_requests"] += 1
+            page_stats["bytes_saved"] += ESTIMATED_BYTES.get(resource_type, ESTIMATED_BYTES["other"])
+        else:
+            page_stats["allowed_requests"] += 1
+            page_stats["bytes_loaded"] += size
+
+    def add_page(self, page_stats):
+        """Adds one page's counters to the run totals."""
+        with self._lock:
+            self.totals.update(page_stats)
+            self.totals["pages"] += 1
+
+    def summary(self):
+        t = self.totals
+        return (f"{t['pages']} pages, blocked {t['blocked_requests']} of "
+                f"{t['blocked_requests'] + t['allowed_requests']} requests, "
+                f"~{t['bytes_saved'] / 1e6:.1f} MB saved (estimated)")
+
+    # --- Playwright ---
+
+    async def apply_playwright(self, page):
+        """
+        Routes every request of `page` through the policy. Returns the page's
+        Counter, which fills up as the page loads.
+        """
+        page_stats = Counter()
+
+        async def handle(route):
+            request = route.request
+            blocked = self.should_block(request.resource_type, request.url)
+            self._record(page_stats, blocked, request.resource_type)
+            if blocked:
+                await route.abort()
+            else:
+                # fallback() rather than continue_(): lets context-level routes (e.g. a replay archive) see it
+                await route.fallback()
+
+        await page.route("**/*", handle)
+        return page_stats
+
+    # --- Selenium / Chrome DevTools ---
+
+    def blocked_url_patterns(self):
+        """
+        URL patterns for CDP Network.setBlockedURLs. That blocklist has no
+        exceptions, so nothing that could match an allowed domain is listed:
+        blocked domains overlapping an allowed one are left out, and with any
+        allowed domain the type patterns ("*.png*", ...) are too, since they
+        match every host.
+        """
+        domains = [d for d in self.blocked_domains
+                   if not self._matches(d, self.allowed_domains)
+                   and not any(self._matches(a, (d,)) for a in self.allowed_domains)]
+        patterns = [f"*://*.{d}/*" for d in domains] + [f"*://{d}/*" for d in domains]
+        if not self.allowed_domains:
+            for resource_type in self.blocked_types:
+                patterns.extend(TYPE_URL_PATTERNS.get(resource_type, ()))
+        return patterns
+
+    @staticmethod
+    def enable_chrome_logging(options):
+        """Turns on the performance log that collect_selenium() reads. Call before creating the driver."""
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        return options
+
+    def apply_selenium(self, driver):
+        """Installs the blocklist on a Chrome WebDriver through CDP."""
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.blocked_url_patterns()})
+        return driver
+
+    def collect_selenium(self, driver):
+        """
+        Reads the CDP network events logged since the last call and returns the
+        counters for that page (also added to the run totals). Needs
+        enable_chrome_logging() on the driver's options; returns empty
+        counters otherwise.
+        """
+        page_stats = Counter()
+        try:
+            entries = driver.get_log("performance")
+        except Exception:
+            return page_stats
+
+        types = {}
+        for entry in entries:
+            message = json.loads(entry["message"])["message"]
+            method, params = message.get("method"), message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                types[params["requestId"]] = params.get("type", "Other").lower()
+            elif method == "Network.loadingFailed" and params.get("blockedReason"):
+                self._record(page_stats, True, types.get(params["requestId"], "other"))
+            elif method == "Network.loadingFinished":
+                self._record(page_stats, False, None, params.get("encodedDataLength", 0))
+        self.add_page(page_stats)
+        return page_stats
@@ -0,0 +1,373 @@
+"""
+Retrying failed fetches: backoff rules per error class, a circuit breaker
+shared by the whole crawl, and a dead-letter queue for what still fails.
+
+classify() sorts an exception (or an HTTP status) into an error class:
+
+    throttled   429 / 403             retried after a long backoff or Retry-After
+    server      5xx                   retried
+    timeout     request / page / wait timeouts
+    network     connection errors, net::ERR_*
+    browser     the WebDriver itself failed   not retried here: DriverPool
+                                              restarts the browser instead
+    not_found   404 / 410             not retried
+    client      other 4xx             not retried
+    parse       ValueError, KeyError, ...     not retried (same page, same result)
+    other       anything else         retried once
+
+RetryPolicy.call() runs a function and retries it per those rules, with
+jittered exponential backoff (half the capped delay fixed, half random, so
+workers that failed together do not come back together). Every outcome is
+reported to a CircuitBreaker: when most recent calls fail with site-side
+errors, it opens and every caller waits (the whole crawl pauses) until a
+probe call succeeds. Exceptions that get through carry `error_class` and
+`attempts` attributes, ready for DeadLetterQueue.add().
+
+    RETRY = RetryPolicy(max_attempts=3, breaker=CircuitBreaker())
+    data = RETRY.call(fetch, url, label=url)
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from metrics import METRICS
+
+THROTTLED, SERVER, TIMEOUT, NETWORK, BROWSER = "throttled", "server", "timeout", "network", "browser"
+NOT_FOUND, CLIENT, PARSE, OTHER = "not_found", "client", "parse", "other"
+
+TIMEOUT_ERRORS = {"TimeoutException", "TimeoutError", "Timeout", "ReadTimeout", "ConnectTimeout"}
+NETWORK_ERRORS = {"ConnectionError", "ChunkedEncodingError", "ProtocolError", "RemoteDisconnected",
+                  "IncompleteRead", "SSLError"}
+PARSE_ERRORS = (ValueError, KeyError, IndexError, TypeError, AttributeError)
+
+
+class HTTPStatusError(Exception):
+    """A response with an unusable status, raised so that the retry policy can act on it."""
+
+    def __init__(self, status, url=None, retry_after=None):
+        super().__init__(f"HTTP {status}" + (f" for {url}" if url else ""))
+        self.status = status
+        self.url = url
+        self.retry_after = retry_after
+
+
+def classify_status(status):
+    if status in (429, 403):
+        return THROTTLED
+    if status in (404, 410):
+        return NOT_FOUND
+    if status >= 500:
+        return SERVER
+    return CLIENT
+
+
+def classify(error):
+    """Error class of an exception (see the module docstring)."""
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and status >= 400:
+        return classify_status(status)
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & TIMEOUT_ERRORS:
+        return TIMEOUT
+    if names & NETWORK_ERRORS or "net::ERR_" in str(error):
+        return NETWORK
+    if "WebDriverException" in names:
+        return BROWSER
+    if isinstance(error, PARSE_ERRORS):
+        return PARSE
+    return OTHER
+
+
+class RetryRule:
+    """
+    How one error class is handled. Unset values fall back to the policy's.
+    `trips_breaker` says whether the error counts against the site (circuit breaker).
+    """
+
+    def __init__(self, retry=True, max_attempts=None, base_delay=None, max_delay=None, trips_breaker=True):
+        self.retry = retry
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.trips_breaker = trips_breaker
+
+
+DEFAULT_RULES = {
+    THROTTLED: RetryRule(base_delay=5.0, max_delay=120.0),
+    SERVER: RetryRule(),
+    TIMEOUT: RetryRule(),
+    NETWORK: RetryRule(),
+    BROWSER: RetryRule(retry=False, trips_breaker=False),
+    NOT_FOUND: RetryRule(retry=False, trips_breaker=False),
+    CLIENT: RetryRule(retry=False, trips_breaker=False),
+    PARSE: RetryRule(retry=False, trips_breaker=False),
+    OTHER: RetryRule(max_attempts=2, trips_breaker=False),
+}
+
+
+class CircuitBreaker:
+    """
+    Pauses every caller while the site is failing broadly.
+
+    Closed: calls go through; the last `window` outcomes are kept. When at
+    least `min_calls` of them are known and `failure_ratio` of them failed,
+    the breaker opens for `cooldown` seconds, during which wait() blocks.
+    Afterwards one probe call is let through (half-open): if it succeeds
+    the breaker closes, if it fails it opens again with the cooldown
+    doubled (up to `max_cooldown`). A probe that ends without a verdict on
+    the site (a 404, a parse or browser error) frees the slot for the next
+    caller to probe.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, window=20, failure_ratio=0.5, min_calls=10, cooldown=30.0, max_cooldown=600.0,
+                 name="site"):
+        self.window = window
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.name = name
+        self.state = self.CLOSED
+        self.opened = 0
+        self._outcomes = []
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _next_wait(self):
+        """Seconds the caller has to wait now (0 = go ahead), taking the probe slot if due."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self._open_until:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return 0.0
+            return max(0.5, self._open_until - now) if self.state == self.OPEN else 0.5
+
+    def wait(self):
+        """Blocks while the breaker is open (or another caller is probing)."""
+        delay = self._next_wait()
+        while delay:
+            time.sleep(delay)
+            delay = self._next_wait()
+
+    async def wait_async(self):
+        delay = self._next_wait()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self._next_wait()
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened += 1
+        self._open_until = now + self.cooldown
+        self._outcomes = []
+        print(f"⛔ Circuit breaker '{self.name}' open: pausing the crawl for {self.cooldown:.0f}s")
+        METRICS.count("breaker_opened", breaker=self.name)
+
+    def record(self, ok):
+        """
+        Reports one call outcome: True, False for site-side failures, or None
+        for errors that say nothing about the site. Every call let through by
+        wait() must report one, or a half-open breaker keeps waiting for its probe.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if ok is None:
+                if self.state == self.HALF_OPEN:
+                    self._probing = False
+                return
+            if self.state == self.HALF_OPEN and self._probing:
+                self._probing = False
+                if ok:
+                    self.state = self.CLOSED
+                    self.cooldown = self.base_cooldown
+                    print(f"✅ Circuit breaker '{self.name}' closed: the site is answering again")
+                else:
+                    self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    self._open(now)
+                return
+            if self.state != self.CLOSED:
+                return
+            self._outcomes.append(ok)
+            del self._outcomes[:-self.window]
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._open(now)
+
+
+class RetryPolicy:
+    """
+    Retries a call per error class (`rules`, defaulting to DEFAULT_RULES) with
+    jittered exponential backoff: attempt n waits between half and all of
+    min(max_delay, base_delay * 2 ** (n - 1)), or the server's Retry-After
+    if that is longer.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, rules=None, breaker=None,
+                 name="requests", seed=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.breaker = breaker
+        self.name = name
+        self._random = random.Random(seed)
+
+    def delay(self, attempt, rule, retry_after=None):
+        cap = min(rule.max_delay or self.max_delay, (rule.base_delay or self.base_delay) * 2 ** (attempt - 1))
+        delay = cap / 2 + self._random.uniform(0, cap / 2)
+        return max(delay, retry_after or 0.0)
+
+    def _failed(self, error, attempt, label):
+        """Bookkeeping for one failed attempt; returns the delay before the next one, or None to give up."""
+        error_class = classify(error)
+        rule = self.rules.get(error_class, self.rules[OTHER])
+        if self.breaker:
+            self.breaker.record(False if rule.trips_breaker else None)
+        METRICS.count("errors", source=self.name, error_class=error_class)
+        if not rule.retry or attempt >= (rule.max_attempts or self.max_attempts):
+            error.error_class = error_class
+            error.attempts = attempt
+            return None
+        delay = self.delay(attempt, rule, getattr(error, "retry_after", None))
+        METRICS.count("retries", source=self.name, error_class=error_class)
+        print(f"Retrying {label or 'call'} in {delay:.1f}s (attempt {attempt} failed, {error_class}: "
+              f"{str(error).splitlines()[0][:120] if str(error) else type(error).__name__})")
+        return delay
+
+    def _succeeded(self):
+        if self.breaker:
+            self.breaker.record(True)
+
+    def call(self, fn, *args, label=None, **kwargs):
+        """Returns fn(*args, **kwargs), retrying per the rules; re-raises the last error."""
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker:
+                self.breaker.wait()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(e, attempt, label)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # interrupted: no verdict, but a probe slot must not stay taken
+                if self.breaker:
+                    self.breaker.record(None)
+                raise
+            self._succeeded()
+            return result
+
+    async def call_async(self, fn, *args, label=None, **kwargs):
+        """call() for a coroutine function."""
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker:
+                await self.breaker.wait_async()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failed(e, attempt, label)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # cancelled: no verdict, but a probe slot must not stay taken
+                if self.breaker:
+                    self.breaker.record(None)
+                raise
+            self._succeeded()
+            return result
+
+
+DEAD_LETTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    key          TEXT PRIMARY KEY,
+    url          TEXT,
+    payload      TEXT,
+    error_class  TEXT NOT NULL,
+    error        TEXT,
+    attempts     INTEGER NOT NULL,
+    failures     INTEGER NOT NULL DEFAULT 1,
+    first_failed REAL NOT NULL,
+    last_failed  REAL NOT NULL
+);
+"""
+
+
+class DeadLetterQueue:
+    """
+    SQLite store of items that failed after all retries, keyed by `key`
+    (a URL or institution id), with the error that stopped them and any
+    `payload` needed to retry them (e.g. rank and name). A follow-up pass
+    re-drives entries() and calls resolve() for each one that succeeds;
+    successful rows of the original run are never touched.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(DEAD_LETTER_SCHEMA)
+
+    def add(self, key, error, url=None, payload=None):
+        """Records (or re-records) a failed item; `error` is an exception or a message."""
+        now = time.time()
+        error_class = getattr(error, "error_class", None) or (classify(error) if isinstance(error, Exception) else OTHER)
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO dead_letters (key, url, payload, error_class, error, attempts, first_failed, last_failed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    error_class = excluded.error_class, error = excluded.error,
+                    attempts = excluded.attempts, failures = failures + 1, last_failed = excluded.last_failed
+                """,
+                (str(key), url, json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+                 error_class, (str(error) or type(error).__name__)[:500], getattr(error, "attempts", 1), now, now))
+        METRICS.count("dead_letters", error_class=error_class)
+
+    def resolve(self, key):
+        """Removes an item that has now succeeded."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM dead_letters WHERE key = ?", (str(key),))
+
+    def entries(self):
+        """Dead letters in the order they first failed, as dicts (payload decoded)."""
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM dead_letters ORDER BY first_failed, key").fetchall()
+        return [dict(row, payload=json.loads(row["payload"]) if row["payload"] else None) for row in rows]
+
+    def counts(self):
+        """{error class: number of dead letters}."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT error_class, COUNT(*) FROM dead_letters GROUP BY error_class"))
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -1,23 +1,64 @@
-import pandas as pd
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
+import os
+import sys
 import time
-import re
+import pandas as pd
 from selenium_stealth import stealth
 
+import columnar
+from driver_pool import DriverPool
+from metrics import METRICS
+from page_wait import scroll_until_loaded
+from rate_limit import AdaptiveRateLimiter
+from resource_policy import ResourcePolicy
+from retry_policy import CircuitBreaker, DeadLetterQueue, RetryPolicy
+from sinks import open_sink, read_sink
+from static_extract import StaticFetcher, has_stats, parse_stats_wrapper_html
+from stats_extract import read_stats_wrapper, parse_stats_wrapper
+
+LIST_LOAD_DEADLINE = 300  # seconds allowed for the whole ranking list to load
+RESULTS_FILE = "university_data.csv"  # profiles are streamed here as they are scraped (.csv or .jsonl)
+METRICS_SNAPSHOT = "scraper_metrics.prom"  # stage timings and counters, rewritten during the run (.json for JSON)
+METRICS_EVENTS = "scraper_events.jsonl"    # one line per timed stage and URL
+MAX_ATTEMPTS = 3  # tries per profile for retryable errors (timeouts, network, throttling)
+DEAD_LETTERS = "scraper_dead_letters.sqlite3"  # profiles that failed every try; `--redrive` rescrapes them
+RESULTS_XLSX = 'university_data.xlsx'
+
+# backoff per error class; the breaker pauses every worker while most profile loads fail
+RETRY_POLICY = RetryPolicy(max_attempts=MAX_ATTEMPTS, base_delay=2.0, breaker=CircuitBreaker(name="site"),
+                           name="browser")
+
+COLUMNS = ['University Name', 'Total Students (Total)', 'Total Students (UG students)',
+           'Total Students (PG students)', 'International Students (Total)',
+           'International Students (UG students)', 'International Students (PG students)',
+           'Total Faculty Staff (Total)', 'Total Faculty Staff (Domestic staff)',
+           'Total Faculty Staff (Int\'l staff)', 'URL']
+
 
 class UniversityScraper:
     """
     The final and most robust version of the scraper, designed to handle iframes.
     """
 
-    def __init__(self):
+    def __init__(self, num_workers=4, pages_per_second=2.0, use_static=True, static_requests_per_second=5.0):
         self.BASE_URL = "https://www.topuniversities.com/world-university-rankings"
         self.driver = None
+        # profile pages are loaded by a pool of headless browsers sharing one rate limit,
+        # which starts at pages_per_second and adapts to how the site responds (see rate_limit.py)
+        self.num_workers = num_workers
+        self.pages_per_second = pages_per_second
+        # workers skip images, fonts, media and third-party trackers
+        self.resource_policy = ResourcePolicy()
+        # try a plain HTTP GET + lxml first; browsers only get the pages that need them
+        self.use_static = use_static
+        self.static_requests_per_second = static_requests_per_second
+        self.dead_letters = None
 
     def _setup_driver(self):
         print("➡️ Setting up stealth browser driver...")
@@ -26,11 +67,82 @@ class UniversityScraper:
         options.add_argument("start-maximized")
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
         options.add_experimental_option('useAutomationExtension', False)
-        self.driver = webdriver.Chrome(service=service, options=options)
+        with METRICS.stage("browser start"):
+            self.driver = webdriver.Chrome(service=service, options=options)
         stealth(self.driver, languages=["en-US", "en"], vendor="Google Inc.", platform="Win32",
                 webgl_vendor="Intel Inc.", renderer="Intel Iris OpenGL Engine", fix_hairline=True)
         print("✅ Stealth driver setup complete.")
 
+    def _create_worker_driver(self):
+        """Creates one headless, stealthy Chrome for the profile worker pool."""
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        options.add_experimental_option('useAutomationExtension', False)
+        ResourcePolicy.enable_chrome_logging(options)
+        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        stealth(driver, languages=["en-US", "en"], vendor="Google Inc.", platform="Win32",
+                webgl_vendor="Intel Inc.", renderer="Intel Iris OpenGL Engine", fix_hairline=True)
+        self.resource_policy.apply_selenium(driver)
+        return driver
+
+    def _extract_static(self, links):
+        """Extracts profiles from static HTML; returns one dict or None (needs a browser) per link."""
+        if not self.use_static:
+            return [None] * len(links)
+        print(f"⚡ Fetching {len(links)} profiles without a browser...")
+        fetcher = StaticFetcher(rate_limiter=AdaptiveRateLimiter(self.static_requests_per_second, name="static"))
+        try:
+            results = fetcher.extract_many(links, parse_stats_wrapper_html)
+        finally:
+            fetcher.close()
+        results = [data if has_stats(data) else None for data in results]
+        missing = sum(1 for data in results if data is None)
+        METRICS.count("pages", len(links) - missing, source="static")
+        print(f"✅ {len(links) - missing} profiles read from static HTML; {missing} need a browser.")
+        return results
+
+    def _profile_task(self, driver, url):
+        """Pool task: extracts one profile and records what the resource policy blocked."""
+        details = self._extract_page_details(url, driver)
+        self.resource_policy.collect_selenium(driver)
+        self.dead_letters.resolve(url)
+        METRICS.count("pages", source="browser")
+        return details
+
+    def _failed_profile(self, url, error):
+        """Pool on_error: the profile is kept as a row with only its URL and goes to the dead letters."""
+        self.dead_letters.add(url, error, url=url)
+        METRICS.count("failures", source="browser")
+        return {'URL': url}
+
+    def _scrape_with_browsers(self, links, sink):
+        """Scrapes `links` with the worker pool, writing every profile to `sink` as it completes."""
+        print(f"🚀 Scraping {len(links)} profiles with {self.num_workers} browsers "
+              f"(from {self.pages_per_second} pages/s, adapting to the site)...")
+        pool = DriverPool(self._create_worker_driver, self.num_workers,
+                          rate_limiter=AdaptiveRateLimiter(self.pages_per_second, name="browser"))
+        with pool:
+            for data in pool.imap(self._profile_task, links,
+                                  on_error=self._failed_profile,
+                                  label=lambda link: link.split('/')[-1]):
+                sink.write(data)
+
+    def _save(self, df, links):
+        """Writes the Excel file (and its typed copy) with the rows in the order of `links`."""
+        # static and browser results were written as they came; restore ranking order
+        position = {link: i for i, link in enumerate(links)}
+        df = df.sort_values('URL', key=lambda urls: urls.map(position), kind='stable')
+        df = df.reindex(columns=COLUMNS)
+        with METRICS.stage("save", url=RESULTS_XLSX):
+            df.to_excel(RESULTS_XLSX, index=False)
+            typed = columnar.write_parquet(df, columnar.parquet_path(RESULTS_XLSX))
+        print(f"🎉 SUCCESS! Data for {len(df)} universities saved to '{RESULTS_XLSX}' (typed copy: '{typed}')")
+        if len(self.dead_letters):
+            print(f"☠️ Dead letters: {self.dead_letters.counts()} in '{DEAD_LETTERS}' "
+                  f"(run with --redrive to retry them)")
+
     # --- COMPLETELY REWRITTEN FUNCTION ---
     def _handle_popups(self):
         """
@@ -69,93 +181,107 @@ class UniversityScraper:
 
     def _get_university_links(self):
         print(f"🌍 Navigating to the main rankings page...")
-        self.driver.get(self.BASE_URL)
-        self._handle_popups()
+        with METRICS.stage("navigate", url=self.BASE_URL):
+            self.driver.get(self.BASE_URL)
+        with METRICS.stage("popup", url=self.BASE_URL):
+            self._handle_popups()
 
         print("⏳ Waiting for the main university list to load...")
-        WebDriverWait(self.driver, 45).until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.ind-row")))
+        with METRICS.stage("wait", url=self.BASE_URL):
+            WebDriverWait(self.driver, 45).until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.ind-row")))
         print("✅ Main content loaded.")
 
-        last_height = self.driver.execute_script("return document.body.scrollHeight")
-        while True:
-            print("📜 Scrolling down to load all universities...")
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(4)
-            new_height = self.driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height: break
-            last_height = new_height
+        # returns as soon as new rows render, or when a scroll brings none for 4 seconds
+        with METRICS.stage("listing", url=self.BASE_URL):
+            scroll_until_loaded(self.driver, "a.uni-link", quiet=4, deadline=LIST_LOAD_DEADLINE)
 
         links = [elem.get_attribute('href') for elem in self.driver.find_elements(By.CSS_SELECTOR, "a.uni-link")]
         print(f"👍 Found {len(links)} university links.")
         return links
 
-    def _extract_page_details(self, url):
-        self.driver.get(url)
-        data = {'URL': url, 'University Name': self.driver.title.split('|')[0].strip()}
-        try:
-            stats_container = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.stats-wrapper")))
+    def _extract_page_details(self, url, driver=None):
+        driver = driver or self.driver
 
-            def get_stat_box(label_text):
+        def attempt():
+            with METRICS.stage("navigate", url=url):
+                driver.get(url)
+            with METRICS.stage("extract", url=url):
+                data = {'URL': url, 'University Name': driver.title.split('|')[0].strip()}
                 try:
-                    return stats_container.find_element(By.XPATH,
-                                                        f".//div[contains(@class, '_label') and contains(text(), '{label_text}')]/ancestor::div[contains(@class, '_stat-box')]")
-                except:
-                    return None
+                    # one execute_script round trip for the whole stats block
+                    parse_stats_wrapper(read_stats_wrapper(driver), data)
+                except TimeoutException:
+                    METRICS.count("missing_stats", source="browser")  # no stats block on this profile
+            return data
 
-            def process_box(box, data_prefix):
-                if not box: return
-                try:
-                    data[f'{data_prefix} (Total)'] = re.sub(r'[^\d]', '',
-                                                            box.find_element(By.CSS_SELECTOR, "div._value").text)
-                except:
-                    pass
-                try:
-                    for ratio in box.find_elements(By.CSS_SELECTOR, "div._ratio-box"):
-                        name, value = ratio.find_element(By.CSS_SELECTOR, "div._name").text, ratio.find_element(
-                            By.CSS_SELECTOR, "div._value").text
-                        data[f'{data_prefix} ({name})'] = value
-                except:
-                    pass
-
-            process_box(get_stat_box('Total students'), 'Total Students')
-            process_box(get_stat_box('International students'), 'International Students')
-            process_box(get_stat_box('Total faculty staff'), 'Total Faculty Staff')
-        except:
-            pass
-        return data
+        return RETRY_POLICY.call(attempt, label=url)
 
     def scrape(self):
+        METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
+        self.dead_letters = DeadLetterQueue(DEAD_LETTERS)
         try:
             self._setup_driver()
             links = self._get_university_links()
-            all_data = []
-            total_links = len(links)
-            for i, link in enumerate(links):
-                print(f"⚙️ Processing ({i + 1}/{total_links}): {link.split('/')[-1]}")
-                details = self._extract_page_details(link)
-                all_data.append(details)
+            static_data = self._extract_static(links)
+            browser_links = [link for link, data in zip(links, static_data) if data is None]
+
+            # every profile goes to the sink as soon as it is scraped
+            with open_sink(RESULTS_FILE, COLUMNS) as sink:
+                for link, data in zip(links, static_data):
+                    if data is not None:
+                        sink.write(data)
+                        self.dead_letters.resolve(link)
+
+                if browser_links:
+                    self._scrape_with_browsers(browser_links, sink)
+            print(f"📝 Streamed {sink.written} profiles to '{RESULTS_FILE}'")
+
+            print(f"🚫 Resource policy: {self.resource_policy.summary()}")
 
             print("\n" + "=" * 50)
             print("💾 Scraping complete. Saving data to Excel file...")
-            df = pd.DataFrame(all_data)
-            cols_order = ['University Name', 'Total Students (Total)', 'Total Students (UG students)',
-                          'Total Students (PG students)', 'International Students (Total)',
-                          'International Students (UG students)', 'International Students (PG students)',
-                          'Total Faculty Staff (Total)', 'Total Faculty Staff (Domestic staff)',
-                          'Total Faculty Staff (Int\'l staff)', 'URL']
-            df = df.reindex(columns=cols_order)
-            filename = 'university_data.xlsx'
-            df.to_excel(filename, index=False)
-            print(f"🎉 SUCCESS! Data for {len(all_data)} universities saved to '{filename}'")
+            self._save(read_sink(RESULTS_FILE), links)
+            print(f"⏱️ Time by stage:\n{METRICS.summary()}")
         except Exception as e:
             print(f"\n❌ ERROR: An unexpected error occurred.\nDetails: {e}")
         finally:
             if self.driver:
                 self.driver.quit()
                 print("🔒 Browser closed.")
+            self.dead_letters.close()
+            METRICS.close()
+            print(f"📈 Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
+
+    def redrive(self):
+        """
+        Scrapes only the profiles left in the dead letters by earlier runs and
+        rebuilds the Excel file, where each fresh row replaces the URL-only row
+        of the failed attempt.
+        """
+        METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
+        self.dead_letters = DeadLetterQueue(DEAD_LETTERS)
+        try:
+            links = [entry['url'] for entry in self.dead_letters.entries()]
+            print(f"🔁 Re-driving {len(links)} dead letters from '{DEAD_LETTERS}'...")
+            if links:
+                with open_sink(RESULTS_FILE, COLUMNS, append=True) as sink:
+                    self._scrape_with_browsers(links, sink)
+
+            df = read_sink(RESULTS_FILE).drop_duplicates('URL', keep='last')
+            # the previous Excel file is in ranking order; without it, keep the order rows were first written in
+            order = pd.read_excel(RESULTS_XLSX)['URL'] if os.path.exists(RESULTS_XLSX) else df['URL']
+            self._save(df, list(order))
+        except Exception as e:
+            print(f"\n❌ ERROR: An unexpected error occurred.\nDetails: {e}")
+        finally:
+            self.dead_letters.close()
+            METRICS.close()
+            print(f"📈 Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
 
 
 if __name__ == "__main__":
     scraper = UniversityScraper()
-    scraper.scrape()
\ No newline at end of file
+    if "--redrive" in sys.argv[1:]:
+        scraper.redrive()
+    else:
+        scraper.scrape()
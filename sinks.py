@@ -0,0 +1,121 @@
+"""
+Streaming result sinks.
+
+Scrapers hand every record to a sink as soon as it is scraped instead of
+keeping a list of all records until the end. The sink keeps one file handle
+open for the whole run and writes in batches of `batch_size` records, so a
+crash loses at most one batch.
+
+fsync policy:
+    "never" - leave it to the OS (fastest)
+    "batch" - fsync after every batch (safest)
+    "close" - fsync once when the sink is closed
+"""
+
+import csv
+import json
+import os
+import threading
+
+FSYNC_POLICIES = ("never", "batch", "close")
+
+
+class ResultSink:
+    """Base class: buffering, flushing and fsync; subclasses format the records."""
+
+    def __init__(self, path, columns, batch_size=50, fsync="batch", append=False):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.path = path
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.written = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        is_new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self._start(is_new)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self, is_new):
+        pass
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def write(self, record):
+        """Queues one record (a dict); writes the batch once it is full. Thread-safe."""
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def _flush_locked(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self.written += len(self._buffer)
+            self._buffer = []
+        self._file.flush()
+        if self.fsync == "batch":
+            os.fsync(self._file.fileno())
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_locked()
+            if self.fsync == "close":
+                os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class CsvSink(ResultSink):
+    """CSV with a fixed header; keys missing from a record are left blank, extra keys are dropped."""
+
+    def _start(self, is_new):
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore")
+        if is_new:
+            self._writer.writeheader()
+
+    def _write_batch(self, records):
+        self._writer.writerows(records)
+
+
+class JsonlSink(ResultSink):
+    """One JSON object per line, keys in `columns` order."""
+
+    def _write_batch(self, records):
+        self._file.writelines(
+            json.dumps({col: record.get(col) for col in self.columns}, ensure_ascii=False) + "\n"
+            for record in records)
+
+
+def open_sink(path, columns, **kwargs):
+    """Picks the sink from the file extension (.csv or .jsonl)."""
+    if path.endswith(".jsonl"):
+        return JsonlSink(path, columns, **kwargs)
+    if path.endswith(".csv"):
+        return CsvSink(path, columns, **kwargs)
+    raise ValueError(f"Unsupported sink file type: {path}")
+
+
+def read_sink(path):
+    """Loads a finished sink file back into a DataFrame, keeping every value as text."""
+    import pandas as pd
+    if path.endswith(".jsonl"):
+        return pd.read_json(path, lines=True, dtype=False)
+    return pd.read_csv(path, dtype=str)
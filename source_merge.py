@@ -0,0 +1,205 @@
+"""
+Priority merge of several scraped sources into the rankings table, with provenance.
+
+Each Source says where a file is (a path or glob), how its columns map onto
+the main table's fields, and how much it is trusted (higher priority wins).
+SourceMerger matches every source against the main table's names once
+(name_match.NameIndex, built a single time), which turns each source into an
+array aligned with the main rows -- one join per source. Every field is then
+resolved in one vectorized pass: for each row the first non-blank value in
+priority order is taken, with the main table's own value first unless
+keep_existing=False.
+
+Next to the merged table it returns the provenance: for every resolved
+cell, the label of the source that supplied it ("main" for values that were
+already there), so any figure in the output can be traced back.
+
+    merger = SourceMerger(df_main, fields=["staff", "Column1", "Column2", "Column3"])
+    merged, provenance, report = merger.merge(sources)
+"""
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import excel_cache
+import name_match
+import normalize
+
+MAIN_LABEL = "main"
+
+# parse a field's source strings according to its kind (see columnar.column_kind)
+PARSERS = {
+    "count": lambda values: normalize.counts(values).astype("float64"),
+    "percent": normalize.percents,
+    "score": normalize.numbers,
+}
+
+
+def parse_field(field, values):
+    return PARSERS.get(columnar.column_kind(field), normalize.text)(values)
+
+
+class Source:
+    """
+    One input of the merge. `columns` maps the file's column names to the main
+    table's fields (and its name column to "Name"); columns not in the map are
+    ignored. `path` may be a glob, in which case all matching files are read as
+    one source. `key_column` names a profile URL / nid column used as an exact key.
+    """
+
+    def __init__(self, path, columns, priority=0, label=None, key_column=None, read_options=None):
+        self.path = path
+        self.columns = dict(columns)
+        self.priority = priority
+        self.label = label or os.path.basename(path)
+        self.key_column = key_column
+        self.read_options = read_options or {}
+
+    def paths(self):
+        return sorted(glob.glob(self.path)) if glob.has_magic(self.path) else [self.path]
+
+    def _read(self, path):
+        if path.endswith(".csv"):
+            return pd.read_csv(path, dtype=str, **self.read_options)
+        return excel_cache.read_excel_cached(path, **self.read_options)
+
+    def load(self, fields):
+        """
+        Reads the file(s) and returns a frame with 'Name', an optional '_key'
+        and the mapped fields, parsed to numbers where the field is numeric.
+        Returns None when no file exists.
+        """
+        frames = [self._read(p) for p in self.paths() if os.path.exists(p)]
+        if not frames:
+            return None
+        df = normalize.normalize_columns(pd.concat(frames, ignore_index=True))
+        columns = {normalize.label(k): v for k, v in self.columns.items()}
+        out = pd.DataFrame({"Name": normalize.text(df[next(k for k, v in columns.items()
+                                                          if v == "Name" and k in df.columns)])})
+        if self.key_column and self.key_column in df.columns:
+            out["_key"] = df[self.key_column]
+        for original, field in columns.items():
+            if field in fields and original in df.columns and field not in out.columns:
+                out[field] = parse_field(field, df[original])
+        return out
+
+
+class SourceMerger:
+    """Resolves `fields` of df_main from any number of Sources in priority order."""
+
+    def __init__(self, df_main, fields, fuzzy=True, threshold=0.75, key_column=None):
+        self.df_main = df_main
+        self.fields = list(fields)
+        self.fuzzy = fuzzy
+        self.threshold = threshold
+        self.names = normalize.text(df_main["Name"]).fillna("")
+        keys = df_main[key_column] if key_column and key_column in df_main.columns else None
+        self.index = name_match.NameIndex(self.names, keys=keys) if fuzzy else None
+        # exact lookup: first main row per name
+        positions = pd.Series(np.arange(len(df_main)), index=self.names.to_numpy())
+        self._positions = positions[~positions.index.duplicated()]
+
+    def _match(self, loaded):
+        if self.fuzzy:
+            keys = loaded["_key"] if "_key" in loaded.columns else None
+            return name_match.match_report(self.index, loaded["Name"], keys=keys, threshold=self.threshold)
+        matched = self._positions.reindex(loaded["Name"].fillna("").to_numpy())
+        found = matched.notna().to_numpy()
+        return pd.DataFrame({
+            "source_name": loaded["Name"].to_numpy(),
+            "matched_name": np.where(found, loaded["Name"].to_numpy(), None),
+            "matched_index": matched.astype("Int64").to_numpy(),
+            "score": found.astype(float),
+            "method": np.where(found, "exact", "none"),
+            "accepted": found,
+        })
+
+    def align(self, source):
+        """
+        Joins one source onto the main rows. Returns (frame with one row per
+        main row and the source's values in `fields`, match report), or
+        (None, None) if the source has no file. When several source rows match
+        the same main row, the best-scoring one is used.
+        """
+        loaded = source.load(self.fields)
+        if loaded is None:
+            return None, None
+        report = self._match(loaded)
+        accepted = report["accepted"].to_numpy(dtype=bool)
+        rows = report.loc[accepted, "matched_index"].to_numpy(dtype=np.int64)
+        values = loaded[accepted].reset_index(drop=True)
+        order = report.loc[accepted, "score"].to_numpy().argsort(kind="stable")[::-1]
+        rows, values = rows[order], values.iloc[order]
+        first = ~pd.Series(rows).duplicated().to_numpy()
+        rows, values = rows[first], values[first]
+
+        aligned = pd.DataFrame(index=pd.RangeIndex(len(self.df_main)))
+        for field in self.fields:
+            if field not in values.columns:
+                continue
+            column = pd.Series(None, index=aligned.index, dtype=values[field].dtype)
+            column.iloc[rows] = values[field].to_numpy()
+            aligned[field] = column
+        return aligned, report.assign(source=source.label)
+
+    def merge(self, sources, keep_existing=True):
+        """
+        Returns (merged copy of df_main, provenance frame with 'Name' and one
+        source label per field and row, combined match report). Sources without
+        a file are skipped.
+        """
+        candidates = []  # (label, aligned frame), best first
+        reports = []
+        for source in sorted(sources, key=lambda s: -s.priority):
+            aligned, report = self.align(source)
+            if aligned is None:
+                print(f"Skipping source '{source.label}': no file at '{source.path}'")
+                continue
+            candidates.append((source.label, aligned))
+            reports.append(report)
+            print(f"Source '{source.label}' (priority {source.priority}): "
+                  f"{int(report['accepted'].sum())}/{len(report)} rows matched")
+
+        existing = pd.DataFrame({field: parse_field(field, self.df_main[field]) for field in self.fields})
+        if keep_existing:
+            candidates.insert(0, (MAIN_LABEL, existing))
+        else:
+            candidates.append((MAIN_LABEL, existing))
+
+        labels = np.array([label for label, _ in candidates] + [None], dtype=object)
+        merged = self.df_main.copy()
+        provenance = pd.DataFrame({"Name": self.df_main["Name"]})
+        n = len(self.df_main)
+        rows = np.arange(n)
+        for field in self.fields:
+            # rows x candidates, best candidate first; blanks are None
+            values = np.column_stack([frame[field].astype(object).to_numpy() if field in frame.columns
+                                      else np.full(n, None, dtype=object) for _, frame in candidates])
+            valid = ~pd.isna(values)
+            values[~valid] = None
+            found = valid.any(axis=1)
+            # first valid candidate per row; rows with none point at the trailing None label
+            chosen = np.where(found, valid.argmax(axis=1), len(candidates))
+            picked = values[rows, np.minimum(chosen, len(candidates) - 1)]
+
+            conflicts = int((valid & (values != picked[:, None])).any(axis=1).sum())
+            if conflicts:
+                print(f"   {field}: {conflicts} rows where lower-priority sources disagree")
+            # cells resolved to the main table's own value are left exactly as they were
+            from_source = found & (labels[chosen] != MAIN_LABEL)
+            if from_source.any():
+                resolved = pd.Series(picked, index=self.df_main.index).infer_objects()
+                merged[field] = self.df_main[field].where(~from_source, resolved)
+            provenance[field] = labels[chosen]
+
+        report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+        return merged, provenance, report
+
+
+def supplied_counts(provenance, fields):
+    """Number of values each source supplied, per field (sources as rows)."""
+    return pd.DataFrame({field: provenance[field].value_counts() for field in fields}).fillna(0).astype(int)
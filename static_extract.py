@@ -0,0 +1,162 @@
+"""
+Browserless profile extraction: a plain HTTP GET plus lxml parsing.
+
+The XPath selectors below are compiled once at import, so each profile costs
+one request and a few microseconds of parsing instead of a browser page
+load. The parsers reproduce the output of the browser extractors:
+
+- parse_stats_wrapper_html() -> same dict as UniversityScraper._extract_page_details()
+- parse_stats_cards_html()   -> same dict as qs_scraper.extract_stats_from_profile()
+
+Both return None when the static HTML does not contain the stats (e.g. the
+block is rendered client-side); callers then fall back to a browser for
+just those pages.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from lxml import etree, html
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+from stats_extract import STAT_BOXES, STATS_CARD_FIELDS, parse_stats_wrapper, stats_card_field
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# --- compiled selector plan ---
+TITLE = etree.XPath("//title")
+STATS_WRAPPER = etree.XPath(f"//div[{_has_class('stats-wrapper')}]")
+LABELS = etree.XPath(".//div[contains(@class, '_label')]")
+OWN_TEXT = etree.XPath("text()")
+STAT_BOX = etree.XPath("ancestor::div[contains(@class, '_stat-box')][1]")
+VALUE = etree.XPath(f".//div[{_has_class('_value')}]")
+RATIO_BOXES = etree.XPath(f".//div[{_has_class('_ratio-box')}]")
+RATIO_NAME = etree.XPath(f".//div[{_has_class('_name')}]")
+STATS_CARDS = etree.XPath(f"//*[{_has_class('uni-stats-card')}]")
+CARD_TITLE = etree.XPath(f".//*[{_has_class('uni-stats-card__title')}]")
+CARD_NUMBER = etree.XPath(f".//*[{_has_class('uni-stats-card__number')}]")
+
+
+def _text(el):
+    """Whitespace-normalised text, close to what WebDriver's `.text` returns."""
+    return " ".join(el.text_content().split())
+
+
+def parse_stats_wrapper_html(page_html, url):
+    """Parses a `div.stats-wrapper` profile page; returns None if the block is missing."""
+    doc = html.fromstring(page_html)
+    wrappers = STATS_WRAPPER(doc)
+    if not wrappers:
+        return None
+
+    titles = TITLE(doc)
+    data = {'URL': url,
+            'University Name': _text(titles[0]).split('|')[0].strip() if titles else "Name Not Found"}
+
+    # build the same payload the execute_script() extractor returns
+    payload = {}
+    labels = LABELS(wrappers[0])
+    for label, _ in STAT_BOXES:
+        label_el = next((el for el in labels if label in "".join(OWN_TEXT(el))), None)
+        boxes = STAT_BOX(label_el) if label_el is not None else []
+        if not boxes:
+            continue
+        values = VALUE(boxes[0])
+        ratios = []
+        for ratio in RATIO_BOXES(boxes[0]):
+            names, ratio_values = RATIO_NAME(ratio), VALUE(ratio)
+            if names and ratio_values:
+                ratios.append([_text(names[0]), _text(ratio_values[0])])
+        payload[label] = {"value": _text(values[0]) if values else None, "ratios": ratios}
+
+    return parse_stats_wrapper(payload, data)
+
+
+def parse_stats_cards_html(page_html):
+    """Parses a `.uni-stats-card` profile page; returns None if there are no cards."""
+    doc = html.fromstring(page_html)
+    cards = STATS_CARDS(doc)
+    if not cards:
+        return None
+    desired = {field: "" for field in STATS_CARD_FIELDS}
+    for card in cards:
+        titles, numbers = CARD_TITLE(card), CARD_NUMBER(card)
+        if not titles or not numbers:
+            continue
+        field = stats_card_field(_text(titles[0]))
+        if field:
+            desired[field] = _text(numbers[0])
+    return desired
+
+
+class StaticFetcher:
+    """
+    Fetches profile pages over a pooled requests Session and runs a parser on
+    them, concurrently and under an optional shared rate limiter, which is
+    told about every response (an AdaptiveRateLimiter adjusts to them).
+    """
+
+    def __init__(self, max_workers=8, rate_limiter=None, timeout=20):
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+        })
+
+    def fetch(self, url):
+        """Returns the page HTML, or None on any HTTP or network error."""
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        try:
+            with METRICS.stage("static fetch", url=url):
+                response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            METRICS.count("requests", source="static", status="error")
+            if self.rate_limiter:
+                self.rate_limiter.observe(error=True)
+            return None
+        if self.rate_limiter:
+            self.rate_limiter.observe_response(response)
+        METRICS.count("requests", source="static", status=response.status_code)
+        METRICS.count("bytes", len(response.content), source="static")
+        return response.text if response.status_code == 200 else None
+
+    def extract(self, url, parse):
+        """Fetches `url` and returns parse(html, url), or None if it could not be fetched or parsed."""
+        page_html = self.fetch(url)
+        if not page_html:
+            return None
+        try:
+            with METRICS.stage("static parse", url=url):
+                return parse(page_html, url)
+        except (etree.ParserError, ValueError):
+            return None
+
+    def extract_many(self, urls, parse):
+        """
+        Runs extract() over `urls` concurrently. Returns results in the order
+        of `urls`, with None for every page that needs a browser.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda url: self.extract(url, parse), urls))
+
+    def close(self):
+        self.session.close()
+
+
+def has_stats(data):
+    """
+    True if an extracted dict holds at least one stat value. A page whose
+    static HTML only has empty placeholders still needs a browser.
+    """
+    return bool(data) and any(value for key, value in data.items() if key not in ('URL', 'University Name'))
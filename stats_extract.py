@@ -0,0 +1,100 @@
+"""
+Single-round-trip extraction of the `div.stats-wrapper` block on profile pages.
+
+Instead of one chromedriver call per XPath lookup, `_ratio-box`, `_name` and
+`_value`, the whole block is read by one execute_script() that returns plain
+JSON:
+
+    {"Total students": {"value": "11,632", "ratios": [["UG students", "4,361"], ...]}, ...}
+
+parse_stats_wrapper() turns that into the usual 'Total Students (UG students)'
+style keys, so every scraper keeps producing the same columns. The
+`.uni-stats-card` title mapping used by qs_scraper lives here as well, so the
+browserless path in static_extract.py shares it.
+"""
+
+import re
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+# (label shown on the page, column prefix in the output)
+STAT_BOXES = (
+    ("Total students", "Total Students"),
+    ("International students", "International Students"),
+    ("Total faculty staff", "Total Faculty Staff"),
+)
+
+STATS_WRAPPER_JS = """
+const labels = arguments[0];
+const wrapper = document.querySelector('div.stats-wrapper');
+if (!wrapper) return null;
+// same test as the old XPath contains(text(), ...): the element's own text nodes
+const ownText = el => Array.from(el.childNodes)
+    .filter(n => n.nodeType === Node.TEXT_NODE).map(n => n.textContent).join('');
+const labelEls = Array.from(wrapper.querySelectorAll('div[class*="_label"]'));
+const out = {};
+for (const label of labels) {
+    const labelEl = labelEls.find(el => ownText(el).includes(label));
+    const box = labelEl && labelEl.closest('div[class*="_stat-box"]');
+    if (!box) continue;
+    const value = box.querySelector('div._value');
+    const ratios = [];
+    for (const ratio of box.querySelectorAll('div._ratio-box')) {
+        const name = ratio.querySelector('div._name');
+        const val = ratio.querySelector('div._value');
+        if (name && val) ratios.push([name.innerText.trim(), val.innerText.trim()]);
+    }
+    out[label] = {value: value ? value.innerText.trim() : null, ratios: ratios};
+}
+return out;
+"""
+
+
+# fields of the `.uni-stats-card` layout read by qs_scraper, in output order
+STATS_CARD_FIELDS = (
+    "Total students", "UG students", "PG students",
+    "International students", "Total faculty staff", "Domestic staff",
+)
+
+
+def stats_card_field(title):
+    """Maps a `.uni-stats-card__title` text to one of STATS_CARD_FIELDS, or None."""
+    t = title.lower()
+    if "total students" in t:
+        return "Total students"
+    elif "ug students" in t or "undergraduate students" in t:
+        return "UG students"
+    elif "pg students" in t or "postgraduate students" in t:
+        return "PG students"
+    elif "international students" in t:
+        return "International students"
+    elif "total faculty staff" in t or "faculty staff" in t:
+        return "Total faculty staff"
+    elif "domestic staff" in t:
+        return "Domestic staff"
+    return None
+
+
+def read_stats_wrapper(driver, timeout=10):
+    """
+    Waits for `div.stats-wrapper` and returns its contents as a dict in one
+    execute_script() call. Raises TimeoutException if the block never appears.
+    """
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, "div.stats-wrapper")))
+    return driver.execute_script(STATS_WRAPPER_JS, [label for label, _ in STAT_BOXES]) or {}
+
+
+def parse_stats_wrapper(payload, data=None):
+    """Maps a read_stats_wrapper() payload onto 'Total Students (Total)'-style keys."""
+    data = {} if data is None else data
+    for label, prefix in STAT_BOXES:
+        box = payload.get(label)
+        if not box:
+            continue
+        if box.get("value") is not None:
+            data[f'{prefix} (Total)'] = re.sub(r'[^\d]', '', box["value"])
+        for name, value in box.get("ratios", []):
+            data[f'{prefix} ({name})'] = value
+    return data
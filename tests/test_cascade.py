@@ -0,0 +1,60 @@
+import api_scraper
+import cascade
+import delta
+from fixture_server import FixtureServer, load_institutions
+
+
+class StubBackend(cascade.Backend):
+    """Answers every institution with `data` and counts the calls."""
+
+    def __init__(self, name, data, prior_latency):
+        super().__init__()
+        self.name = name
+        self.data = data
+        self.prior_latency = prior_latency
+        self.calls = 0
+
+    def fetch(self, item):
+        self.calls += 1
+        return dict(self.data)
+
+    def conclusive(self, data):
+        return data is not None
+
+
+def items(fixture):
+    return [delta.listing_item(inst["nid"], inst["name"], inst["rank"],
+                               f"{fixture.base_url}/universities/{inst['slug']}")
+            for inst in fixture.institutions]
+
+
+def test_placeholder_profile_goes_on_to_the_browser():
+    institutions = load_institutions(1, path=None)
+    for field in ("total_students", "ug_students", "pg_students", "international_students", "ug_international",
+                  "pg_international", "faculty", "domestic_staff", "intl_staff"):
+        institutions[0][field] = ""
+    browser = StubBackend("browser", {column: "1,000" for column in cascade.REQUIRED_FIELDS}, 5.0)
+    with FixtureServer(institutions, layouts=("wrapper",)) as fixture:
+        static = cascade.StaticBackend(max_in_flight=1)
+        data = static.fetch(items(fixture)[0])
+        assert data is not None and not static.conclusive(data)
+        with cascade.Cascade([static, browser], explore_every=0) as pipeline:
+            record, complete = pipeline.resolve(items(fixture)[0])
+    assert complete and browser.calls == 1
+    assert record['Backend'] == "browser"
+
+
+def test_api_stays_first_when_a_field_is_unpublished(monkeypatch):
+    institutions = load_institutions(30, path=None)
+    for inst in institutions:
+        inst["faculty"] = ""  # served by the API as a blank value
+    static = StubBackend("static", {}, 0.5)
+    with FixtureServer(institutions) as fixture:
+        monkeypatch.setattr(api_scraper, "DETAIL_URL", fixture.base_url + "/api/institution/en/{}")
+        api = cascade.ApiBackend(max_in_flight=1)
+        with cascade.Cascade([api, static], explore_every=0) as pipeline:
+            for index, item in enumerate(items(fixture)):
+                record, complete = pipeline.resolve(item, index)
+                assert not complete and record['Backend'] == "api"
+            assert [backend.name for backend in pipeline.order()] == ["api", "static"]
+    assert api.resolved == len(institutions) and static.calls == 0
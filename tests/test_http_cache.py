@@ -0,0 +1,55 @@
+import json
+from datetime import timedelta
+
+import api_scraper
+from http_cache import HttpCache
+from rate_limit import AdaptiveRateLimiter
+
+
+class Response:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.elapsed = timedelta(milliseconds=40)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Session:
+    """Answers 200 with an ETag, then 304 to every request carrying it."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests += 1
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return Response(304, headers={"ETag": '"v1"'})
+        return Response(200, '{"stats": []}', {"ETag": '"v1"'})
+
+
+class RecordingLimiter(AdaptiveRateLimiter):
+    def __init__(self):
+        super().__init__(100, name="test")
+        self.observed = []
+
+    def observe(self, status=None, latency=None, retry_after=None, error=False):
+        self.observed.append(status)
+        super().observe(status, latency, retry_after, error)
+
+
+def test_revalidation_is_observed_but_fresh_hits_are_not(tmp_path, monkeypatch):
+    cache = HttpCache(str(tmp_path))
+    session = Session()
+    limiter = RecordingLimiter()
+
+    api_scraper.get_detailed_stats(1, session=session, cache=cache, limiter=limiter)   # downloaded
+    api_scraper.get_detailed_stats(1, session=session, cache=cache, limiter=limiter)   # fresh from disk
+    assert session.requests == 1 and limiter.observed == [200]
+
+    monkeypatch.setattr(api_scraper, "DETAIL_TTL", 0)
+    api_scraper.get_detailed_stats(1, session=session, cache=cache, limiter=limiter)   # 304
+    assert session.requests == 2 and limiter.observed == [200, 200]
+    assert cache.stats["revalidated"] == 1 and cache.stats["fresh"] == 1
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+
+import name_match
+
+# the committed ranking workbook: token weights depend on the whole index
+WORKBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "Copy of 2026_QS_World_University_Rankings_1.2_(For_qs.com)_(3)(1).xlsx")
+
+
+@pytest.fixture(scope="module")
+def names():
+    return pd.read_excel(WORKBOOK, header=0)["Name"].astype(str).str.strip().tolist()
+
+
+@pytest.fixture(scope="module")
+def index(names):
+    return name_match.NameIndex(names)
+
+
+def report_row(index, name):
+    return name_match.match_report(index, [name]).iloc[0]
+
+
+def test_abbreviation_matches_alias_before_fuzzy(index):
+    row = report_row(index, "Institut Teknologi Bandung (ITB)")
+    assert row.matched_name == "Bandung Institute of Technology (ITB)"
+    assert row.method == "alias"
+    assert row.accepted
+
+
+def test_conflicting_abbreviation_is_not_accepted(names):
+    index = name_match.NameIndex([n for n in names if not n.endswith("(ITB)")])
+    row = report_row(index, "Institut Teknologi Bandung (ITB)")
+    assert row.matched_name == "Institut Teknologi Nasional Bandung (ITENAS Bandung)"
+    assert row.confidence == "low"
+    assert not row.accepted
+
+
+@pytest.mark.parametrize("name", ["Universidad Europea", "University of Management and Technology"])
+def test_less_specific_name_is_not_accepted(index, name):
+    row = report_row(index, name)
+    assert row.method == "fuzzy"
+    assert row.confidence == "low"
+    assert not row.accepted
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Christian-Albrechts-University zu Kiel", "Christian-Albrechts-Universität zu Kiel"),
+    ("Université Côte d'Azur", "Université Côte d’Azur"),
+    ("Taipei Medical University (TMU)", "Taipei Medical University"),
+    ("Auezov South Kazakhstan University (SKU)", "Auezov South Kazakhstan State University (SKSU)"),
+    ("University of Salerno", "Universita' degli studi di Salerno"),
+])
+def test_spelling_variants_are_accepted(index, name, expected):
+    row = report_row(index, name)
+    assert row.matched_name == expected
+    assert row.accepted
+
+
+def test_same_abbreviation():
+    assert name_match.same_abbreviation("sku", "sksu")
+    assert not name_match.same_abbreviation("itb", "itenas bandung")
+    assert not name_match.same_abbreviation("itb", "its")
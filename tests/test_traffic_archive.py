@@ -0,0 +1,17 @@
+import traffic_archive
+
+
+def test_replay_speed_is_parsed_before_the_script():
+    opts = traffic_archive.build_parser().parse_args(
+        ["replay", "--speed", "1", "qs_traffic.sqlite", "api_scraper.py", "--limit", "5"])
+    assert opts.speed == 1.0
+    assert opts.archive == "qs_traffic.sqlite"
+    assert opts.script == "api_scraper.py"
+    assert opts.args == ["--limit", "5"]
+
+
+def test_options_after_the_script_belong_to_the_script():
+    opts = traffic_archive.build_parser().parse_args(
+        ["replay", "qs_traffic.sqlite", "api_scraper.py", "--speed", "3"])
+    assert opts.speed == 0.0
+    assert opts.args == ["--speed", "3"]
@@ -0,0 +1,570 @@
+"""
+Record / replay of the scrapers' HTTP traffic.
+
+Recording writes every response a run receives (method, URL, status,
+headers, body and how long it took) into a compact SQLite archive: bodies
+are zlib-compressed and stored once per distinct content, so the same
+script or stylesheet fetched by every profile costs nothing extra. Replay
+serves those responses back without touching the network, either at full
+speed or with the recorded timing (`speed`=1.0, 2.0 for twice as fast, 0
+for no delay), which makes runs of extractor and pipeline changes
+repeatable against real page shapes.
+
+Three fetch paths are covered:
+
+    requests     every Session (requests.get, HttpCache, StaticFetcher, ...)
+                 goes through an adapter that records or replays
+    Selenium     recording reads the Chrome DevTools network events from the
+                 performance log and fetches bodies with Network.getResponseBody;
+                 replay goes through ReplayServer, a local HTTP server the
+                 browser is pointed at (WebDriver.get() is rewritten to it)
+    Playwright   every new context records its responses, or fulfils its
+                 requests from the archive through context.route(); requests
+                 made with context.request are covered as well
+
+Responses are matched by method and URL (query order ignored); a URL
+recorded several times replays its responses in recorded order. A URL
+missing from the archive fails like a network error.
+
+    python traffic_archive.py record qs_traffic.sqlite api_scraper.py
+    python traffic_archive.py replay --speed 1 qs_traffic.sqlite api_scraper.py
+
+Options of record / replay go before the archive; everything after the
+script is passed to the script.
+    python traffic_archive.py info qs_traffic.sqlite
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import runpy
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+ORIGIN = "https://www.topuniversities.com"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bodies (
+    sha        TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    data       BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id         INTEGER PRIMARY KEY,
+    source     TEXT NOT NULL,
+    method     TEXT NOT NULL,
+    url        TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    status     INTEGER NOT NULL,
+    headers    TEXT NOT NULL,
+    sha        TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    elapsed    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_key ON responses (key, id);
+"""
+
+# bodies are stored decoded, so these no longer describe them
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection", "keep-alive"}
+TEXT_TYPES = ("text/", "json", "javascript", "xml")
+
+
+def url_key(method, url):
+    """'GET https://host/path?b=2&a=1#x' -> 'GET https://host/path?a=1&b=2'."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {urlunsplit((parts.scheme, parts.netloc.lower(), parts.path or '/', query, ''))}"
+
+
+def clean_headers(headers):
+    return {name: value for name, value in dict(headers).items() if name.lower() not in DROPPED_HEADERS}
+
+
+class TrafficArchive:
+    """
+    SQLite archive of recorded responses. Safe to record into from several
+    threads; records are committed every `batch_size` responses and on close().
+    """
+
+    def __init__(self, path, batch_size=50, body_cache=256):
+        self.path = path
+        self.batch_size = batch_size
+        self.stats = Counter()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._opened = time.time()
+        self._index = None          # key -> [(id, status, headers, sha, elapsed)], loaded on first lookup
+        self._cursor = Counter()    # key -> responses already replayed
+        self._bodies = OrderedDict()
+        self._body_cache = body_cache
+
+    # --- recording ---
+
+    def record(self, source, method, url, status, headers, body, elapsed):
+        """Stores one response; `body` is the decoded content (bytes or str)."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        sha = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO bodies (sha, size, data) VALUES (?, ?, ?)",
+                               (sha, len(body), zlib.compress(body, 6)))
+            self._conn.execute(
+                "INSERT INTO responses (source, method, url, key, status, headers, sha, started_at, elapsed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, method.upper(), url, url_key(method, url), int(status),
+                 json.dumps(clean_headers(headers)), sha, time.time() - self._opened - elapsed, elapsed))
+            self.stats[f"recorded {source}"] += 1
+            self._uncommitted += 1
+            if self._uncommitted >= self.batch_size:
+                self._conn.commit()
+                self._uncommitted = 0
+
+    # --- replay ---
+
+    def _load_index(self):
+        index = defaultdict(list)
+        for row in self._conn.execute("SELECT key, id, status, headers, sha, elapsed FROM responses ORDER BY id"):
+            index[row[0]].append((row[1], row[2], json.loads(row[3]), row[4], row[5]))
+        return index
+
+    def _body(self, sha):
+        body = self._bodies.get(sha)
+        if body is None:
+            (data,) = self._conn.execute("SELECT data FROM bodies WHERE sha = ?", (sha,)).fetchone()
+            body = zlib.decompress(data)
+            self._bodies[sha] = body
+            if len(self._bodies) > self._body_cache:
+                self._bodies.popitem(last=False)
+        else:
+            self._bodies.move_to_end(sha)
+        return body
+
+    def lookup(self, method, url):
+        """
+        Next recorded response for this method and URL as a dict (status,
+        headers, body, elapsed), or None if it was never recorded. Once a
+        URL's recordings are used up, the last one keeps being served.
+        """
+        key = url_key(method, url)
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            entries = self._index.get(key)
+            if not entries:
+                self.stats["misses"] += 1
+                return None
+            _, status, headers, sha, elapsed = entries[min(self._cursor[key], len(entries) - 1)]
+            self._cursor[key] += 1
+            self.stats["hits"] += 1
+            return {"status": status, "headers": headers, "body": self._body(sha), "elapsed": elapsed}
+
+    def summary(self):
+        with self._lock:
+            responses, urls, stored = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT key), COUNT(DISTINCT sha) FROM responses").fetchone()
+            raw, packed = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM bodies").fetchone()
+        counts = ", ".join(f"{k}: {v}" for k, v in sorted(self.stats.items()))
+        return (f"{responses} responses for {urls} URLs, {stored} distinct bodies, "
+                f"{raw / 1e6:.1f} MB -> {packed / 1e6:.1f} MB stored" + (f" ({counts})" if counts else ""))
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def _delay(entry, speed):
+    return entry["elapsed"] / speed if speed else 0.0
+
+
+# --- requests ---
+
+class _RecordingAdapter:
+    def __init__(self, archive, inner):
+        self.archive = archive
+        self.inner = inner
+
+    def send(self, request, **kwargs):
+        response = self.inner.send(request, **kwargs)
+        self.archive.record("requests", request.method, request.url, response.status_code,
+                            response.headers, response.content, response.elapsed.total_seconds())
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+class _ReplayAdapter:
+    def __init__(self, archive, speed):
+        self.archive = archive
+        self.speed = speed
+
+    def send(self, request, **kwargs):
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        entry = self.archive.lookup(request.method, request.url)
+        if entry is None:
+            raise requests.ConnectionError(f"not in the replay archive: {request.method} {request.url}",
+                                           request=request)
+        time.sleep(_delay(entry, self.speed))
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"]
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = "Replayed"
+        response.elapsed = timedelta(seconds=entry["elapsed"])
+        return response
+
+    def close(self):
+        pass
+
+
+def patch_requests(archive, mode, speed=0.0):
+    """Routes every requests Session through the archive. Returns a function that undoes it."""
+    import requests
+
+    original = requests.Session.get_adapter
+
+    def get_adapter(session, url):
+        if mode == "replay":
+            return _ReplayAdapter(archive, speed)
+        return _RecordingAdapter(archive, original(session, url))
+
+    requests.Session.get_adapter = get_adapter
+    return lambda: setattr(requests.Session, "get_adapter", original)
+
+
+# --- Selenium / Chrome DevTools ---
+
+def record_cdp_entries(archive, driver, entries):
+    """Records the finished responses among performance-log `entries`, fetching bodies over CDP."""
+    sent, received = {}, {}
+    for entry in entries:
+        message = json.loads(entry["message"])["message"]
+        method, params = message.get("method"), message.get("params", {})
+        if method == "Network.requestWillBeSent":
+            sent[params["requestId"]] = (params["request"]["method"], params.get("timestamp", 0))
+        elif method == "Network.responseReceived":
+            received[params["requestId"]] = params["response"]
+        elif method == "Network.loadingFinished" and params["requestId"] in received:
+            request_id = params["requestId"]
+            response = received.pop(request_id)
+            method_name, started = sent.get(request_id, ("GET", params.get("timestamp", 0)))
+            try:
+                result = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+            except Exception:
+                archive.stats["cdp bodies unavailable"] += 1
+                continue
+            body = base64.b64decode(result["body"]) if result.get("base64Encoded") else result["body"]
+            archive.record("cdp", method_name, response["url"], response["status"], response.get("headers", {}),
+                           body, max(0.0, params.get("timestamp", started) - started))
+
+
+def patch_selenium(archive, mode, server=None):
+    """
+    Record: every Chrome gets the performance log and Network domain enabled,
+    and its network events are recorded before each navigation, when it
+    quits and whenever someone reads the log (reads still return the events,
+    so ResourcePolicy.collect_selenium() keeps working).
+    Replay: WebDriver.get() is rewritten to `server` (a running ReplayServer).
+    Returns a function that undoes it.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+    from resource_policy import ResourcePolicy
+
+    undo = []
+
+    def patch(owner, name, value):
+        undo.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, value)
+
+    original_get = WebDriver.get
+    if mode == "replay":
+        patch(WebDriver, "get", lambda driver, url: original_get(driver, server.rewrite(url)))
+    else:
+        original_init, original_quit = webdriver.Chrome.__init__, WebDriver.quit
+        original_get_log = webdriver.Chrome.get_log
+        pending = defaultdict(list)  # driver id -> drained but not yet read entries
+
+        def drain(driver):
+            try:
+                entries = original_get_log(driver, "performance")
+            except Exception:
+                return
+            record_cdp_entries(archive, driver, entries)
+            pending[id(driver)].extend(entries)
+
+        def init(driver, *args, **kwargs):
+            if kwargs.get("options") is not None:
+                ResourcePolicy.enable_chrome_logging(kwargs["options"])
+            original_init(driver, *args, **kwargs)
+            driver.execute_cdp_cmd("Network.enable", {})
+
+        def get(driver, url):
+            drain(driver)  # bodies of the current page are only available until it is left
+            original_get(driver, url)
+
+        def quit(driver):
+            drain(driver)
+            pending.pop(id(driver), None)
+            original_quit(driver)
+
+        def get_log(driver, log_type):
+            if log_type != "performance":
+                return original_get_log(driver, log_type)
+            drain(driver)
+            return pending.pop(id(driver), [])
+
+        patch(webdriver.Chrome, "__init__", init)
+        patch(WebDriver, "get", get)
+        patch(WebDriver, "quit", quit)
+        patch(webdriver.Chrome, "get_log", get_log)
+
+    def restore():
+        for owner, name, original in reversed(undo):
+            setattr(owner, name, original)
+
+    return restore
+
+
+class ReplayServer:
+    """
+    Serves archived responses of `origin` over plain HTTP on localhost, for
+    browsers that cannot have their requests fulfilled in-process. Links to
+    `origin` in text bodies are rewritten to the server, so navigation and
+    XHRs stay local.
+    """
+
+    def __init__(self, archive, origin=ORIGIN, host="127.0.0.1", port=0, speed=0.0):
+        self.archive = archive
+        self.origin = origin.rstrip("/")
+        self.speed = speed
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rewrite(self, url):
+        return self.base_url + url[len(self.origin):] if url.startswith(self.origin) else url
+
+    def _rewrite_body(self, body, headers):
+        content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+        if not any(t in content_type for t in TEXT_TYPES):
+            return body
+        escaped = self.origin.replace("/", "\\/")
+        return (body.replace(self.origin.encode(), self.base_url.encode())
+                .replace(escaped.encode(), self.base_url.replace("/", "\\/").encode()))
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                entry = server.archive.lookup(self.command, server.origin + self.path)
+                if entry is None:
+                    status, headers, body = 404, {"Content-Type": "text/plain"}, b"not in the replay archive"
+                else:
+                    time.sleep(_delay(entry, server.speed))
+                    status, headers = entry["status"], entry["headers"]
+                    body = server._rewrite_body(entry["body"], headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_HEAD = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# --- Playwright ---
+
+class _ReplayedAPIResponse:
+    """The part of Playwright's APIResponse the scrapers use."""
+
+    def __init__(self, url, entry):
+        self.url = url
+        self.status = entry["status"] if entry else 404
+        self.ok = 200 <= self.status < 300
+        self.headers = entry["headers"] if entry else {}
+        self._body = entry["body"] if entry else b""
+
+    async def body(self):
+        return self._body
+
+    async def text(self):
+        return self._body.decode("utf-8", errors="replace")
+
+    async def json(self):
+        return json.loads(self._body)
+
+    async def dispose(self):
+        pass
+
+
+async def attach_playwright(archive, context, mode, speed=0.0):
+    """Records the responses of a BrowserContext (pages and context.request), or replays them."""
+    api = context.request
+    original_get = api.get
+
+    if mode == "replay":
+        async def handle(route):
+            request = route.request
+            entry = archive.lookup(request.method, request.url)
+            if entry is None:
+                await route.abort()
+                return
+            await asyncio.sleep(_delay(entry, speed))
+            await route.fulfill(status=entry["status"], headers=entry["headers"], body=entry["body"])
+
+        async def get(url, **kwargs):
+            entry = archive.lookup("GET", url)
+            if entry:
+                await asyncio.sleep(_delay(entry, speed))
+            return _ReplayedAPIResponse(url, entry)
+
+        await context.route("**/*", handle)
+    else:
+        started = {}
+
+        def on_request(request):
+            started[id(request)] = time.monotonic()
+
+        async def on_response(response):
+            request = response.request
+            elapsed = time.monotonic() - started.pop(id(request), time.monotonic())
+            try:
+                body = await response.body()
+            except Exception:  # redirects and aborted responses have no body
+                return
+            archive.record("playwright", request.method, response.url, response.status,
+                           await response.all_headers(), body, elapsed)
+
+        async def get(url, **kwargs):
+            t0 = time.monotonic()
+            response = await original_get(url, **kwargs)
+            archive.record("playwright", "GET", url, response.status, response.headers,
+                           await response.body(), time.monotonic() - t0)
+            return response
+
+        context.on("request", on_request)
+        context.on("response", on_response)
+    api.get = get
+    return context
+
+
+def patch_playwright(archive, mode, speed=0.0):
+    """Attaches the archive to every BrowserContext Playwright creates. Returns a function that undoes it."""
+    from playwright.async_api import Browser
+
+    original = Browser.new_context
+
+    async def new_context(browser, *args, **kwargs):
+        return await attach_playwright(archive, await original(browser, *args, **kwargs), mode, speed)
+
+    Browser.new_context = new_context
+    return lambda: setattr(Browser, "new_context", original)
+
+
+def install(archive, mode, speed=0.0, origin=ORIGIN):
+    """
+    Hooks every available fetch path (requests, Selenium, Playwright) into
+    the archive. Returns a function that undoes all of it.
+    """
+    undo = [patch_requests(archive, mode, speed)]
+    server = None
+    if mode == "replay":
+        server = ReplayServer(archive, origin, speed=speed).start()
+        undo.append(server.stop)
+    for patcher in (lambda: patch_selenium(archive, mode, server), lambda: patch_playwright(archive, mode, speed)):
+        try:
+            undo.append(patcher())
+        except ImportError:
+            pass
+
+    def uninstall():
+        for step in reversed(undo):
+            step()
+
+    return uninstall
+
+
+def run_script(archive_path, mode, script, args, speed=0.0):
+    """Runs a scraper script as __main__ with its traffic recorded into / replayed from the archive."""
+    archive = TrafficArchive(archive_path)
+    uninstall = install(archive, mode, speed)
+    sys.argv = [script] + list(args)
+    started = time.perf_counter()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        uninstall()
+        print(f"📼 {mode.capitalize()}ed {script} in {time.perf_counter() - started:.1f}s: {archive.summary()}")
+        archive.close()
+
+
+def build_parser():
+    """`record archive script [args...]`, `replay [--speed N] archive script [args...]`, `info archive`."""
+    parser = argparse.ArgumentParser(description="Record or replay the scrapers' HTTP traffic.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("record", "replay"):
+        command = commands.add_parser(name, usage=f"%(prog)s{' [--speed N]' if name == 'replay' else ''} "
+                                                  "archive script [args ...]")
+        # options are declared first: everything after the script belongs to the script
+        if name == "replay":
+            command.add_argument("--speed", type=float, default=0.0,
+                                 help="1 = recorded timing, 2 = twice as fast, 0 = no delay (default)")
+        command.add_argument("archive")
+        command.add_argument("script")
+        command.add_argument("args", nargs=argparse.REMAINDER)
+    commands.add_parser("info").add_argument("archive")
+    return parser
+
+
+if __name__ == "__main__":
+    opts = build_parser().parse_args()
+
+    if opts.command == "info":
+        archive = TrafficArchive(opts.archive)
+        print(archive.summary())
+        archive.close()
+    else:
+        run_script(opts.archive, opts.command, opts.script, opts.args, getattr(opts, "speed", 0.0))
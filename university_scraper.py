@@ -4,48 +4,66 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 import time
 import re  # Regular expressions for cleaning text
 
+import columnar
+from metrics import METRICS
+from page_wait import scroll_until_loaded
+from retry_policy import CircuitBreaker, RetryPolicy, classify
+
+MAX_ATTEMPTS = 3  # tries per profile for retryable errors (timeouts, network, throttling)
+METRICS_SNAPSHOT = "university_scraper_metrics.prom"  # stage timings and counters, rewritten during the run
+METRICS_EVENTS = "university_scraper_events.jsonl"    # one line per timed stage and URL
+
+# backoff per error class; the breaker pauses the loop while most profile loads fail
+RETRY_POLICY = RetryPolicy(max_attempts=MAX_ATTEMPTS, base_delay=2.0, breaker=CircuitBreaker(name="site"),
+                           name="browser")
+
 
 def get_university_data(driver, url):
     """
     Navigates to a single university page and extracts key data points.
-    Returns a dictionary with the extracted information.
+    Returns a dictionary with the extracted information. A page without a
+    stats container still gives one; any other error is raised.
     """
     print(f"  -> Scraping: {url}")
-    driver.get(url)
+    with METRICS.stage("navigate", url=url):
+        driver.get(url)
     data = {'URL': url}
 
-    try:
-        # Wait for the main stats container to be visible
-        stats_container = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div.stats-wrapper"))
-        )
-
-        # --- Helper function to extract stats ---
-        def extract_stat(label):
-            try:
-                # Find the div containing the label text, then get the value from the sibling div
-                # This XPath is more specific to avoid errors.
-                value_element = stats_container.find_element(
-                    By.XPATH,
-                    f".//div[contains(@class, '_label') and contains(text(), '{label}')]/following-sibling::div[contains(@class, '_value')]"
-                )
-                # Clean the text to get only numbers
-                value = re.sub(r'[^\d]', '', value_element.text)
-                return int(value) if value else 'Not Found'
-            except Exception:
-                return 'Not Found'
-
-        # Extracting data based on your image
-        data['Total Students'] = extract_stat('Total students')
-        data['International Students'] = extract_stat('International students')
-        data['Total Faculty Staff'] = extract_stat('Total faculty staff')
-
-    except Exception as e:
-        print(f"    - Could not load stats container for {url}.")
+    with METRICS.stage("extract", url=url):
+        try:
+            # Wait for the main stats container to be visible
+            stats_container = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.stats-wrapper"))
+            )
+
+            # --- Helper function to extract stats ---
+            def extract_stat(label):
+                try:
+                    # Find the div containing the label text, then get the value from the sibling div
+                    # This XPath is more specific to avoid errors.
+                    value_element = stats_container.find_element(
+                        By.XPATH,
+                        f".//div[contains(@class, '_label') and contains(text(), '{label}')]/following-sibling::div[contains(@class, '_value')]"
+                    )
+                    # Clean the text to get only numbers
+                    value = re.sub(r'[^\d]', '', value_element.text)
+                    return int(value) if value else 'Not Found'
+                except Exception:
+                    return 'Not Found'
+
+            # Extracting data based on your image
+            data['Total Students'] = extract_stat('Total students')
+            data['International Students'] = extract_stat('International students')
+            data['Total Faculty Staff'] = extract_stat('Total faculty staff')
+
+        except TimeoutException:
+            METRICS.count("missing_stats", source="browser")
+            print(f"    - Could not load stats container for {url}.")
 
     return data
 
@@ -55,26 +73,30 @@ if __name__ == "__main__":
     # Use the main URL, which redirects to the latest ranking
     BASE_URL = "https://www.topuniversities.com/world-university-rankings"
 
+    METRICS.configure(METRICS_SNAPSHOT, METRICS_EVENTS)
     print("Setting up the browser driver...")
     service = Service(ChromeDriverManager().install())
     options = webdriver.ChromeOptions()
     # options.add_argument('--headless') # Keep this commented out for testing to see the browser
     options.add_argument('--log-level=3')
-    driver = webdriver.Chrome(service=service, options=options)
+    with METRICS.stage("browser start"):
+        driver = webdriver.Chrome(service=service, options=options)
     driver.maximize_window()  # Maximize window to ensure all elements are visible
 
     print(f"Navigating to the main rankings page: {BASE_URL}")
-    driver.get(BASE_URL)
+    with METRICS.stage("navigate", url=BASE_URL):
+        driver.get(BASE_URL)
 
     # --- NEW & CRITICAL STEP: Handle the cookie consent banner ---
     try:
         print("Looking for the cookie consent banner...")
-        accept_button = WebDriverWait(driver, 15).until(
-            EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
-        )
-        print("Cookie banner found. Clicking 'Accept All Cookies'.")
-        accept_button.click()
-        time.sleep(2)  # Give a moment for the banner to disappear
+        with METRICS.stage("popup", url=BASE_URL):
+            accept_button = WebDriverWait(driver, 15).until(
+                EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
+            )
+            print("Cookie banner found. Clicking 'Accept All Cookies'.")
+            accept_button.click()
+            time.sleep(2)  # Give a moment for the banner to disappear
     except Exception as e:
         print("Cookie banner not found or could not be clicked, continuing anyway.")
 
@@ -84,20 +106,15 @@ if __name__ == "__main__":
 
     try:
         # Wait for the first university row to be loaded before we start scrolling
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div.ind-row"))
-        )
-
-        # Scroll down to load all universities on the page
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        while True:
-            print("  -> Scrolling to load more universities...")
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(4)  # Increased wait time for content to load properly
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
+        with METRICS.stage("wait", url=BASE_URL):
+            WebDriverWait(driver, 20).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.ind-row"))
+            )
+
+        # Scroll down to load all universities on the page; each step returns as soon
+        # as new rows render, and scrolling stops when one brings none for 4 seconds
+        with METRICS.stage("listing", url=BASE_URL):
+            scroll_until_loaded(driver, "a.uni-link", quiet=4, deadline=300)
 
         print("All universities loaded. Extracting links...")
         uni_elements = driver.find_elements(By.CSS_SELECTOR, "a.uni-link")
@@ -112,6 +129,7 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"An error occurred while trying to find university links: {e}")
         driver.quit()
+        METRICS.close()
         exit()
 
     # --- Step 2: Loop through each link and scrape data ---
@@ -120,12 +138,19 @@ if __name__ == "__main__":
 
     for i, link in enumerate(university_links):
         print(f"\nProcessing University {i + 1} of {total_universities}...")
-        uni_data = get_university_data(driver, link)
+        try:
+            uni_data = RETRY_POLICY.call(get_university_data, driver, link, label=link)
+            METRICS.count("pages", source="browser")
+        except Exception as e:
+            error_class = getattr(e, "error_class", None) or classify(e)
+            print(f"    - Failed after {getattr(e, 'attempts', 1)} attempts ({error_class}: {e})")
+            METRICS.count("failures", source="browser", error_class=error_class)
+            uni_data = {'URL': link}
 
         try:
             title = driver.title
             uni_data['University Name'] = title.split('|')[0].strip()
-        except:
+        except WebDriverException:
             uni_data['University Name'] = "Name Not Found"
 
         all_university_data.append(uni_data)
@@ -141,8 +166,13 @@ if __name__ == "__main__":
     df = df[existing_columns]
 
     output_filename = 'university_data.xlsx'
-    df.to_excel(output_filename, index=False)
+    with METRICS.stage("save", url=output_filename):
+        df.to_excel(output_filename, index=False)
+        columnar.write_parquet(df, columnar.parquet_path(output_filename))
 
     print(f"Data successfully saved to '{output_filename}'")
+    print(f"Time by stage:\n{METRICS.summary()}")
 
-    driver.quit()
\ No newline at end of file
+    driver.quit()
+    METRICS.close()
+    print(f"Metrics: '{METRICS_SNAPSHOT}', events: '{METRICS_EVENTS}'")
\ No newline at end of file
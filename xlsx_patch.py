@@ -0,0 +1,178 @@
+"""
+In-place cell patching for .xlsx workbooks.
+
+Writing a DataFrame back with to_excel() regenerates every cell and loses
+title rows, styles and other sheets. XlsxSheet instead edits the sheet XML
+inside the existing package: only the cells that are set are touched (the
+cell keeps its style), every other part of the file is copied through
+byte for byte, and no workbook object model is built, so the work done
+grows with the number of changed cells.
+
+    sheet = XlsxSheet("rankings.xlsx")
+    columns = sheet.header(3)              # {"Name": "A", "staff": "AF", ...}
+    sheet.set("AF4", 3011)
+    sheet.save()
+"""
+
+import os
+import posixpath
+import re
+import zipfile
+
+from lxml import etree
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS = {"m": MAIN_NS}
+REF_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+def _q(tag):
+    return f"{{{MAIN_NS}}}{tag}"
+
+
+def column_index(letters):
+    """'A' -> 1, 'AF' -> 32."""
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index
+
+
+def split_ref(ref):
+    """'AF12' -> ('AF', 12)."""
+    letters, row = REF_RE.match(ref).groups()
+    return letters, int(row)
+
+
+class XlsxSheet:
+    """One worksheet of an .xlsx file, opened for reading and patching individual cells."""
+
+    def __init__(self, path, sheet_index=0):
+        self.path = path
+        with zipfile.ZipFile(path) as z:
+            self.part = self._sheet_part(z, sheet_index)
+            self.tree = etree.fromstring(z.read(self.part), etree.XMLParser(huge_tree=True))
+            self._shared = self._shared_strings(z)
+        self.sheet_data = self.tree.find(_q("sheetData"))
+        self._rows = {int(row.get("r")): row for row in self.sheet_data.iterfind(_q("row"))}
+        self.changed = 0
+
+    @staticmethod
+    def _sheet_part(z, sheet_index):
+        workbook = etree.fromstring(z.read("xl/workbook.xml"))
+        sheet = workbook.findall("m:sheets/m:sheet", NS)[sheet_index]
+        rel_id = sheet.get(f"{{{REL_NS}}}id")
+        rels = etree.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+        target = next(r.get("Target") for r in rels.iterfind(f"{{{PKG_REL_NS}}}Relationship")
+                      if r.get("Id") == rel_id)
+        return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+
+    @staticmethod
+    def _shared_strings(z):
+        if "xl/sharedStrings.xml" not in z.namelist():
+            return []
+        root = etree.fromstring(z.read("xl/sharedStrings.xml"), etree.XMLParser(huge_tree=True))
+        return ["".join(si.itertext()) for si in root.iterfind(_q("si"))]
+
+    def _cell(self, ref, create=False):
+        letters, row_number = split_ref(ref)
+        row = self._rows.get(row_number)
+        if row is None:
+            if not create:
+                return None
+            row = etree.Element(_q("row"), r=str(row_number))
+            later = [n for n in self._rows if n > row_number]
+            if later:
+                self._rows[min(later)].addprevious(row)
+            else:
+                self.sheet_data.append(row)
+            self._rows[row_number] = row
+        target = column_index(letters)
+        for cell in row.iterfind(_q("c")):
+            letters_here = split_ref(cell.get("r"))[0]
+            if letters_here == letters:
+                return cell
+            if column_index(letters_here) > target:
+                if not create:
+                    return None
+                new = etree.Element(_q("c"), r=ref)
+                cell.addprevious(new)
+                return new
+        if not create:
+            return None
+        return etree.SubElement(row, _q("c"), r=ref)
+
+    def value(self, ref):
+        """Current value of a cell: str, int, float, or None if empty."""
+        cell = self._cell(ref)
+        if cell is None:
+            return None
+        kind = cell.get("t")
+        if kind == "inlineStr":
+            return "".join(cell.find(_q("is")).itertext())
+        v = cell.find(_q("v"))
+        if v is None or v.text is None:
+            return None
+        if kind == "s":
+            return self._shared[int(v.text)]
+        if kind in ("str", "e"):
+            return v.text
+        if kind == "b":
+            return v.text == "1"
+        number = float(v.text)
+        return int(number) if number.is_integer() and "." not in v.text and "E" not in v.text.upper() else number
+
+    def header(self, row_number):
+        """{header text: column letters} for a header row."""
+        row = self._rows.get(row_number)
+        if row is None:
+            return {}
+        columns = {}
+        for cell in row.iterfind(_q("c")):
+            ref = cell.get("r")
+            text = self.value(ref)
+            if text is not None:
+                columns.setdefault(str(text), split_ref(ref)[0])
+        return columns
+
+    def data_rows(self, header_row):
+        """
+        Numbers of the non-empty rows below `header_row`, in order: position i
+        of a DataFrame read with pd.read_excel(header=header_row - 1) is on
+        row data_rows(header_row)[i], since blank rows are skipped there too.
+        """
+        rows = []
+        for number in sorted(n for n in self._rows if n > header_row):
+            if any(self.value(cell.get("r")) not in (None, "") for cell in self._rows[number].iterfind(_q("c"))):
+                rows.append(number)
+        return rows
+
+    def set(self, ref, value):
+        """Writes a number or string into a cell, keeping the cell's style."""
+        cell = self._cell(ref, create=True)
+        for child in list(cell):
+            cell.remove(child)
+        cell.attrib.pop("t", None)
+        if value is None:
+            return
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if value != value:  # NaN leaves the cell empty
+                return
+            etree.SubElement(cell, _q("v")).text = repr(int(value) if float(value).is_integer() else float(value))
+        else:
+            cell.set("t", "inlineStr")
+            etree.SubElement(etree.SubElement(cell, _q("is")), _q("t")).text = str(value)
+        self.changed += 1
+
+    def save(self, out_path=None):
+        """Writes the package back (atomically); only the sheet part differs from the original."""
+        out_path = out_path or self.path
+        data = etree.tostring(self.tree, xml_declaration=True, encoding="UTF-8", standalone=True)
+        tmp = out_path + ".tmp"
+        with zipfile.ZipFile(self.path) as zin, zipfile.ZipFile(tmp, "w") as zout:
+            for item in zin.infolist():
+                zout.writestr(item, data if item.filename == self.part else zin.read(item.filename))
+        os.replace(tmp, out_path)
+        return out_path